@@ -13,4 +13,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once Django is set up
+from recipe import feed  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # the live feed's long lived connections are served next to Django,
+    # see recipe.feed, WebSockets all go there as Django can't serve them
+    if scope["type"] == "websocket" or (
+        scope["type"] == "http" and scope["path"] == feed.PATH
+    ):
+        await feed.application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
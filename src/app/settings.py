@@ -11,6 +11,9 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 import os
+import sys
+import tempfile
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,6 +53,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.middleware.MetricsMiddleware",
+    "core.middleware.ProfilingMiddleware",
+    "core.middleware.NPlusOneMiddleware",
+    "core.middleware.SlowQueryLogMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -60,6 +67,54 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "app.urls"
 
+# N+1 query detection (core.nplusone): a query template running more than
+# N_PLUS_ONE_THRESHOLD times in one request is reported with its stack and
+# the serializer field involved. "warn" in development, "raise" when
+# running the tests, "log" for a sample of requests in production, or "off".
+N_PLUS_ONE_MODE = os.environ.get(
+    "N_PLUS_ONE_MODE",
+    "raise" if "test" in sys.argv[1:2] else "warn" if DEBUG else "log",
+)
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 5))
+N_PLUS_ONE_SAMPLE_RATE = float(os.environ.get("N_PLUS_ONE_SAMPLE_RATE", 0.01))
+
+# Statements slower than SLOW_QUERY_THRESHOLD_MS are written to
+# SLOW_QUERY_LOG_FILE (JSON lines, rotated) with their parameters, view and
+# EXPLAIN QUERY PLAN, once per query shape and process. Repeats are counted
+# and summarized (count, p95, max) every SLOW_QUERY_SUMMARY_INTERVAL seconds.
+# "manage.py slow_queries" aggregates the files.
+SLOW_QUERY_LOG_ENABLED = os.environ.get("SLOW_QUERY_LOG_ENABLED", "1") == "1"
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 100))
+SLOW_QUERY_LOG_FILE = os.environ.get(
+    "SLOW_QUERY_LOG_FILE", os.path.join(BASE_DIR, "logs", "slow_queries.jsonl")
+)
+SLOW_QUERY_LOG_MAX_BYTES = int(
+    os.environ.get("SLOW_QUERY_LOG_MAX_BYTES", 10 * 1024 * 1024)
+)
+SLOW_QUERY_LOG_BACKUP_COUNT = int(os.environ.get("SLOW_QUERY_LOG_BACKUP_COUNT", 5))
+SLOW_QUERY_SUMMARY_INTERVAL = float(os.environ.get("SLOW_QUERY_SUMMARY_INTERVAL", 60))
+
+# Request metrics served at /metrics in Prometheus format (core.metrics).
+# With several worker processes set METRICS_MULTIPROCESS_DIR to a directory
+# shared by them, each worker writes its counters there at most every
+# METRICS_FLUSH_INTERVAL seconds and /metrics sums all of them.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+METRICS_MULTIPROCESS_DIR = os.environ.get("METRICS_MULTIPROCESS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+# when set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Per-request profiling (core.middleware.ProfilingMiddleware): adds a
+# Server-Timing header with DB, serializer and render time, and dumps a
+# cProfile of sampled requests, or of requests sending
+# "<PROFILING_HEADER>: <PROFILING_TOKEN>", to PROFILING_DIR.
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "1") == "1"
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+PROFILING_HEADER = "X-Profile"
+# empty disables profiling on demand
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN", "")
+PROFILING_DIR = os.environ.get("PROFILING_DIR", os.path.join(BASE_DIR, "profiles"))
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -85,10 +140,80 @@ WSGI_APPLICATION = "app.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": os.environ.get("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+        # seconds to keep a connection open between requests, 0 closes it
+        # at the end of every request and "none" keeps it forever
+        "CONN_MAX_AGE": (
+            None
+            if os.environ.get("DB_CONN_MAX_AGE", "").lower() == "none"
+            else int(os.environ.get("DB_CONN_MAX_AGE") or 60)
+        ),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            # IMMEDIATE takes the write lock when the transaction starts, so
+            # writers wait on busy_timeout instead of failing with
+            # "database is locked" when upgrading from a read lock
+            "transaction_mode": os.environ.get("SQLITE_TRANSACTION_MODE", "IMMEDIATE"),
+        },
     }
 }
 
+# Optional user sharding of the recipe tables: with RECIPE_SHARD_COUNT=N
+# the recipe app lives in N extra SQLite files, picked by hashing the user
+# id (core.routers.UserShardRouter). Create their schema with
+# "manage.py migrate_shards" and move users after changing N with
+# "manage.py rebalance_shards --from-count <old N>".
+RECIPE_SHARDS = []
+for index in range(int(os.environ.get("RECIPE_SHARD_COUNT", 0))):
+    alias = f"shard{index}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "NAME": os.path.join(
+            os.environ.get("RECIPE_SHARD_DIR", BASE_DIR), f"recipe_shard{index}.sqlite3"
+        ),
+    }
+    RECIPE_SHARDS.append(alias)
+
+# Read replicas, e.g. SQLITE_REPLICA_PATHS=/data/replica1.sqlite3,/data/replica2.sqlite3
+# For local testing they are plain file copies refreshed with
+# "manage.py sync_replicas". Safe methods of the recipe viewsets read
+# from them, everything else uses the primary ("default").
+REPLICA_DATABASES = []
+for index, path in enumerate(
+    filter(None, os.environ.get("SQLITE_REPLICA_PATHS", "").split(",")), start=1
+):
+    alias = f"replica{index}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "NAME": path.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = [
+    "core.routers.UserShardRouter",
+    "core.routers.PrimaryReplicaRouter",
+]
+
+# seconds a user's reads stay on the primary after they write, stored as
+# a core.PrimaryPin row so every worker honours it (only with replicas)
+READ_YOUR_WRITES_WINDOW = int(os.environ.get("READ_YOUR_WRITES_WINDOW", 5))
+
+# Applied by core.db on every new SQLite connection. Set any of the
+# environment variables to an empty string to keep SQLite's default.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "wal"),
+    "busy_timeout": os.environ.get("SQLITE_BUSY_TIMEOUT", "5000"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "normal"),
+    "mmap_size": os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    # negative values are in KiB, so this is a 64MB page cache
+    "cache_size": os.environ.get("SQLITE_CACHE_SIZE", "-65536"),
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "memory"),
+}
+
+# seconds between "PRAGMA optimize" runs on persistent connections, 0 disables
+SQLITE_OPTIMIZE_INTERVAL = int(os.environ.get("SQLITE_OPTIMIZE_INTERVAL", 3600))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -109,6 +234,31 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# The first hasher is used for new hashes, passwords stored with any other
+# one (or with another PBKDF2_ITERATIONS) are rehashed on the next login.
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "user.hashers.PBKDF2PasswordHasher")
+PASSWORD_HASHERS = [PASSWORD_HASHER] + [
+    hasher
+    for hasher in [
+        "user.hashers.PBKDF2PasswordHasher",
+        "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+        "django.contrib.auth.hashers.Argon2PasswordHasher",
+        "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+        "django.contrib.auth.hashers.ScryptPasswordHasher",
+    ]
+    if hasher != PASSWORD_HASHER
+]
+# None keeps Django's default work factor
+PBKDF2_ITERATIONS = int(os.environ.get("PBKDF2_ITERATIONS", 0)) or None
+
+# Pool that hashes passwords for the async signup and login views
+PASSWORD_HASHING_WORKERS = int(
+    os.environ.get("PASSWORD_HASHING_WORKERS", os.cpu_count() or 2)
+)
+# hashes allowed to wait for a worker before requests get a 503
+PASSWORD_HASHING_QUEUE_SIZE = int(os.environ.get("PASSWORD_HASHING_QUEUE_SIZE", 64))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
 
@@ -131,6 +281,9 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, "app/static")]
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 MEDIA_URL = "media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+# uploaded recipe images are downscaled to fit in a square of this many
+# pixels by a background job (recipe.tasks.process_recipe_image)
+RECIPE_IMAGE_MAX_SIZE = int(os.environ.get("RECIPE_IMAGE_MAX_SIZE", 2048))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -144,11 +297,139 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         # 'rest_framework.authentication.BasicAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
-        "rest_framework.authentication.TokenAuthentication",
+        "user.authentication.ExpiringTokenAuthentication",
     ],
 }
 
 
+# Auth tokens expire TOKEN_TTL after they were issued, or after they were
+# last used when TOKEN_SLIDING is on (renewed at most every TOKEN_RENEW_INTERVAL)
+TOKEN_TTL = timedelta(seconds=int(os.environ.get("TOKEN_TTL", 7 * 24 * 3600)))
+TOKEN_SLIDING = os.environ.get("TOKEN_SLIDING", "1") == "1"
+TOKEN_RENEW_INTERVAL = timedelta(
+    seconds=int(os.environ.get("TOKEN_RENEW_INTERVAL", 3600))
+)
+# Expired tokens are deleted by "manage.py purge_expired_tokens" or its
+# recurring job, which repeats every TOKEN_PURGE_INTERVAL seconds (0 runs
+# it once) after "purge_expired_tokens --schedule" queued it.
+TOKEN_PURGE_INTERVAL = int(os.environ.get("TOKEN_PURGE_INTERVAL", 3600))
+TOKEN_PURGE_BATCH_SIZE = int(os.environ.get("TOKEN_PURGE_BATCH_SIZE", 500))
+
+# Idempotency-Key header on recipe and user creation (core.idempotency):
+# responses are replayed to retries for IDEMPOTENCY_TTL seconds, a retry
+# waits up to IDEMPOTENCY_WAIT_TIMEOUT seconds for the first request to
+# finish, and a first request that ran longer than IDEMPOTENCY_LOCK_TIMEOUT
+# seconds without finishing is considered dead. Expired keys are purged
+# by the job workers.
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", 24 * 3600))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.environ.get("IDEMPOTENCY_WAIT_TIMEOUT", 10))
+IDEMPOTENCY_POLL_INTERVAL = float(os.environ.get("IDEMPOTENCY_POLL_INTERVAL", 0.05))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get("IDEMPOTENCY_LOCK_TIMEOUT", 60))
+
+# /api/batch/ (core.batch): at most BATCH_MAX_REQUESTS sub-requests, runs
+# of read-only ones on up to BATCH_MAX_WORKERS threads, and sub-requests
+# not done BATCH_TIMEOUT seconds after the batch started get a 504
+BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", 20))
+BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", 4))
+BATCH_TIMEOUT = float(os.environ.get("BATCH_TIMEOUT", 10))
+
+# Delta sync (recipe.sync): /api/recipe/sync/ returns at most SYNC_PAGE_SIZE
+# changes per call. "manage.py compact_changes" (or its recurring job,
+# every SYNC_COMPACTION_INTERVAL seconds) drops superseded changes and
+# tombstones older than SYNC_TOMBSTONE_RETENTION seconds, clients that
+# haven't synced for that long start over from cursor 0.
+SYNC_PAGE_SIZE = int(os.environ.get("SYNC_PAGE_SIZE", 500))
+SYNC_TOMBSTONE_RETENTION = int(
+    os.environ.get("SYNC_TOMBSTONE_RETENTION", 30 * 24 * 3600)
+)
+SYNC_COMPACTION_BATCH_SIZE = int(os.environ.get("SYNC_COMPACTION_BATCH_SIZE", 5000))
+SYNC_COMPACTION_INTERVAL = int(os.environ.get("SYNC_COMPACTION_INTERVAL", 24 * 3600))
+
+# Live change feed (recipe.feed, core.broker) at /api/recipe/feed/, over
+# SSE or WebSocket, needs ASGI. Every connection buffers up to
+# FEED_QUEUE_SIZE events and is dropped (told to resync) when its client
+# falls further behind. FEED_HEARTBEAT is the seconds between keep-alive
+# comments on idle SSE streams, FEED_RETRY_MS the reconnect delay told to
+# EventSource. A user can hold FEED_MAX_PER_USER connections per process.
+# FEED_FANOUT = "unix" delivers events
+# published by other processes of the host (more ASGI workers, the job
+# workers) through Unix datagram sockets in FEED_SOCKET_DIR; empty keeps
+# events in the publishing process.
+FEED_QUEUE_SIZE = int(os.environ.get("FEED_QUEUE_SIZE", 100))
+FEED_HEARTBEAT = float(os.environ.get("FEED_HEARTBEAT", 15))
+FEED_RETRY_MS = int(os.environ.get("FEED_RETRY_MS", 3000))
+FEED_MAX_PER_USER = int(os.environ.get("FEED_MAX_PER_USER", 10))
+FEED_FANOUT = os.environ.get("FEED_FANOUT", "")
+FEED_SOCKET_DIR = os.environ.get(
+    "FEED_SOCKET_DIR", os.path.join(tempfile.gettempdir(), "recipe-feed")
+)
+
+# Similar recipes (recipe.similarity): /api/recipe/recipes/<id>/similar/
+# returns SIMILAR_RECIPES_LIMIT recipes unless ?limit= asks for up to
+# SIMILAR_RECIPES_MAX_LIMIT. Every process keeps the indexes of its
+# SIMILARITY_INDEX_MAX_USERS most recently used users and rebuilds one
+# that is more than SIMILARITY_CATCH_UP_LIMIT changes behind.
+SIMILAR_RECIPES_LIMIT = int(os.environ.get("SIMILAR_RECIPES_LIMIT", 10))
+SIMILAR_RECIPES_MAX_LIMIT = int(os.environ.get("SIMILAR_RECIPES_MAX_LIMIT", 100))
+SIMILARITY_INDEX_MAX_USERS = int(os.environ.get("SIMILARITY_INDEX_MAX_USERS", 1000))
+SIMILARITY_CATCH_UP_LIMIT = int(os.environ.get("SIMILARITY_CATCH_UP_LIMIT", 1000))
+
+# Pantry matches (recipe.pantry): /api/recipe/recipes/pantry/?ingredients=
+# returns recipes missing at most PANTRY_MAX_MISSING of their ingredients
+# unless ?max_missing= says otherwise, PANTRY_LIMIT of them unless ?limit=
+# asks for up to PANTRY_MAX_LIMIT. A pantry holds at most
+# PANTRY_MAX_INGREDIENTS ingredients.
+PANTRY_MAX_MISSING = int(os.environ.get("PANTRY_MAX_MISSING", 2))
+PANTRY_LIMIT = int(os.environ.get("PANTRY_LIMIT", 20))
+PANTRY_MAX_LIMIT = int(os.environ.get("PANTRY_MAX_LIMIT", 100))
+PANTRY_MAX_INGREDIENTS = int(os.environ.get("PANTRY_MAX_INGREDIENTS", 1000))
+
+# /api/recipe/recipes/shopping_list/?recipes= merges at most this many
+# recipes.
+SHOPPING_LIST_MAX_RECIPES = int(os.environ.get("SHOPPING_LIST_MAX_RECIPES", 100))
+
+# Deleting an account deactivates it right away and purges its data in a
+# background job, this many rows per table per transaction
+ACCOUNT_PURGE_BATCH_SIZE = int(os.environ.get("ACCOUNT_PURGE_BATCH_SIZE", 500))
+
+# Tags and ingredients no recipe uses anymore are deleted by "manage.py
+# collect_orphans" or its recurring job, once they have been orphans for
+# ORPHAN_RETENTION seconds, counted from the last time a recipe unlinked
+# them or else their creation (0 deletes all of them). The job repeats every
+# ORPHAN_GC_INTERVAL seconds after "collect_orphans --schedule" queued it.
+ORPHAN_RETENTION = int(os.environ.get("ORPHAN_RETENTION", 7 * 24 * 3600))
+ORPHAN_GC_BATCH_SIZE = int(os.environ.get("ORPHAN_GC_BATCH_SIZE", 500))
+ORPHAN_GC_INTERVAL = int(os.environ.get("ORPHAN_GC_INTERVAL", 24 * 3600))
+
+
 SPECTACULAR_SETTINGS = {
     "COMPONENT_SPLIT_REQUEST": True,
+    # signup and login are plain Django views, documented by stand-ins
+    "PREPROCESSING_HOOKS": ["user.schema.add_endpoints"],
 }
+
+# /api/schema/ is generated once per code version and served from memory,
+# "manage.py build_schema" prebuilds it into SCHEMA_CACHE_DIR at deploy
+# time. The version is CODE_VERSION (e.g. the git commit) when set, or a
+# hash of the source files.
+CODE_VERSION = os.environ.get("CODE_VERSION", "")
+SCHEMA_CACHE_DIR = os.environ.get(
+    "SCHEMA_CACHE_DIR", os.path.join(BASE_DIR, "schema_cache")
+)
+SCHEMA_CACHE_MAX_AGE = int(os.environ.get("SCHEMA_CACHE_MAX_AGE", 24 * 3600))
+
+# Background jobs (core.jobs) live in the default database and are run by
+# "manage.py worker". A job is retried JOBS_MAX_ATTEMPTS times in total,
+# JOBS_RETRY_DELAY seconds after the first failure, doubling up to
+# JOBS_MAX_RETRY_DELAY. A worker holding a job longer than its lease is
+# considered dead and the job is handed to another one.
+JOBS_MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", 5))
+JOBS_RETRY_DELAY = float(os.environ.get("JOBS_RETRY_DELAY", 10))
+JOBS_MAX_RETRY_DELAY = float(os.environ.get("JOBS_MAX_RETRY_DELAY", 3600))
+JOBS_LEASE_SECONDS = int(os.environ.get("JOBS_LEASE_SECONDS", 300))
+# seconds an idle worker waits before looking for due jobs again
+JOBS_POLL_INTERVAL = float(os.environ.get("JOBS_POLL_INTERVAL", 1))
+# succeeded jobs (and their idempotency keys) are deleted after this many
+# seconds, checked every JOBS_PURGE_INTERVAL seconds by each worker
+JOBS_RETENTION = int(os.environ.get("JOBS_RETENTION", 7 * 24 * 3600))
+JOBS_PURGE_INTERVAL = int(os.environ.get("JOBS_PURGE_INTERVAL", 600))
@@ -18,8 +18,8 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
+from core import views as core_views
 from drf_spectacular.views import (
-    SpectacularAPIView,
     SpectacularRedocView,
     SpectacularSwaggerView,
 )
@@ -27,7 +27,9 @@ from drf_spectacular.views import (
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
+    path("metrics", core_views.metrics, name="metrics"),
+    # prebuilt per code version and served from memory
+    path("api/schema/", core_views.CachedSpectacularAPIView.as_view(), name="schema"),
     # swagger URLs
     # Optional UI:
     path(
@@ -43,6 +45,8 @@ urlpatterns = [
     # Project URLs
     path("api/user/", include("user.urls")),
     path("api/recipe/", include("recipe.urls")),
+    # several of the calls above in one request
+    path("api/batch/", core_views.BatchView.as_view(), name="batch"),
 ]
 
 
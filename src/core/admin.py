@@ -1,3 +1,172 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max
+from django.utils.functional import cached_property
 
 # Register your models here.
+
+# query string parameter holding the last primary key of the previous page
+AFTER_VAR = "after"
+
+# below this many rows counting exactly is cheap enough
+EXACT_COUNT_THRESHOLD = 10_000
+# filtered counts stop at this many rows
+COUNT_LIMIT = 10_000
+
+
+def table_estimate(model, using):
+    """Approximate row count of a model's table without scanning it.
+
+    SQLite keeps row counts in sqlite_stat1 once ANALYZE (or PRAGMA
+    optimize, see core.db) ran, PostgreSQL in pg_class. Otherwise the
+    highest primary key is used, which ignores deleted rows.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                # the first number of every stat is the table's row count
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+                rows = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+                if rows:
+                    return max(rows)
+            elif connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [table],
+                )
+                row = cursor.fetchone()
+                if row and row[0] > 0:
+                    return row[0]
+    except DatabaseError:
+        # e.g. sqlite_stat1 doesn't exist before the first ANALYZE
+        pass
+    return model._default_manager.using(using).aggregate(n=Max("pk"))["n"] or 0
+
+
+def estimated_count(queryset):
+    """Count of a queryset that never scans a large table.
+
+    Unfiltered querysets get the table estimate, filtered ones are counted
+    up to COUNT_LIMIT rows.
+    """
+    if not queryset.query.where:
+        estimate = table_estimate(queryset.model, queryset.db)
+        if estimate >= EXACT_COUNT_THRESHOLD:
+            return estimate
+        return queryset.count()
+    # COUNT(*) over a LIMITed subquery stops reading at the limit
+    return queryset[:COUNT_LIMIT].count()
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator whose count comes from estimated_count()."""
+
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)
+
+
+class KeysetChangeList(ChangeList):
+    """Changelist paging with "WHERE pk < last pk" instead of OFFSET.
+
+    Used while the list is in its default newest first order. Every page
+    is then an index range scan however deep it is. Sorting by a column
+    falls back to numbered pages.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # sorting and filter links start over from the first page
+        remove = list(remove or [])
+        if AFTER_VAR not in (new_params or {}):
+            remove.append(AFTER_VAR)
+        return super().get_query_string(new_params, remove)
+
+    @cached_property
+    def keyset(self):
+        return ORDER_VAR not in self.params and tuple(self._get_default_ordering()) in (
+            ("-pk",),
+            ("-id",),
+        )
+
+    def get_results(self, request):
+        if not self.keyset:
+            return super().get_results(request)
+
+        per_page = self.list_per_page
+        queryset = self.queryset
+        self.after = request.GET.get(AFTER_VAR)
+        if self.after:
+            try:
+                queryset = queryset.filter(pk__lt=int(self.after))
+            except ValueError:
+                self.after = None
+        rows = list(queryset[: per_page + 1])
+        self.result_list = rows[:per_page]
+        self.next_url = (
+            self.get_query_string({AFTER_VAR: self.result_list[-1].pk})
+            if len(rows) > per_page
+            else None
+        )
+        self.first_page_url = self.get_query_string()
+
+        self.paginator = self.model_admin.get_paginator(
+            request, self.queryset, per_page
+        )
+        self.result_count = self.paginator.count
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = bool(self.next_url or self.after)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """ModelAdmin for tables with millions of rows.
+
+    Estimated counts, keyset pagination in the default order, no full
+    COUNT(*) for the "x total" link, and searches that only do indexed
+    lookups (see search_help_text). Subclasses still need to set
+    list_select_related and raw_id_fields / autocomplete_fields.
+    """
+
+    ordering = ("-id",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    change_list_template = "admin/keyset_change_list.html"
+    # indexed column searched by prefix, in addition to exact ids
+    prefix_search_field = None
+    search_help_text = "An id, or the start of the name (case sensitive)."
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        """Exact id or indexed prefix match, never LIKE '%term%'.
+
+        The prefix is a range on the column, which any index on it can
+        serve whatever the database's LIKE rules.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(pk=int(term)), False
+        if self.prefix_search_field:
+            field = self.prefix_search_field
+            return (
+                queryset.filter(
+                    **{f"{field}__gte": term, f"{field}__lt": term + "\U0010ffff"}
+                ),
+                False,
+            )
+        return queryset.none(), False
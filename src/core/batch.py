@@ -0,0 +1,184 @@
+"""Run several API requests inside one /api/batch/ request.
+
+The batch request is authenticated once. Its sub-requests are resolved
+against the project's API URLs, under /api/, and their views are called
+directly: no middleware, and DRF's forced authentication hands them the
+batch's user and token. Other URLs, like the session authenticated admin,
+are 404s rather than reachable with the batch's token. Runs of
+consecutive read-only sub-requests execute in parallel on a thread pool.
+Writes run one at a time in the order given, so a read listed after a
+write sees it.
+"""
+
+import asyncio
+import io
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.http import Http404
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+READ_ONLY_METHODS = ("GET", "HEAD")
+
+# routes sub-requests may resolve to
+API_PREFIX = "api/"
+
+# headers of the batch request passed on to every sub-request
+INHERITED_META = (
+    "SERVER_NAME",
+    "SERVER_PORT",
+    "REMOTE_ADDR",
+    "HTTP_HOST",
+    "HTTP_ACCEPT_LANGUAGE",
+    "HTTP_USER_AGENT",
+    "HTTP_X_FORWARDED_FOR",
+    "HTTP_X_FORWARDED_PROTO",
+)
+
+
+def build_request(request, sub):
+    """A WSGIRequest for a sub-request, on the batch request's host."""
+    body = b""
+    if sub.get("body") is not None:
+        body = json.dumps(sub["body"]).encode()
+    environ = {key: request.META[key] for key in INHERITED_META if key in request.META}
+    environ.update(
+        {
+            "REQUEST_METHOD": sub["method"],
+            "PATH_INFO": sub["path"],
+            "SCRIPT_NAME": "",
+            "QUERY_STRING": urlencode(sub.get("query") or {}, doseq=True),
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.url_scheme": request.scheme,
+        }
+    )
+    for name, value in (sub.get("headers") or {}).items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = value
+    return WSGIRequest(environ)
+
+
+def _body(response):
+    content = getattr(response, "content", b"")
+    if not content:
+        return None
+    if response.get("Content-Type", "").startswith("application/json"):
+        return json.loads(content)
+    return content.decode(errors="replace")
+
+
+async def _await(coroutine):
+    return await coroutine
+
+
+def dispatch(request, sub):
+    """Run one sub-request, returns its entry of the batch response."""
+    started = time.perf_counter()
+    try:
+        match = resolve(sub["path"])
+    except Resolver404:
+        match = None
+    if (
+        match is None
+        or not match.route.startswith(API_PREFIX)
+        or match.url_name == "batch"
+    ):
+        status, body = 404, {"detail": "Not found."}
+    else:
+        sub_request = build_request(request, sub)
+        # skips the token lookup, the batch request was authenticated
+        sub_request._force_auth_user = request.user
+        sub_request._force_auth_token = request.auth
+        sub_request.user = request.user
+        try:
+            response = match.func(sub_request, *match.args, **match.kwargs)
+            if asyncio.iscoroutine(response):
+                # an async view, e.g. user creation
+                response = async_to_sync(_await)(response)
+            if hasattr(response, "render"):
+                response.render()
+            status, body = response.status_code, _body(response)
+        except Http404:
+            status, body = 404, {"detail": "Not found."}
+        except Exception:
+            # one failing sub-request doesn't fail the others
+            logger.exception(
+                "Batch sub-request %s %s failed", sub["method"], sub["path"]
+            )
+            status, body = 500, {"detail": "Internal server error."}
+    return {
+        "id": sub.get("id"),
+        "status": status,
+        "body": body,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def _dispatch_in_thread(request, sub):
+    try:
+        return dispatch(request, sub)
+    finally:
+        # connections are per thread, don't leave them open in the pool
+        connections.close_all()
+
+
+def _timed_out(sub):
+    return {
+        "id": sub.get("id"),
+        "status": 504,
+        "body": {"detail": "Batch timeout exceeded before this request ran."},
+        "duration_ms": 0.0,
+    }
+
+
+def run(request, subs):
+    """Run the sub-requests and return their entries, in order.
+
+    Sub-requests not started within BATCH_TIMEOUT seconds get a 504
+    entry. Read-only ones still running at the deadline finish in the
+    background but are reported as 504 too.
+    """
+    deadline = time.monotonic() + settings.BATCH_TIMEOUT
+    results = [None] * len(subs)
+    index = 0
+    # not a with block, its exit would wait for timed out sub-requests
+    executor = ThreadPoolExecutor(max_workers=settings.BATCH_MAX_WORKERS)
+    try:
+        while index < len(subs):
+            if time.monotonic() >= deadline:
+                results[index] = _timed_out(subs[index])
+                index += 1
+                continue
+            # the run of read-only sub-requests starting here
+            end = index
+            while end < len(subs) and subs[end]["method"] in READ_ONLY_METHODS:
+                end += 1
+            if end - index > 1 and settings.BATCH_MAX_WORKERS > 1:
+                futures = {
+                    executor.submit(_dispatch_in_thread, request, subs[i]): i
+                    for i in range(index, end)
+                }
+                done, _ = wait(futures, timeout=deadline - time.monotonic())
+                for future, i in futures.items():
+                    if future in done:
+                        results[i] = future.result()
+                    else:
+                        future.cancel()
+                        results[i] = _timed_out(subs[i])
+                index = end
+            else:
+                results[index] = dispatch(request, subs[index])
+                index += 1
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
@@ -0,0 +1,234 @@
+"""In-process publish/subscribe for live event feeds.
+
+Subscribers are asyncio queues, one per open connection, so an idle
+connection costs a coroutine and a queue rather than a thread. publish()
+may be called from any thread (request threads, on_commit hooks, job
+workers), delivery hops onto the subscriber's event loop.
+
+Queues are bounded by FEED_QUEUE_SIZE. A subscriber that falls that far
+behind (its client doesn't read fast enough) is dropped rather than
+buffered without limit, and told so, so it can resume from its cursor.
+
+With FEED_FANOUT = "unix" every process serving subscribers binds a Unix
+datagram socket in FEED_SOCKET_DIR and publish() sends each event to all
+sockets there. That fans out to the other workers of the same host,
+including job workers that publish but never subscribe.
+"""
+
+import asyncio
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# largest datagram published, events are a few hundred bytes
+MAX_DATAGRAM = 64 * 1024
+
+
+class SubscriberLimit(Exception):
+    """The key already has FEED_MAX_PER_USER subscribers in this process."""
+
+
+class Dropped(Exception):
+    """The subscriber fell FEED_QUEUE_SIZE events behind and was dropped."""
+
+
+_DROPPED = object()
+
+
+def _count(name, labels=()):
+    if settings.METRICS_ENABLED:
+        registry.inc(name, labels)
+
+
+class Subscription:
+    """The events of one key, for one consumer on one event loop."""
+
+    def __init__(self, broker, key, maxsize):
+        self.broker = broker
+        self.key = key
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = False
+
+    def _put(self, event):
+        # runs on self.loop
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped = True
+            self.broker.unsubscribe(self)
+            # make room to wake the consumer, it resyncs from its cursor
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_DROPPED)
+            _count("feed_subscribers_dropped_total")
+
+    async def get(self, timeout=None):
+        """The next event, None after timeout seconds without one.
+
+        Raises Dropped when the subscriber was too slow.
+        """
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is _DROPPED:
+            raise Dropped
+        return event
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class UnixFanout:
+    """Fan events out to the other processes of the host.
+
+    Each receiving process binds "<pid>-<random>.sock" in directory and
+    reads it on a daemon thread (one per process, not per subscriber).
+    Sends are non-blocking: a process whose socket buffer is full misses
+    the event, which its subscribers see as a gap in cursors.
+    """
+
+    def __init__(self, directory, deliver):
+        self.directory = directory
+        self.deliver = deliver
+        self.path = None
+        self._sender = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start receiving, once per process."""
+        with self._lock:
+            if self.path is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(
+                self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock"
+            )
+            receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            receiver.bind(path)
+            self.path = path
+            atexit.register(self._remove, path)
+            threading.Thread(
+                target=self._receive, args=(receiver,), name="feed-fanout", daemon=True
+            ).start()
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _receive(self, receiver):
+        while True:
+            data = receiver.recv(MAX_DATAGRAM)
+            try:
+                key, event = json.loads(data)
+            except ValueError:
+                continue
+            self.deliver(key, event)
+
+    def send(self, key, event):
+        data = json.dumps([key, event]).encode()
+        if self._sender is None:
+            self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sender.setblocking(False)
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if not entry.name.endswith(".sock"):
+                continue
+            try:
+                self._sender.sendto(data, entry.path)
+            except BlockingIOError:
+                _count("feed_events_dropped_total", (("where", "fanout"),))
+            except ConnectionRefusedError:
+                # left behind by a process that died
+                self._remove(entry.path)
+            except OSError:
+                logger.warning("Could not send feed event to %s", entry.path)
+
+
+class Broker:
+    """Per-key subscriptions, keys are anything JSON serializable."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._fanout = None
+        self._pid = None
+
+    @property
+    def fanout(self):
+        if settings.FEED_FANOUT != "unix":
+            return None
+        if self._pid != os.getpid():
+            # forked, the parent's socket and thread aren't ours
+            self._fanout = UnixFanout(settings.FEED_SOCKET_DIR, self.deliver)
+            self._pid = os.getpid()
+        return self._fanout
+
+    def subscribe(self, key, maxsize=None):
+        """A Subscription to key, call from the consumer's event loop."""
+        if self.fanout is not None:
+            self.fanout.start()
+        subscription = Subscription(self, key, maxsize or settings.FEED_QUEUE_SIZE)
+        with self._lock:
+            if len(self._subscribers[key]) >= settings.FEED_MAX_PER_USER:
+                raise SubscriberLimit
+            self._subscribers[key].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.key]
+
+    def publish(self, key, event):
+        """Send event to the subscribers of key, in every process with fan-out."""
+        if self.fanout is not None:
+            self.fanout.send(key, event)
+        else:
+            self.deliver(key, event)
+
+    def deliver(self, key, event):
+        """Send event to the subscribers of key in this process."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, event)
+            except RuntimeError:
+                # its event loop is closed
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+broker = Broker()
@@ -0,0 +1,65 @@
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .slowlog import install_slow_query_log
+
+
+def get_sqlite_pragmas():
+    """Return the pragmas to apply, skipping the ones disabled in settings."""
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", {})
+    return {name: value for name, value in pragmas.items() if value not in (None, "")}
+
+
+def apply_pragmas(cursor, pragmas):
+    """Apply pragmas on a DB-API cursor (Django or plain sqlite3)."""
+    for name, value in pragmas.items():
+        # pragma values can't be bound as parameters, they are
+        # validated as plain identifiers / integers here instead
+        value = str(value)
+        if not value.lstrip("-").isalnum():
+            raise ValueError(f"Invalid value for PRAGMA {name}: {value!r}")
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Tune every new SQLite connection as soon as it is opened."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, get_sqlite_pragmas())
+    connection.last_optimized = time.monotonic()
+
+
+def optimize_sqlite(sender, **kwargs):
+    """Run PRAGMA optimize on long-lived connections every so often.
+
+    With persistent connections (CONN_MAX_AGE) a connection can live for
+    hours, so the query planner statistics are refreshed periodically
+    at the end of a request instead of only when the connection closes.
+    """
+    interval = getattr(settings, "SQLITE_OPTIMIZE_INTERVAL", 0)
+    if not interval:
+        return
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.vendor != "sqlite" or connection.connection is None:
+            continue
+        if now - getattr(connection, "last_optimized", now) < interval:
+            continue
+        if connection.in_atomic_block:
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA optimize")
+        connection.last_optimized = now
+
+
+def connect_signals():
+    connection_created.connect(configure_sqlite, dispatch_uid="core.configure_sqlite")
+    request_finished.connect(optimize_sqlite, dispatch_uid="core.optimize_sqlite")
+    connection_created.connect(
+        install_slow_query_log, dispatch_uid="core.install_slow_query_log"
+    )
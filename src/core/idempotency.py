@@ -0,0 +1,194 @@
+"""Idempotency-Key support for non idempotent endpoints.
+
+A client sends "Idempotency-Key: <unique value>" with a POST and the same
+header on every retry of it. The first request with a key runs the view
+and its response is stored for IDEMPOTENCY_TTL seconds. Retries get the
+stored response replayed, with an "Idempotent-Replayed: true" header,
+without running the view again. A retry arriving while the first request
+is still running waits for it (up to IDEMPOTENCY_WAIT_TIMEOUT seconds,
+then 409). Reusing a key for a different request is a 422.
+
+Keys are rows with a unique (scope, key) constraint in the default
+database, so only one request can own a key across all processes.
+Responses with a 5xx status aren't stored and free the key for a retry.
+"""
+
+import asyncio
+import hashlib
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+
+from .metrics import record_cache_lookup
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+def _keys():
+    return IdempotencyKey.objects.using(DEFAULT_DB_ALIAS)
+
+
+def request_hash(request):
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.path}\n".encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _claim(scope, key, fingerprint):
+    """Return (record, True) when this request now owns the key.
+
+    Expired keys, and keys whose first request stopped running without
+    a response (its process died), are taken over.
+    """
+    now = timezone.now()
+    abandoned = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    _keys().filter(scope=scope, key=key).filter(
+        Q(expires_at__lt=now) | Q(status_code__isnull=True, created_at__lt=abandoned)
+    ).delete()
+    try:
+        # savepoint, so a lost race doesn't break an outer transaction
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            record = _keys().create(
+                scope=scope,
+                key=key,
+                request_hash=fingerprint,
+                created_at=now,
+                expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_TTL),
+            )
+        return record, True
+    except IntegrityError:
+        return _keys().filter(scope=scope, key=key).first(), False
+
+
+def _finish(record, response):
+    if response.status_code >= 500:
+        # a failure must not be replayed, a retry may succeed
+        record.delete()
+        return
+    record.status_code = response.status_code
+    record.response = response.data
+    record.save(update_fields=["status_code", "response"])
+
+
+def _check(record, fingerprint, respond):
+    """The response for a key another request owns, None to keep waiting."""
+    if record.request_hash != fingerprint:
+        return respond(
+            {"detail": f"This {HEADER} was used for a different request."},
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status_code is None:
+        return None
+    record_cache_lookup("idempotency", True)
+    response = respond(record.response, record.status_code)
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def _invalid_key(key, respond):
+    if len(key) > MAX_KEY_LENGTH:
+        return respond(
+            {"detail": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."},
+            status.HTTP_400_BAD_REQUEST,
+        )
+    return None
+
+
+def _in_progress(respond):
+    response = respond(
+        {"detail": f"A request with this {HEADER} is still in progress."},
+        status.HTTP_409_CONFLICT,
+    )
+    response["Retry-After"] = "1"
+    return response
+
+
+def execute(request, scope, view, respond):
+    """Run view() at most once per Idempotency-Key within scope.
+
+    view returns a DRF Response (its data is what gets stored) and
+    respond(data, status) builds the replayed ones. Requests without the
+    header just run the view.
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return view()
+    invalid = _invalid_key(key, respond)
+    if invalid is not None:
+        return invalid
+
+    fingerprint = request_hash(request)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    while True:
+        record, owner = _claim(scope, key, fingerprint)
+        if owner:
+            record_cache_lookup("idempotency", False)
+            try:
+                response = view()
+            except BaseException:
+                record.delete()
+                raise
+            _finish(record, response)
+            return response
+        if record is not None:
+            response = _check(record, fingerprint, respond)
+            if response is not None:
+                return response
+        if time.monotonic() >= deadline:
+            return _in_progress(respond)
+        time.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+
+
+async def aexecute(request, scope, view, respond):
+    """execute() for async views, view is a coroutine function."""
+    key = request.headers.get(HEADER)
+    if not key:
+        return await view()
+    invalid = _invalid_key(key, respond)
+    if invalid is not None:
+        return invalid
+
+    fingerprint = request_hash(request)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    while True:
+        record, owner = await sync_to_async(_claim)(scope, key, fingerprint)
+        if owner:
+            record_cache_lookup("idempotency", False)
+            try:
+                response = await view()
+            except BaseException:
+                await sync_to_async(record.delete)()
+                raise
+            await sync_to_async(_finish)(record, response)
+            return response
+        if record is not None:
+            response = _check(record, fingerprint, respond)
+            if response is not None:
+                return response
+        if time.monotonic() >= deadline:
+            return _in_progress(respond)
+        # waiting here doesn't hold a worker thread
+        await asyncio.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+
+
+def purge_expired(batch_size=1000):
+    """Delete expired keys in batches, returns how many."""
+    expired = _keys().filter(expires_at__lt=timezone.now())
+    deleted = 0
+    while True:
+        pks = list(expired.values_list("pk", flat=True)[:batch_size])
+        if pks:
+            _keys().filter(pk__in=pks).delete()
+        deleted += len(pks)
+        if len(pks) < batch_size:
+            return deleted
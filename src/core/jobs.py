@@ -0,0 +1,379 @@
+"""Background jobs stored in the project database.
+
+Tasks are functions registered with @task and enqueued by name with JSON
+keyword arguments. "manage.py worker" runs them in a pool of processes,
+each claiming one due job at a time:
+
+    from core.jobs import enqueue, task
+
+    @task(max_attempts=3)
+    def send_report(user_id):
+        ...
+
+    enqueue(send_report, {"user_id": user.pk}, priority=10)
+
+Claiming is a conditional UPDATE that only succeeds for one worker and
+gives it a lease of JOBS_LEASE_SECONDS. When a worker dies mid job the
+lease runs out and another worker claims the job again, counted as one
+more attempt, so tasks must be safe to run twice.
+Failures are retried with exponential backoff until max_attempts.
+
+Jobs are rows in the default database, so enqueueing inside a
+transaction only makes the job visible once the transaction commits.
+"""
+
+import logging
+import os
+import random
+import signal
+import socket
+import time
+import traceback
+import uuid
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from . import idempotency
+from .metrics import registry
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# name: Task
+tasks = {}
+
+# the job being run, for report_progress
+current_job = ContextVar("current_job", default=None)
+
+
+class Task:
+    def __init__(self, func, name, max_attempts, priority, lease):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.priority = priority
+        self.lease = lease
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def enqueue(self, kwargs=None, **options):
+        return enqueue(self, kwargs, **options)
+
+
+def task(func=None, *, name=None, max_attempts=None, priority=0, lease=None):
+    """Register a function as a task, by default under "module.function".
+
+    lease is the seconds a run may take before it is considered dead,
+    JOBS_LEASE_SECONDS by default.
+    """
+
+    def register(func):
+        registered = Task(
+            func,
+            name or f"{func.__module__}.{func.__qualname__}",
+            max_attempts or settings.JOBS_MAX_ATTEMPTS,
+            priority,
+            lease or settings.JOBS_LEASE_SECONDS,
+        )
+        tasks[registered.name] = registered
+        return registered
+
+    return register(func) if func is not None else register
+
+
+def _jobs():
+    # never routed to a replica, the queue must read its own writes
+    return Job.objects.using(DEFAULT_DB_ALIAS)
+
+
+def enqueue(
+    name,
+    kwargs=None,
+    *,
+    priority=None,
+    delay=0,
+    max_attempts=None,
+    idempotency_key=None,
+):
+    """Add a job and return it.
+
+    name is a Task or the name of one. With an idempotency_key, enqueueing
+    again returns the existing job with that key instead of adding one,
+    for as long as that job is kept (see JOBS_RETENTION).
+    """
+    registered = name if isinstance(name, Task) else tasks.get(name)
+    name = registered.name if registered else name
+    if priority is None:
+        priority = registered.priority if registered else 0
+    if max_attempts is None:
+        max_attempts = (
+            registered.max_attempts if registered else settings.JOBS_MAX_ATTEMPTS
+        )
+
+    if idempotency_key is not None:
+        existing = _jobs().filter(idempotency_key=idempotency_key).first()
+        if existing is not None:
+            return existing
+    job = Job(
+        name=name,
+        kwargs=kwargs or {},
+        priority=priority,
+        max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        idempotency_key=idempotency_key,
+    )
+    try:
+        # savepoint, a duplicate key must not break the caller's transaction
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            job.save(using=DEFAULT_DB_ALIAS)
+    except IntegrityError:
+        if idempotency_key is None:
+            raise
+        # lost the race against a concurrent enqueue with the same key
+        return _jobs().get(idempotency_key=idempotency_key)
+    return job
+
+
+def backoff(attempts):
+    """Seconds before retrying a job that failed attempts times.
+
+    Doubles from JOBS_RETRY_DELAY up to JOBS_MAX_RETRY_DELAY, with up to
+    25% jitter so jobs that failed together don't retry together.
+    """
+    delay = min(
+        settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1), settings.JOBS_MAX_RETRY_DELAY
+    )
+    return delay * random.uniform(1.0, 1.25)
+
+
+def _due(now):
+    """Jobs a worker may claim: due queued ones and expired leases."""
+    return Q(status=Job.QUEUED, run_at__lte=now) | Q(
+        status=Job.RUNNING, locked_until__lt=now
+    )
+
+
+class Worker:
+    """Claim and run jobs one at a time until stopped."""
+
+    def __init__(self, name=None, poll_interval=None):
+        self.name = name or (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        )
+        self.poll_interval = (
+            settings.JOBS_POLL_INTERVAL if poll_interval is None else poll_interval
+        )
+        self.stopping = False
+
+    def claim(self):
+        """Lease the next due job to this worker, None when there is none."""
+        now = timezone.now()
+        for _ in range(10):
+            # a partial index serves queued jobs in priority order, expired
+            # leases are a separate lookup as they are rare
+            candidate = (
+                _jobs()
+                .filter(status=Job.QUEUED, run_at__lte=now)
+                .order_by("-priority", "run_at")
+                .values_list("pk", "name")
+                .first()
+            ) or (
+                _jobs()
+                .filter(status=Job.RUNNING, locked_until__lt=now)
+                .values_list("pk", "name")
+                .first()
+            )
+            if candidate is None:
+                return None
+            pk, name = candidate
+            registered = tasks.get(name)
+            lease = registered.lease if registered else settings.JOBS_LEASE_SECONDS
+            # only one worker's UPDATE matches, the others see 0 rows and
+            # try the next candidate
+            claimed = (
+                _jobs()
+                .filter(_due(now), pk=pk)
+                .update(
+                    status=Job.RUNNING,
+                    locked_by=self.name,
+                    locked_until=now + timedelta(seconds=lease),
+                    attempts=F("attempts") + 1,
+                    started_at=now,
+                )
+            )
+            if claimed:
+                return _jobs().get(pk=pk)
+        return None
+
+    def run_job(self, job):
+        """Run a claimed job and record the outcome."""
+        registered = tasks.get(job.name)
+        started = time.monotonic()
+        try:
+            if registered is None:
+                raise LookupError(f"No task registered as {job.name!r}")
+            if job.attempts > job.max_attempts:
+                # its worker died on every attempt, e.g. killed for memory
+                raise RuntimeError(f"Lease expired on all {job.max_attempts} attempts")
+            token = current_job.set(job)
+            try:
+                registered(**job.kwargs)
+            finally:
+                current_job.reset(token)
+        except Exception:
+            error = traceback.format_exc()
+            if registered is not None and job.attempts < job.max_attempts:
+                outcome = "retried"
+                delay = backoff(job.attempts)
+                logger.warning(
+                    "Job %s failed (attempt %d/%d), retrying in %.0fs",
+                    job,
+                    job.attempts,
+                    job.max_attempts,
+                    delay,
+                )
+                changes = {
+                    "status": Job.QUEUED,
+                    "run_at": timezone.now() + timedelta(seconds=delay),
+                }
+            else:
+                outcome = Job.FAILED
+                logger.error("Job %s failed for good:\n%s", job, error)
+                changes = {"status": Job.FAILED, "finished_at": timezone.now()}
+            changes["last_error"] = error
+        else:
+            outcome = Job.SUCCEEDED
+            changes = {"status": Job.SUCCEEDED, "finished_at": timezone.now()}
+
+        # a worker whose lease expired lost the job to another one, which
+        # records the outcome instead
+        _jobs().filter(pk=job.pk, status=Job.RUNNING, locked_by=self.name).update(
+            locked_by="", locked_until=None, **changes
+        )
+        if settings.METRICS_ENABLED:
+            labels = (("task", job.name),)
+            registry.inc("jobs_total", labels + (("outcome", outcome),))
+            registry.observe("job_duration_seconds", labels, time.monotonic() - started)
+            registry.observe(
+                "job_wait_seconds",
+                labels,
+                max(0.0, (job.started_at - job.run_at).total_seconds()),
+            )
+        return outcome
+
+    def run_one(self):
+        """Claim and run one job, False when none was due."""
+        job = self.claim()
+        if job is None:
+            return False
+        self.run_job(job)
+        return True
+
+    def run(self, burst=False):
+        """Run jobs until stop() is called, or the queue is empty with burst."""
+        last_purge = time.monotonic()
+        while not self.stopping:
+            ran = self.run_one()
+            registry.maybe_flush()
+            if time.monotonic() - last_purge > settings.JOBS_PURGE_INTERVAL:
+                last_purge = time.monotonic()
+                purge_finished()
+                idempotency.purge_expired()
+            if not ran:
+                if burst:
+                    break
+                time.sleep(self.poll_interval)
+        registry.maybe_flush(force=True)
+
+    def stop(self, *args):
+        """Finish the current job, then stop. Usable as a signal handler."""
+        self.stopping = True
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+
+def report_progress(**progress):
+    """Save a running task's progress on its job, e.g. report_progress(done=10).
+
+    Shown by "manage.py worker --stats". Outside of a job it is only logged.
+    """
+    logger.info("Progress: %s", progress)
+    job = current_job.get()
+    if job is not None:
+        job.progress = progress
+        _jobs().filter(pk=job.pk).update(progress=progress)
+
+
+def purge_finished(batch_size=1000):
+    """Delete succeeded jobs older than JOBS_RETENTION, in batches.
+
+    Failed jobs are kept for inspection until deleted by hand.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS_RETENTION)
+    finished = _jobs().filter(status=Job.SUCCEEDED, finished_at__lt=cutoff)
+    deleted = 0
+    while True:
+        pks = list(finished.values_list("pk", flat=True)[:batch_size])
+        if pks:
+            _jobs().filter(pk__in=pks).delete()
+        deleted += len(pks)
+        if len(pks) < batch_size:
+            return deleted
+
+
+def queue_stats():
+    """Queue depth and latency, for "manage.py worker --stats" and /metrics.
+
+    depth counts jobs per status, due is the queued jobs whose run_at
+    passed and oldest_due_seconds how long the oldest of them has waited,
+    the latency a job enqueued now would see behind them. running lists
+    the longest running jobs with their progress.
+    """
+    now = timezone.now()
+    depth = {status: 0 for status, _ in Job.STATUS_CHOICES}
+    for row in _jobs().values("status").annotate(n=Count("pk")).order_by():
+        depth[row["status"]] = row["n"]
+    due = (
+        _jobs()
+        .filter(status=Job.QUEUED, run_at__lte=now)
+        .aggregate(n=Count("pk"), oldest=Min("run_at"))
+    )
+    return {
+        "depth": depth,
+        "due": due["n"],
+        "oldest_due_seconds": (
+            round((now - due["oldest"]).total_seconds(), 3) if due["oldest"] else 0.0
+        ),
+        "expired_leases": _jobs()
+        .filter(status=Job.RUNNING, locked_until__lt=now)
+        .count(),
+        "running": [
+            {**job, "started_at": job["started_at"].isoformat()}
+            for job in _jobs()
+            .filter(status=Job.RUNNING)
+            .order_by("started_at")
+            .values("id", "name", "locked_by", "started_at", "attempts", "progress")[
+                :20
+            ]
+        ],
+    }
+
+
+def queue_metrics():
+    """queue_stats() as metric series to add to a metrics snapshot."""
+    stats = queue_stats()
+    return [
+        ["job_queue_depth", [["status", status]], n]
+        for status, n in stats["depth"].items()
+    ] + [
+        ["job_queue_due", [], stats["due"]],
+        ["job_queue_oldest_due_seconds", [], stats["oldest_due_seconds"]],
+    ]
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core import schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the OpenAPI schema of the current code version into "
+        "SCHEMA_CACHE_DIR, run at deploy time like collectstatic."
+    )
+
+    def handle(self, *args, **options):
+        version = schema.code_version()
+        for path in schema.build(version):
+            self.stdout.write(f"Wrote {path}")
+        self.stdout.write(self.style.SUCCESS(f"Schema built for version {version}."))
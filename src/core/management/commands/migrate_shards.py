@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.routers import SHARD_ID_RANGE
+
+
+class Command(BaseCommand):
+    help = "Apply migrations to every recipe shard and seed their id ranges."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "shards",
+            nargs="*",
+            help="Shard aliases to migrate, defaults to all RECIPE_SHARDS.",
+        )
+
+    def handle(self, *args, **options):
+        shards = options["shards"] or settings.RECIPE_SHARDS
+        if not shards:
+            raise CommandError(
+                "Sharding is disabled, set RECIPE_SHARD_COUNT to enable it."
+            )
+
+        for alias in shards:
+            if alias not in settings.RECIPE_SHARDS:
+                raise CommandError(f"{alias} is not a recipe shard.")
+            self.stdout.write(f"Migrating {alias}")
+            call_command(
+                "migrate",
+                database=alias,
+                interactive=False,
+                verbosity=options["verbosity"],
+            )
+            self._seed_id_range(alias)
+
+    def _seed_id_range(self, alias):
+        """Start each sharded table's AUTOINCREMENT at the shard's own range.
+
+        Ids then stay unique across shards, so rebalancing can move rows
+        without renumbering them (and without breaking client references).
+        The default database keeps range 0 for data created before sharding.
+        """
+        start = (settings.RECIPE_SHARDS.index(alias) + 1) * SHARD_ID_RANGE
+        connection = connections[alias]
+        tables = [
+            table
+            for table in connection.introspection.table_names()
+            if table.startswith("recipe_")
+        ]
+        with connection.cursor() as cursor:
+            for table in tables:
+                cursor.execute(
+                    "SELECT seq FROM sqlite_sequence WHERE name = %s", [table]
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute(
+                        "INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)",
+                        [table, start],
+                    )
+                elif row[0] < start:
+                    cursor.execute(
+                        "UPDATE sqlite_sequence SET seq = %s WHERE name = %s",
+                        [start, table],
+                    )
@@ -0,0 +1,115 @@
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from core.routers import SHARDED_APPS, shard_for_user_id
+
+
+def sharded_models():
+    """Return (model, user lookup) pairs, user-owned models first."""
+    owned, dependent = [], []
+    for app_label in sorted(SHARDED_APPS):
+        for model in apps.get_app_config(app_label).get_models(
+            include_auto_created=True
+        ):
+            field_names = {field.name for field in model._meta.get_fields()}
+            if "user" in field_names:
+                owned.append((model, "user_id"))
+            else:
+                dependent.append(model)
+
+    owned_models = {model for model, _ in owned}
+    for model in dependent:
+        for field in model._meta.concrete_fields:
+            if field.is_relation and field.related_model in owned_models:
+                owned.append((model, f"{field.name}__user_id"))
+                break
+    return owned
+
+
+class Command(BaseCommand):
+    help = (
+        "Move users' recipe data to the shard they hash to under the current "
+        "RECIPE_SHARD_COUNT, after the number of shards changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from-count",
+            type=int,
+            required=True,
+            help="Number of shards the data is currently spread over, 0 when "
+            "it still lives on the default database.",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        new_shards = settings.RECIPE_SHARDS
+        if not new_shards:
+            raise CommandError(
+                "Sharding is disabled, set RECIPE_SHARD_COUNT to enable it."
+            )
+        old_shards = [f"shard{index}" for index in range(options["from_count"])]
+        missing = [alias for alias in old_shards if alias not in settings.DATABASES]
+        if missing:
+            raise CommandError(
+                f"{', '.join(missing)} not configured, shrinking the number of "
+                "shards is not supported."
+            )
+
+        models = sharded_models()
+        user_ids = (
+            get_user_model()
+            .objects.using(DEFAULT_DB_ALIAS)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        moved = 0
+        for user_id in user_ids.iterator():
+            source = shard_for_user_id(user_id, old_shards)
+            target = shard_for_user_id(user_id, new_shards)
+            if source == target:
+                continue
+            counts = self._move(user_id, source, target, models, options)
+            if counts:
+                moved += 1
+                self.stdout.write(
+                    f"user {user_id}: {source} -> {target} "
+                    + ", ".join(f"{n} {name}" for name, n in counts.items())
+                )
+
+        action = "would move" if options["dry_run"] else "moved"
+        self.stdout.write(self.style.SUCCESS(f"{action} {moved} users"))
+
+    def _move(self, user_id, source, target, models, options):
+        counts = {}
+        rows = []
+        for model, lookup in models:
+            objs = list(model.objects.using(source).filter(**{lookup: user_id}))
+            if objs:
+                counts[model._meta.db_table] = len(objs)
+                rows.append((model, lookup, objs))
+        if not counts or options["dry_run"]:
+            return counts
+
+        with transaction.atomic(using=target):
+            # clear leftovers of an interrupted earlier run, so it's safe
+            # to run the command again
+            for model, lookup, _ in reversed(rows):
+                model.objects.using(target).filter(**{lookup: user_id})._raw_delete(
+                    target
+                )
+            for model, _, objs in rows:
+                model.objects.using(target).bulk_create(
+                    objs, batch_size=options["batch_size"]
+                )
+
+        with transaction.atomic(using=source):
+            for model, lookup, _ in reversed(rows):
+                model.objects.using(source).filter(**{lookup: user_id})._raw_delete(
+                    source
+                )
+        return counts
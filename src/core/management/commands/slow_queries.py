@@ -0,0 +1,84 @@
+import glob
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Summarize the slow query log, worst query shapes first."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file",
+            default=settings.SLOW_QUERY_LOG_FILE,
+            help="Log file, rotated backups next to it are read too.",
+        )
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument(
+            "--plans", action="store_true", help="Show the query plan of each shape."
+        )
+
+    def handle(self, *args, **options):
+        paths = sorted(glob.glob(f"{options['file']}*"))
+        if not paths:
+            raise CommandError(f"No slow query log at {options['file']}.")
+
+        samples = {}
+        # summaries are cumulative per process, keep the latest of each
+        summaries = {}
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    key = (entry["process"], entry["shape"])
+                    if entry["type"] == "query":
+                        samples.setdefault(entry["shape"], entry)
+                        summaries.setdefault(
+                            key,
+                            {
+                                "time": entry["time"],
+                                "count": 1,
+                                "mean_ms": entry["duration_ms"],
+                                "p95_ms": entry["duration_ms"],
+                                "max_ms": entry["duration_ms"],
+                                "views": [entry["view"]] if entry["view"] else [],
+                            },
+                        )
+                    elif entry["time"] >= summaries.get(key, entry)["time"]:
+                        summaries[key] = entry
+
+        shapes = {}
+        for (_, shape), summary in summaries.items():
+            total = shapes.setdefault(
+                shape,
+                {
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "p95_ms": 0.0,
+                    "max_ms": 0.0,
+                    "views": set(),
+                },
+            )
+            total["count"] += summary["count"]
+            total["total_ms"] += summary["mean_ms"] * summary["count"]
+            # the worst process' p95, percentiles can't be merged exactly
+            total["p95_ms"] = max(total["p95_ms"], summary["p95_ms"])
+            total["max_ms"] = max(total["max_ms"], summary["max_ms"])
+            total["views"].update(summary["views"])
+
+        ranked = sorted(shapes.items(), key=lambda item: -item[1]["total_ms"])
+        for shape, total in ranked[: options["top"]]:
+            self.stdout.write(
+                f"{total['count']}x  total {total['total_ms']:.1f}ms  "
+                f"p95 {total['p95_ms']:.1f}ms  max {total['max_ms']:.1f}ms  "
+                f"{', '.join(sorted(total['views'])) or '-'}"
+            )
+            self.stdout.write(f"  {shape}")
+            sample = samples.get(shape)
+            if options["plans"] and sample and sample.get("plan"):
+                for line in sample["plan"]:
+                    self.stdout.write(f"    {line}")
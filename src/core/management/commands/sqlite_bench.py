@@ -0,0 +1,135 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.db import apply_pragmas, get_sqlite_pragmas
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrent read/write benchmark comparing SQLite's default pragmas "
+        "with the tuned SQLITE_PRAGMAS from settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument(
+            "--duration", type=float, default=5.0, help="Seconds per mode."
+        )
+        parser.add_argument(
+            "--rows", type=int, default=20000, help="Rows seeded before the run."
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print the results as JSON."
+        )
+
+    def handle(self, *args, **options):
+        results = {
+            "default": self._run({}, options),
+            "tuned": self._run(get_sqlite_pragmas(), options),
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:>8}: {result['writes_per_sec']:>9.0f} writes/s "
+                f"{result['reads_per_sec']:>9.0f} reads/s "
+                f"{result['locked_errors']:>5} locked errors"
+            )
+
+    def _connect(self, path, pragmas):
+        # same 5s wait Django uses by default, busy_timeout overrides it
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        apply_pragmas(conn.cursor(), pragmas)
+        return conn
+
+    def _run(self, pragmas, options):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.sqlite3")
+            conn = self._connect(path, pragmas)
+            conn.execute(
+                "CREATE TABLE recipe (id INTEGER PRIMARY KEY, user_id INTEGER, "
+                "title TEXT, price REAL)"
+            )
+            conn.execute("CREATE INDEX recipe_user ON recipe (user_id)")
+            conn.executemany(
+                "INSERT INTO recipe (user_id, title, price) VALUES (?, ?, ?)",
+                ((i % 100, f"Recipe {i}", i % 50) for i in range(options["rows"])),
+            )
+            conn.close()
+
+            counters = {"writes": 0, "reads": 0, "locked_errors": 0}
+            lock = threading.Lock()
+            deadline = time.monotonic() + options["duration"]
+
+            def count(key):
+                with lock:
+                    counters[key] += 1
+
+            def writer(n):
+                conn = self._connect(path, pragmas)
+                i = 0
+                while time.monotonic() < deadline:
+                    i += 1
+                    try:
+                        conn.execute("BEGIN IMMEDIATE")
+                        conn.execute(
+                            "INSERT INTO recipe (user_id, title, price) VALUES (?, ?, ?)",
+                            (n, f"Bench {n}-{i}", i % 50),
+                        )
+                        conn.execute(
+                            "UPDATE recipe SET price = price + 1 WHERE id = ?",
+                            (i % options["rows"] + 1,),
+                        )
+                        conn.execute("COMMIT")
+                        count("writes")
+                    except sqlite3.OperationalError:
+                        if conn.in_transaction:
+                            conn.execute("ROLLBACK")
+                        count("locked_errors")
+                conn.close()
+
+            def reader(n):
+                conn = self._connect(path, pragmas)
+                while time.monotonic() < deadline:
+                    try:
+                        conn.execute(
+                            "SELECT id, title, price FROM recipe WHERE user_id = ? "
+                            "ORDER BY id DESC LIMIT 50",
+                            (n % 100,),
+                        ).fetchall()
+                        count("reads")
+                    except sqlite3.OperationalError:
+                        count("locked_errors")
+                conn.close()
+
+            threads = [
+                threading.Thread(target=writer, args=(n,))
+                for n in range(options["writers"])
+            ] + [
+                threading.Thread(target=reader, args=(n,))
+                for n in range(options["readers"])
+            ]
+            started = time.monotonic()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.monotonic() - started
+
+        return {
+            "pragmas": pragmas,
+            "writes": counters["writes"],
+            "reads": counters["reads"],
+            "locked_errors": counters["locked_errors"],
+            "writes_per_sec": counters["writes"] / elapsed,
+            "reads_per_sec": counters["reads"] / elapsed,
+        }
@@ -0,0 +1,38 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database onto every configured replica file."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "replicas",
+            nargs="*",
+            help="Replica aliases to refresh, defaults to all REPLICA_DATABASES.",
+        )
+
+    def handle(self, *args, **options):
+        replicas = options["replicas"] or settings.REPLICA_DATABASES
+        if not replicas:
+            raise CommandError(
+                "No replicas configured, set SQLITE_REPLICA_PATHS to enable them."
+            )
+
+        primary = sqlite3.connect(settings.DATABASES["default"]["NAME"])
+        try:
+            for alias in replicas:
+                if alias not in settings.REPLICA_DATABASES:
+                    raise CommandError(f"{alias} is not a replica database.")
+                # the backup API gives a consistent snapshot even while the
+                # primary is being written to in WAL mode
+                replica = sqlite3.connect(settings.DATABASES[alias]["NAME"])
+                try:
+                    primary.backup(replica)
+                finally:
+                    replica.close()
+                self.stdout.write(self.style.SUCCESS(f"Synced {alias}"))
+        finally:
+            primary.close()
@@ -0,0 +1,86 @@
+import json
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils.module_loading import autodiscover_modules
+
+from core import jobs
+
+
+def run_worker(poll_interval, burst):
+    worker = jobs.Worker(poll_interval=poll_interval)
+    worker.install_signal_handlers()
+    worker.run(burst=burst)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs from the database queue in a pool of worker "
+        "processes. SIGTERM or Ctrl-C lets running jobs finish first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Worker processes, each runs one job at a time.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            help="Seconds between polls of an empty queue (JOBS_POLL_INTERVAL).",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once no job is due instead of waiting for more.",
+        )
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            help="Print queue depth and latency as JSON and exit.",
+        )
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self.stdout.write(json.dumps(jobs.queue_stats(), indent=2))
+            return
+
+        # import every app's tasks module so their tasks are registered
+        autodiscover_modules("tasks")
+        self.stderr.write(
+            f"Running {len(jobs.tasks)} tasks in {options['processes']} processes"
+        )
+        if options["processes"] == 1:
+            worker = jobs.Worker(poll_interval=options["poll_interval"])
+            worker.install_signal_handlers()
+            worker.run(burst=options["burst"])
+            return
+
+        # children must open their own database connections
+        connections.close_all()
+        # fork, so children inherit the configured Django and task registry
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(
+                target=run_worker,
+                args=(options["poll_interval"], options["burst"]),
+                name=f"worker-{index}",
+            )
+            for index in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+
+        def forward(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, forward)
+        signal.signal(signal.SIGINT, forward)
+        for process in processes:
+            process.join()
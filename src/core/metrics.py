@@ -0,0 +1,227 @@
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+# name: (type, help, buckets)
+METRICS = {
+    "http_requests_total": ("counter", "Requests handled.", None),
+    "http_request_duration_seconds": (
+        "histogram",
+        "Request latency in seconds.",
+        LATENCY_BUCKETS,
+    ),
+    "http_request_db_queries": (
+        "histogram",
+        "Database queries per request.",
+        QUERY_BUCKETS,
+    ),
+    "http_request_db_seconds_total": (
+        "counter",
+        "Time spent in database queries.",
+        None,
+    ),
+    # caches: openapi_schema (core.schema), similarity_index (recipe
+    # similarity, per process) and idempotency (stored responses replayed)
+    "cache_requests_total": ("counter", "Cache lookups by result.", None),
+    "jobs_total": ("counter", "Background jobs run by outcome.", None),
+    "job_duration_seconds": (
+        "histogram",
+        "Background job run time in seconds.",
+        JOB_BUCKETS,
+    ),
+    "job_wait_seconds": (
+        "histogram",
+        "Seconds jobs waited between being due and being claimed.",
+        JOB_BUCKETS,
+    ),
+    "feed_connections_total": ("counter", "Live feed connections opened.", None),
+    "feed_events_total": ("counter", "Live feed events sent to clients.", None),
+    "feed_subscribers_dropped_total": (
+        "counter",
+        "Live feed connections dropped for falling behind.",
+        None,
+    ),
+    "feed_events_dropped_total": (
+        "counter",
+        "Live feed events lost between processes.",
+        None,
+    ),
+    # computed from the database when scraped, see core.jobs.queue_metrics
+    "job_queue_depth": ("gauge", "Background jobs by status.", None),
+    "job_queue_due": ("gauge", "Queued jobs that are due to run.", None),
+    "job_queue_oldest_due_seconds": (
+        "gauge",
+        "Seconds the oldest due job has been waiting.",
+        None,
+    ),
+}
+
+
+class Registry:
+    """In-process metrics, labels are tuples of (name, value) pairs.
+
+    Recording is a dict update under a lock, cheap enough to do on every
+    request. With METRICS_MULTIPROCESS_DIR set, every worker periodically
+    writes its snapshot to its own file there and the metrics endpoint
+    sums the files of all workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self._last_flush = 0.0
+        self._pid = None
+        self._process_id = None
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self.counters[(name, labels)] += value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        with self._lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                # one count per bucket plus +Inf, then sum and count
+                histogram = self.histograms[(name, labels)] = [0] * (
+                    len(buckets) + 1
+                ) + [0.0, 0]
+            histogram[bisect_left(buckets, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [
+                    [name, list(labels), value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                "histograms": [
+                    [name, list(labels), list(values)]
+                    for (name, labels), values in self.histograms.items()
+                ],
+            }
+
+    def maybe_flush(self, force=False):
+        directory = settings.METRICS_MULTIPROCESS_DIR
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        if self._pid != os.getpid():
+            # set lazily to get the worker's pid when forked after import,
+            # with a suffix as pids get reused and a new process must not
+            # overwrite the file of a dead one
+            self._pid = os.getpid()
+            self._process_id = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"metrics-{self._process_id}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        # atomic, readers never see a half written file
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """Return the snapshot of this process, or of all of them summed."""
+        directory = settings.METRICS_MULTIPROCESS_DIR
+        if not directory:
+            return self.snapshot()
+
+        self.maybe_flush(force=True)
+        counters = defaultdict(float)
+        histograms = {}
+        for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in snapshot["counters"]:
+                counters[(name, _labels(labels))] += value
+            for name, labels, values in snapshot["histograms"]:
+                key = (name, _labels(labels))
+                if key in histograms:
+                    histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+                else:
+                    histograms[key] = values
+        return {
+            "counters": [
+                [name, list(labels), value]
+                for (name, labels), value in counters.items()
+            ],
+            "histograms": [
+                [name, list(labels), values]
+                for (name, labels), values in histograms.items()
+            ],
+        }
+
+
+def _labels(pairs):
+    return tuple(tuple(pair) for pair in pairs)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in pairs
+    )
+    return "{" + body + "}"
+
+
+def render_prometheus(snapshot):
+    """Render a snapshot in the Prometheus text exposition format."""
+    series = defaultdict(list)
+    for name, labels, value in sorted(snapshot["counters"]):
+        series[name].append(f"{name}{_format_labels(labels)} {value:g}")
+    for name, labels, values in sorted(
+        snapshot["histograms"], key=lambda item: item[:2]
+    ):
+        buckets = METRICS[name][2]
+        cumulative = 0
+        for bound, count in zip(list(buckets) + ["+Inf"], values):
+            cumulative += count
+            le = bound if bound == "+Inf" else f"{bound:g}"
+            series[name].append(
+                f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}"
+            )
+        series[name].append(f"{name}_sum{_format_labels(labels)} {values[-2]:g}")
+        series[name].append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+
+    lines = []
+    for name in sorted(series):
+        kind, help_text, _ = METRICS[name]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(series[name])
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def record_cache_lookup(cache_name, hit):
+    """Count a cache hit or miss, for cache hit ratios."""
+    if settings.METRICS_ENABLED:
+        registry.inc(
+            "cache_requests_total",
+            (("cache", cache_name), ("result", "hit" if hit else "miss")),
+        )
@@ -0,0 +1,161 @@
+import cProfile
+import hmac
+import os
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import registry
+from .nplusone import detect_n_plus_one, should_detect
+from .profiling import (
+    RequestTimings,
+    current_timings,
+    instrument_serializers,
+    view_label,
+)
+from .slowlog import current_view, slow_query_log
+
+
+class ProfilingMiddleware:
+    """Report where a request's time went in a Server-Timing header.
+
+    Measures DB time and query count, serializer to_representation time
+    and response rendering time. For PROFILING_SAMPLE_RATE of requests, or
+    when the PROFILING_HEADER carries PROFILING_TOKEN, the request is also
+    run under cProfile and the stats are dumped to PROFILING_DIR as
+    "<View>.<action>-<timestamp>-<pid>.prof".
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_serializers()
+
+    def __call__(self, request):
+        if not settings.PROFILING_ENABLED:
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        request._profiling_timings = timings
+        token = current_timings.set(timings)
+        profiler = cProfile.Profile() if self._should_profile(request) else None
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.execute_wrapper)
+                    )
+                if profiler is not None:
+                    try:
+                        profiler.enable()
+                    except ValueError:
+                        # another profiler is running in this process
+                        profiler = None
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            current_timings.reset(token)
+
+        response["Server-Timing"] = timings.server_timing()
+        if profiler is not None:
+            self._dump(profiler, request)
+        return response
+
+    def process_template_response(self, request, response):
+        # called right before DRF Responses are rendered
+        timings = getattr(request, "_profiling_timings", None)
+        if timings is not None:
+            timings.start_render()
+            response.add_post_render_callback(timings.end_render)
+        return response
+
+    def _should_profile(self, request):
+        token = settings.PROFILING_TOKEN
+        header = request.headers.get(settings.PROFILING_HEADER)
+        if token and header and hmac.compare_digest(header, token):
+            return True
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def _dump(self, profiler, request):
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        filename = f"{view_label(request)}-{time.time() * 1000:.0f}-{os.getpid()}.prof"
+        profiler.dump_stats(os.path.join(settings.PROFILING_DIR, filename))
+
+
+class MetricsMiddleware:
+    """Record request count, status and latency per view and action.
+
+    Sits in front of ProfilingMiddleware and reuses its DB timings, so
+    queries are only wrapped once.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        view, _, action = view_label(request).partition(".")
+        labels = (("view", view), ("action", action or request.method.lower()))
+        registry.inc(
+            "http_requests_total",
+            labels
+            + (("method", request.method), ("status", str(response.status_code))),
+        )
+        registry.observe("http_request_duration_seconds", labels, elapsed)
+        timings = getattr(request, "_profiling_timings", None)
+        if timings is not None:
+            registry.observe("http_request_db_queries", labels, timings.queries)
+            registry.inc("http_request_db_seconds_total", labels, timings.db)
+        registry.maybe_flush()
+        return response
+
+
+class NPlusOneMiddleware:
+    """Flag queries repeated more than N_PLUS_ONE_THRESHOLD times in a request.
+
+    N_PLUS_ONE_MODE is "warn" in development, "raise" under tests and
+    "log" for a N_PLUS_ONE_SAMPLE_RATE sample of production requests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_detect():
+            return self.get_response(request)
+        with detect_n_plus_one(label=lambda: view_label(request)):
+            return self.get_response(request)
+
+
+class SlowQueryLogMiddleware:
+    """Tag slow query log entries with the view and action that ran them.
+
+    The statements themselves are timed on every connection by
+    core.slowlog, this only provides the label and writes the periodic
+    summaries when no slow query came along to do it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SLOW_QUERY_LOG_ENABLED:
+            return self.get_response(request)
+        token = current_view.set(lambda: view_label(request))
+        try:
+            return self.get_response(request)
+        finally:
+            current_view.reset(token)
+            slow_query_log.maybe_write_summary()
@@ -0,0 +1,55 @@
+from rest_framework.permissions import SAFE_METHODS
+
+from .routers import is_pinned, pin_to_primary, read_from_replica, use_user_shard
+
+
+class UserShardMixin:
+    """Send the view's recipe queries to the authenticated user's shard."""
+
+    _shard_context = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._shard_context = use_user_shard(request.user)
+        self._shard_context.__enter__()
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # also on unhandled exceptions, where finalize_response is skipped
+            if self._shard_context is not None:
+                self._shard_context.__exit__(None, None, None)
+                self._shard_context = None
+
+
+class ReplicaReadMixin:
+    """Serve safe methods from a read replica, unless the user just wrote.
+
+    Any successful unsafe request pins the user to the primary for
+    READ_YOUR_WRITES_WINDOW seconds so they always see their own writes.
+    """
+
+    _replica_context = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not is_pinned(request.user):
+            self._replica_context = read_from_replica()
+            self._replica_context.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            # the window starts once the write is committed, failed
+            # requests wrote nothing to read back
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # also on unhandled exceptions, where finalize_response is skipped
+            if self._replica_context is not None:
+                self._replica_context.__exit__(None, None, None)
+                self._replica_context = None
@@ -1,3 +1,107 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
 
-# Create your models here.
+
+class Job(models.Model):
+    """A background job stored in the database (see core.jobs)."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+    # dotted name the task was registered under with core.jobs.task
+    name = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict)
+    # higher runs first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    # not run before this time, pushed back on every retry
+    run_at = models.DateTimeField()
+    # a running job whose lease expired is claimed again by another worker
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    # enqueueing twice with the same key returns the first job
+    idempotency_key = models.CharField(
+        max_length=255, null=True, blank=True, unique=True
+    )
+    last_error = models.TextField(blank=True)
+    # set by the task with core.jobs.report_progress while it runs
+    progress = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the claim query: due queued jobs by priority
+            models.Index(
+                fields=["-priority", "run_at"],
+                name="job_queued_idx",
+                condition=Q(status="queued"),
+            ),
+            # running jobs by lease expiry, to reclaim them
+            models.Index(
+                fields=["locked_until"],
+                name="job_running_idx",
+                condition=Q(status="running"),
+            ),
+            # purging finished jobs
+            models.Index(fields=["status", "finished_at"], name="job_finished_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """The response to a request sent with an Idempotency-Key header.
+
+    See core.idempotency. status_code is null while the first request
+    with the key is still running.
+    """
+
+    # whose key it is, e.g. "user:42", so keys of different users never clash
+    scope = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    # method, path and body of the first request, a retry must match it
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True)
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "key"], name="idempotency_key_unique"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
+
+
+class PrimaryPin(models.Model):
+    """Until when a user's reads stay on the primary, see core.routers.
+
+    A row on the primary rather than a cache entry, so a write served by
+    one worker pins the reads every other worker serves.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, primary_key=True, on_delete=models.CASCADE
+    )
+    until = models.DateTimeField()
+
+    def __str__(self):
+        return f"user {self.user_id} until {self.until}"
@@ -0,0 +1,151 @@
+import logging
+import random
+import re
+import sys
+import traceback
+import warnings
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.fields import Field
+
+logger = logging.getLogger(__name__)
+
+_current_detector = ContextVar("n_plus_one_detector", default=None)
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+
+class NPlusOneError(Exception):
+    """Raised in "raise" mode when a query repeats too often."""
+
+
+class NPlusOneWarning(UserWarning):
+    """Emitted in "warn" mode when a query repeats too often."""
+
+
+def fingerprint(sql):
+    """Normalize a statement so queries differing only in parameters match.
+
+    Django already passes parameters separately, this also folds literals
+    and IN lists of any length into a single placeholder.
+    """
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    return _IN_LIST.sub("IN (...)", sql)
+
+
+def _serializer_field():
+    """Return "Serializer.field" currently being serialized, if any.
+
+    DRF's Serializer.to_representation loops over its fields with a local
+    named "field", so the innermost such frame tells which one triggered
+    the query.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_name == "to_representation":
+            field = frame.f_locals.get("field")
+            owner = frame.f_locals.get("self")
+            if isinstance(field, Field) and owner is not None:
+                return f"{type(owner).__name__}.{field.field_name}"
+        frame = frame.f_back
+    return None
+
+
+def _project_stack():
+    """Return the stack frames that belong to this project's code."""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame
+        for frame in traceback.extract_stack()[:-3]
+        if frame.filename.startswith(base_dir)
+        and "site-packages" not in frame.filename
+        and not frame.filename.endswith(("nplusone.py", "slowlog.py"))
+    ]
+    return "".join(traceback.format_list(frames[-8:]))
+
+
+class NPlusOneDetector:
+    """Count query fingerprints and report any that repeat too often.
+
+    mode is "warn" (warnings + log), "raise" (NPlusOneError at the query
+    that crosses the threshold) or "log" (log only).
+    """
+
+    def __init__(self, label, mode=None, threshold=None):
+        self.label = label
+        self.mode = mode or settings.N_PLUS_ONE_MODE
+        self.threshold = threshold or settings.N_PLUS_ONE_THRESHOLD
+        self.counts = Counter()
+        self.findings = []
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        key = fingerprint(sql)
+        self.counts[key] += 1
+        if self.counts[key] == self.threshold + 1:
+            self._report(key)
+        return execute(sql, params, many, context)
+
+    def _report(self, key):
+        finding = {
+            "query": key,
+            "threshold": self.threshold,
+            # a callable when the view isn't resolved yet at creation
+            "view": self.label() if callable(self.label) else self.label,
+            "serializer_field": _serializer_field(),
+            "stack": _project_stack(),
+        }
+        self.findings.append(finding)
+        message = (
+            f"Possible N+1 in {finding['view']}: query ran more than "
+            f"{self.threshold} times"
+            + (
+                f" while serializing {finding['serializer_field']}"
+                if finding["serializer_field"]
+                else ""
+            )
+            + f"\n  {key}\n{finding['stack']}"
+        )
+        if self.mode == "raise":
+            raise NPlusOneError(message)
+        if self.mode == "warn":
+            warnings.warn(message, NPlusOneWarning, stacklevel=2)
+        logger.warning(message)
+
+
+@contextmanager
+def detect_n_plus_one(label="", mode=None, threshold=None):
+    """Detect repeated queries inside the block, on every database.
+
+    Usable in tests:
+
+        with detect_n_plus_one(mode="raise"):
+            self.client.get(RECIPE_LIST)
+    """
+    detector = NPlusOneDetector(label, mode=mode, threshold=threshold)
+    token = _current_detector.set(detector)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(detector.execute_wrapper)
+                )
+            yield detector
+    finally:
+        _current_detector.reset(token)
+
+
+def should_detect():
+    """Whether to watch the current request, "log" mode is sampled."""
+    mode = settings.N_PLUS_ONE_MODE
+    if mode == "off" or _current_detector.get() is not None:
+        return False
+    if mode == "log":
+        return random.random() < settings.N_PLUS_ONE_SAMPLE_RATE
+    return True
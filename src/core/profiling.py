@@ -0,0 +1,99 @@
+import time
+from contextvars import ContextVar
+
+from rest_framework import serializers
+
+# RequestTimings of the request being handled, if it is being profiled
+current_timings = ContextVar("current_timings", default=None)
+
+
+def view_label(request):
+    """Return "ViewName.action" for the view that handled the request.
+
+    e.g. "RecipeViewSet.list" or "RecipeViewSet.upload_image" for viewsets,
+    "CreateUserView.post" for class based views and the function name for
+    plain function views.
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    func = match.func
+    method = request.method.lower()
+    cls = getattr(func, "cls", None) or getattr(func, "view_class", None)
+    if cls is None:
+        return getattr(func, "__name__", match.view_name)
+    actions = getattr(func, "actions", None)
+    if actions:
+        return f"{cls.__name__}.{actions.get(method, method)}"
+    return f"{cls.__name__}.{method}"
+
+
+class RequestTimings:
+    """Time spent in each phase of one request, in seconds."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db = 0.0
+        self.queries = 0
+        self.serialize = 0.0
+        self.render = 0.0
+        self._serialize_depth = 0
+        self._render_started = None
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """connection.execute_wrapper() hook timing every query."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def start_render(self):
+        self._render_started = time.perf_counter()
+
+    def end_render(self, response=None):
+        if self._render_started is not None:
+            self.render += time.perf_counter() - self._render_started
+            self._render_started = None
+
+    def server_timing(self):
+        """Return the value of the Server-Timing header (durations in ms)."""
+        total = time.perf_counter() - self.started
+        return ", ".join(
+            [
+                f'db;dur={self.db * 1000:.2f};desc="{self.queries} queries"',
+                f"serialize;dur={self.serialize * 1000:.2f}",
+                f"render;dur={self.render * 1000:.2f}",
+                f"total;dur={total * 1000:.2f}",
+            ]
+        )
+
+
+def _timed(to_representation):
+    def wrapper(self, instance):
+        timings = current_timings.get()
+        if timings is None or timings._serialize_depth:
+            # not profiled, or nested inside an outer serializer already timed
+            return to_representation(self, instance)
+        timings._serialize_depth += 1
+        started = time.perf_counter()
+        try:
+            return to_representation(self, instance)
+        finally:
+            timings.serialize += time.perf_counter() - started
+            timings._serialize_depth -= 1
+
+    wrapper.profiled = True
+    return wrapper
+
+
+def instrument_serializers():
+    """Time to_representation of every DRF serializer.
+
+    DRF has no hook for this, so the two base implementations are wrapped
+    once. This costs one ContextVar lookup per call when not profiling.
+    """
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.to_representation, "profiled", False):
+            cls.to_representation = _timed(cls.to_representation)
@@ -0,0 +1,182 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .models import PrimaryPin
+
+# set for the duration of a request that may be served from a replica
+_read_from_replica = ContextVar("read_from_replica", default=False)
+
+# id of the user whose shard unhinted recipe queries should go to
+_shard_user_id = ContextVar("shard_user_id", default=None)
+
+# apps whose tables live on the user shards when sharding is enabled
+SHARDED_APPS = {"recipe"}
+
+# each shard hands out primary keys from its own range so rows keep
+# their ids when a user is moved to another shard
+SHARD_ID_RANGE = 2**40
+
+
+def _pins_enabled(user):
+    # without replicas every read is on the primary anyway
+    return (
+        getattr(settings, "READ_YOUR_WRITES_WINDOW", 0)
+        and getattr(settings, "REPLICA_DATABASES", [])
+        and user.is_authenticated
+    )
+
+
+def pin_to_primary(user):
+    """Send the user's reads to the primary for READ_YOUR_WRITES_WINDOW seconds.
+
+    The pin is a PrimaryPin row on the primary, seen by every worker.
+    """
+    if not _pins_enabled(user):
+        return
+    until = timezone.now() + timedelta(seconds=settings.READ_YOUR_WRITES_WINDOW)
+    PrimaryPin.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+        [PrimaryPin(user_id=user.pk, until=until)],
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["until"],
+    )
+
+
+def is_pinned(user):
+    if not _pins_enabled(user):
+        return False
+    return (
+        PrimaryPin.objects.using(DEFAULT_DB_ALIAS)
+        .filter(user_id=user.pk, until__gt=timezone.now())
+        .exists()
+    )
+
+
+@contextmanager
+def read_from_replica(enabled=True):
+    """Allow reads inside the block to be served from a replica."""
+    token = _read_from_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+def jump_hash(key, buckets):
+    """Jump consistent hash: adding a shard only moves 1/N of the keys."""
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def shard_for_user_id(user_id, shards=None):
+    """Return the shard alias holding a user's recipe data."""
+    if shards is None:
+        shards = settings.RECIPE_SHARDS
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    return shards[jump_hash(int(user_id), len(shards))]
+
+
+@contextmanager
+def use_user_shard(user):
+    """Send unhinted queries on sharded models to the user's shard."""
+    token = _shard_user_id.set(user.pk if user.is_authenticated else None)
+    try:
+        yield
+    finally:
+        _shard_user_id.reset(token)
+
+
+@contextmanager
+def atomic_for_user(user):
+    """Open a transaction on the database holding the user's recipe data."""
+    with use_user_shard(user), transaction.atomic(using=shard_for_user_id(user.pk)):
+        yield
+
+
+class UserShardRouter:
+    """Route recipe data to one of RECIPE_SHARDS by hashing the user id.
+
+    The user is taken from the "user" hint, the instance being saved or
+    queried through, or use_user_shard() for plain queryset calls. Auth
+    and user tables always stay on the default database.
+    """
+
+    def _shard(self, model, hints):
+        shards = getattr(settings, "RECIPE_SHARDS", [])
+        if not shards or model._meta.app_label not in SHARDED_APPS:
+            return None
+
+        user = hints.get("user")
+        instance = hints.get("instance")
+        if user is not None:
+            user_id = user.pk
+        elif instance is not None and instance._state.db in shards:
+            # loaded from (or saved to) a shard already
+            return instance._state.db
+        elif isinstance(instance, get_user_model()):
+            user_id = instance.pk
+        elif getattr(instance, "user_id", None) is not None:
+            user_id = instance.user_id
+        else:
+            user_id = _shard_user_id.get()
+
+        if user_id is None:
+            return None
+        return shard_for_user_id(user_id, shards)
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        shards = getattr(settings, "RECIPE_SHARDS", [])
+        if db in shards:
+            return app_label in SHARDED_APPS
+        # sharded apps keep (empty) tables on the default database too, so
+        # deleting a user there still finds nothing to cascade to
+        return None
+
+
+class PrimaryReplicaRouter:
+    """Route writes to the primary and opted-in reads to a random replica.
+
+    Reads only leave the primary inside read_from_replica(), which the
+    recipe viewsets enter for safe methods, so everything else (auth,
+    admin, management commands) keeps reading its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, "REPLICA_DATABASES", [])
+        if not replicas or not _read_from_replica.get():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas are copies of the primary, so objects are interchangeable
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary when they are synced
+        return db not in getattr(settings, "REPLICA_DATABASES", [])
@@ -0,0 +1,112 @@
+import functools
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import drf_spectacular
+from django.conf import settings
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+from .metrics import record_cache_lookup
+
+# format: renderer, the other renderers of SpectacularAPIView produce the
+# same bytes under another media type
+RENDERERS = {"yaml": OpenApiYamlRenderer, "json": OpenApiJsonRenderer}
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class RenderedSchema:
+    def __init__(self, content):
+        self.content = content
+        self.etag = '"{}"'.format(hashlib.sha256(content).hexdigest()[:32])
+
+
+@functools.cache
+def _source_hash():
+    """Hash of every Python file of the project, computed once per process."""
+    digest = hashlib.sha256()
+    base_dir = Path(settings.BASE_DIR)
+    for path in sorted(base_dir.rglob("*.py")):
+        relative = path.relative_to(base_dir)
+        if relative.parts[0] in ("venv", ".venv", "node_modules"):
+            continue
+        digest.update(str(relative).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def code_version():
+    """Version the schema is cached under.
+
+    CODE_VERSION when set (e.g. the git commit, set at deploy time),
+    otherwise a hash of the project's source. Either way combined with
+    the schema settings and drf-spectacular version, which change the
+    output too.
+    """
+    digest = hashlib.sha256()
+    digest.update((settings.CODE_VERSION or _source_hash()).encode())
+    digest.update(repr(sorted(settings.SPECTACULAR_SETTINGS.items())).encode())
+    digest.update(drf_spectacular.__version__.encode())
+    return digest.hexdigest()[:16]
+
+
+def generate():
+    """Generate the schema like SpectacularAPIView does, without a request."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS(
+        urlconf=spectacular_settings.SERVE_URLCONF
+    )
+    return generator.get_schema(request=None, public=spectacular_settings.SERVE_PUBLIC)
+
+
+def _path(version, fmt):
+    return os.path.join(settings.SCHEMA_CACHE_DIR, f"schema-{version}.{fmt}")
+
+
+def build(version=None):
+    """Generate and write the schema in every format, returns the paths."""
+    version = version or code_version()
+    data = generate()
+    os.makedirs(settings.SCHEMA_CACHE_DIR, exist_ok=True)
+    paths = []
+    for fmt, renderer in RENDERERS.items():
+        path = _path(version, fmt)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(renderer().render(data, renderer_context={}))
+        # atomic, other workers never read a half written file
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def get(fmt):
+    """Return the RenderedSchema of the current code version.
+
+    Served from memory, loaded from SCHEMA_CACHE_DIR on first use (where
+    "manage.py build_schema" puts it at deploy time) and only generated
+    when no file exists for this version yet.
+    """
+    version = code_version()
+    key = (version, fmt)
+    rendered = _cache.get(key)
+    if rendered is not None:
+        record_cache_lookup("openapi_schema", True)
+        return rendered
+    with _lock:
+        # another thread may have loaded it while this one waited
+        record_cache_lookup("openapi_schema", key in _cache)
+        if key not in _cache:
+            path = _path(version, fmt)
+            if not os.path.exists(path):
+                build(version)
+            with open(path, "rb") as f:
+                _cache[key] = RenderedSchema(f.read())
+        return _cache[key]
+
+
+def clear():
+    _cache.clear()
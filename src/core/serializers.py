@@ -0,0 +1,40 @@
+from django.conf import settings
+from rest_framework import serializers
+
+
+class SubRequestSerializer(serializers.Serializer):
+    """One API call inside a batch."""
+
+    id = serializers.CharField(
+        required=False, help_text="Echoed back in the matching response."
+    )
+    method = serializers.ChoiceField(["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE"])
+    path = serializers.RegexField(r"^/", help_text="e.g. /api/recipe/tags/")
+    query = serializers.DictField(required=False)
+    headers = serializers.DictField(child=serializers.CharField(), required=False)
+    body = serializers.JSONField(required=False)
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    requests = SubRequestSerializer(many=True)
+
+    def validate_requests(self, value):
+        if not value:
+            raise serializers.ValidationError("At least one request is required.")
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f"At most {settings.BATCH_MAX_REQUESTS} requests per batch."
+            )
+        return value
+
+
+class SubResponseSerializer(serializers.Serializer):
+    id = serializers.CharField(allow_null=True)
+    status = serializers.IntegerField()
+    body = serializers.JSONField(allow_null=True)
+    duration_ms = serializers.FloatField()
+
+
+class BatchResponseSerializer(serializers.Serializer):
+    responses = SubResponseSerializer(many=True)
+    duration_ms = serializers.FloatField()
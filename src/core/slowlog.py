@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+
+from .nplusone import fingerprint
+
+# "View.action" label, or a callable returning it, of the current request
+current_view = ContextVar("slow_query_view", default=None)
+
+# statements EXPLAIN makes sense for
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+# durations kept per query shape to compute percentiles
+_SAMPLES = 1000
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non empty sequence."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def explain(connection, sql, params):
+    """Return the query plan of a statement as a list of indented lines.
+
+    Runs on a raw cursor of the same connection, so the other execute
+    wrappers (profiling, N+1 detection, this log) don't see the EXPLAIN
+    and the cursor of the original query keeps its results.
+    """
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(prefix + sql, params or ())
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if connection.vendor != "sqlite":
+        return [str(row[0]) for row in rows]
+
+    # rows are (id, parent, notused, detail), indent children like the
+    # sqlite3 shell does
+    depths = {}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depths[node_id] = depths.get(parent, -1) + 1
+        lines.append("  " * depths[node_id] + detail)
+    return lines
+
+
+class SlowQueryLog:
+    """Log statements slower than SLOW_QUERY_THRESHOLD_MS to a JSONL file.
+
+    The first occurrence of every query shape (see nplusone.fingerprint) in
+    a process is written with its parameters, view and query plan. Later
+    ones are only counted, and every SLOW_QUERY_SUMMARY_INTERVAL seconds a
+    "summary" line per shape seen since the last one is written with the
+    count and p95 / max durations so far in this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger("core.slowlog.file")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._handler = None
+        self._path = None
+        self._pid = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.shapes = {}
+            self._dirty = set()
+            self._last_summary = time.monotonic()
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """connection.execute_wrapper() hook timing every statement."""
+        if not settings.SLOW_QUERY_LOG_ENABLED:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms >= settings.SLOW_QUERY_THRESHOLD_MS:
+            self.record(context["connection"], sql, params, many, duration_ms)
+        return result
+
+    def record(self, connection, sql, params, many, duration_ms):
+        label = current_view.get()
+        view = label() if callable(label) else label
+        shape = fingerprint(sql)
+        with self._lock:
+            stats = self.shapes.get(shape)
+            first = stats is None
+            if first:
+                stats = self.shapes[shape] = {
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "samples": deque(maxlen=_SAMPLES),
+                    "views": set(),
+                }
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["samples"].append(duration_ms)
+            if view:
+                stats["views"].add(view)
+            self._dirty.add(shape)
+
+        if first:
+            entry = {
+                "type": "query",
+                "db": connection.alias,
+                "view": view,
+                "duration_ms": round(duration_ms, 3),
+                "shape": shape,
+                "sql": sql,
+                # executemany() params are a list of parameter sets
+                "params": list(params) if params is not None and not many else None,
+            }
+            if not many and not connection.needs_rollback:
+                try:
+                    entry["plan"] = explain(connection, sql, params)
+                except Exception as exc:
+                    entry["plan_error"] = str(exc)
+            self._write(entry)
+        self.maybe_write_summary()
+
+    def maybe_write_summary(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not self._dirty or (
+                not force
+                and now - self._last_summary < settings.SLOW_QUERY_SUMMARY_INTERVAL
+            ):
+                return
+            self._last_summary = now
+            summaries = [
+                {
+                    "type": "summary",
+                    "shape": shape,
+                    "count": stats["count"],
+                    "mean_ms": round(stats["total_ms"] / stats["count"], 3),
+                    "p95_ms": round(percentile(stats["samples"], 0.95), 3),
+                    "max_ms": round(stats["max_ms"], 3),
+                    "views": sorted(stats["views"]),
+                }
+                for shape, stats in self.shapes.items()
+                if shape in self._dirty
+            ]
+            self._dirty.clear()
+        for summary in summaries:
+            self._write(summary)
+
+    def _write(self, entry):
+        path = settings.SLOW_QUERY_LOG_FILE
+        if not path:
+            return
+        if self._pid != os.getpid():
+            # the counts are per process, the reader sums the processes
+            self._pid = os.getpid()
+            self._process_id = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "process": self._process_id,
+            **entry,
+        }
+        with self._lock:
+            if path != self._path:
+                self._open(path)
+        self._logger.info(json.dumps(entry, default=str))
+
+    def _open(self, path):
+        if self._handler is not None:
+            self._logger.removeHandler(self._handler)
+            self._handler.close()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._handler = RotatingFileHandler(
+            path,
+            maxBytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+            backupCount=settings.SLOW_QUERY_LOG_BACKUP_COUNT,
+            delay=True,
+        )
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self._logger.addHandler(self._handler)
+        self._path = path
+
+
+slow_query_log = SlowQueryLog()
+
+
+def install_slow_query_log(sender, connection, **kwargs):
+    """Wrap every statement of every new connection, requests or not."""
+    if slow_query_log.execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_log.execute_wrapper)
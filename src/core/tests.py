@@ -1,3 +1,1056 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from recipe import similarity
+from recipe.models import Recipe, Tag
+from . import batch, broker, idempotency, jobs, routers, schema
+from .admin import AFTER_VAR, estimated_count, table_estimate
+from .db import apply_pragmas, get_sqlite_pragmas
+from .metrics import record_cache_lookup, registry
+from .mixins import ReplicaReadMixin, UserShardMixin
+from .models import IdempotencyKey, Job, PrimaryPin
+from .nplusone import NPlusOneError, detect_n_plus_one, fingerprint
+from .routers import (
+    SHARD_ID_RANGE,
+    PrimaryReplicaRouter,
+    UserShardRouter,
+    is_pinned,
+    jump_hash,
+    read_from_replica,
+    shard_for_user_id,
+    use_user_shard,
+)
+from .slowlog import percentile, slow_query_log
 
 # Create your tests here.
+
+
+class SQLitePragmaTests(TestCase):
+    """Test the SQLite connection tuning layer."""
+
+    def _pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        # synchronous=NORMAL is 1, temp_store=MEMORY is 2
+        self.assertEqual(self._pragma("synchronous"), 1)
+        self.assertEqual(self._pragma("temp_store"), 2)
+        self.assertEqual(self._pragma("busy_timeout"), 5000)
+
+    @override_settings(SQLITE_PRAGMAS={"synchronous": "", "cache_size": "-2000"})
+    def test_empty_values_are_skipped(self):
+        self.assertEqual(get_sqlite_pragmas(), {"cache_size": "-2000"})
+
+    def test_invalid_value_rejected(self):
+        with connection.cursor() as cursor:
+            with self.assertRaises(ValueError):
+                apply_pragmas(cursor, {"synchronous": "off; DROP TABLE x"})
+
+
+@override_settings(REPLICA_DATABASES=["replica1"])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    """Test read/write routing between the primary and replicas."""
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def test_reads_use_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(Recipe), "default")
+
+    def test_reads_use_replica_when_allowed(self):
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(Recipe), "replica1")
+            self.assertEqual(self.router.db_for_write(Recipe), "default")
+
+    def test_no_migrations_on_replicas(self):
+        self.assertFalse(self.router.allow_migrate("replica1", "recipe"))
+        self.assertTrue(self.router.allow_migrate("default", "recipe"))
+
+
+# the primary stands in for a replica, a test can't add database aliases
+@override_settings(REPLICA_DATABASES=["default"])
+class ReadYourWritesTests(TestCase):
+    """Test users are pinned to the primary after writing."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_write_pins_user(self):
+        tag = Tag.objects.create(user=self.user, title="Vegan")
+        self.client.get(reverse("recipe:tag-list"))
+        self.assertFalse(is_pinned(self.user))
+
+        url = reverse("recipe:tag-detail", args=[tag.id])
+        self.client.patch(url, {"title": "Vegetarian"})
+        self.assertTrue(is_pinned(self.user))
+        # stored on the primary, so other workers see it too
+        self.assertTrue(PrimaryPin.objects.filter(user=self.user).exists())
+
+        with mock.patch(
+            "django.utils.timezone.now",
+            return_value=timezone.now() + timedelta(seconds=60),
+        ):
+            self.assertFalse(is_pinned(self.user))
+
+    def test_failed_write_does_not_pin(self):
+        response = self.client.post(reverse("recipe:recipe-list"), {"title": ""})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(is_pinned(self.user))
+
+    @override_settings(READ_YOUR_WRITES_WINDOW=0)
+    def test_window_can_be_disabled(self):
+        self.client.post(
+            reverse("recipe:recipe-list"),
+            {"title": "Soup", "time_minutes": 5, "price": "2.00"},
+        )
+        self.assertFalse(is_pinned(self.user))
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_no_pins_without_replicas(self):
+        self.client.post(
+            reverse("recipe:recipe-list"),
+            {"title": "Soup", "time_minutes": 5, "price": "2.00"},
+        )
+        self.assertFalse(PrimaryPin.objects.exists())
+
+
+class _FailingView(ReplicaReadMixin, UserShardMixin, APIView):
+    permission_classes = []
+    # routing in effect while handling each request
+    seen = []
+
+    def get(self, request):
+        self.seen.append(
+            (routers._read_from_replica.get(), routers._shard_user_id.get())
+        )
+        raise RuntimeError("boom")
+
+
+@override_settings(REPLICA_DATABASES=["default"])
+class MixinContextTests(TestCase):
+    """Test the view mixins don't leak their routing to the next request."""
+
+    def test_context_reset_after_unhandled_exception(self):
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user)
+
+        with self.assertRaises(RuntimeError):
+            _FailingView.as_view()(request)
+
+        self.assertEqual(_FailingView.seen, [(True, user.pk)])
+        self.assertFalse(routers._read_from_replica.get())
+        self.assertIsNone(routers._shard_user_id.get())
+
+
+@override_settings(RECIPE_SHARDS=["shard0", "shard1", "shard2"])
+class UserShardRouterTests(SimpleTestCase):
+    """Test routing recipe data to user shards."""
+
+    def setUp(self):
+        self.router = UserShardRouter()
+        self.user = get_user_model()(pk=42, email="user@example.com")
+
+    def test_jump_hash_moves_few_keys(self):
+        moved = sum(jump_hash(key, 3) != jump_hash(key, 4) for key in range(1000))
+        # ideally 1/4 of the keys move when going from 3 to 4 buckets
+        self.assertLess(moved, 300)
+        self.assertEqual(jump_hash(42, 3), jump_hash(42, 3))
+
+    def test_recipe_models_follow_user(self):
+        expected = f"shard{jump_hash(42, 3)}"
+        self.assertEqual(self.router.db_for_write(Recipe, user=self.user), expected)
+        recipe = Recipe(user_id=42)
+        self.assertEqual(self.router.db_for_read(Tag, instance=recipe), expected)
+        with use_user_shard(self.user):
+            self.assertEqual(self.router.db_for_read(Tag), expected)
+
+    def test_user_tables_stay_on_default(self):
+        self.assertIsNone(self.router.db_for_read(get_user_model(), user=self.user))
+        self.assertFalse(self.router.allow_migrate("shard0", "user"))
+        self.assertTrue(self.router.allow_migrate("shard0", "recipe"))
+
+
+class ShardedRecipeTests(TestCase):
+    """Test recipe data on real shard databases.
+
+    Two SQLite shards are added next to the test database for this class
+    only, the settings can't declare them without sharding every test.
+    """
+
+    shards = ["shard0", "shard1"]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        for alias in cls.shards:
+            default = connections.settings[DEFAULT_DB_ALIAS]
+            # the same dict as settings.DATABASES
+            connections.settings[alias] = {
+                **default,
+                "NAME": os.path.join(cls.directory.name, f"{alias}.sqlite3"),
+                "TEST": {**default["TEST"], "NAME": None, "MIRROR": None},
+            }
+        cls.sharding = override_settings(RECIPE_SHARDS=cls.shards)
+        cls.sharding.enable()
+        call_command("migrate_shards", verbosity=0, stdout=StringIO())
+        # only now, the test runner would try to create them itself
+        cls.databases = {DEFAULT_DB_ALIAS, *cls.shards}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.sharding.disable()
+        for alias in cls.shards:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.directory.cleanup()
+
+    def _user(self, email):
+        return get_user_model().objects.create_user(email=email, password="pw123456")
+
+    def _counts(self, model):
+        return {
+            alias: model.objects.using(alias).count()
+            for alias in (DEFAULT_DB_ALIAS, *self.shards)
+        }
+
+    def test_create_and_list_on_user_shard(self):
+        user = self._user("user@example.com")
+        shard = shard_for_user_id(user.pk)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.post(
+            reverse("recipe:recipe-list"),
+            {
+                "title": "Soup",
+                "time_minutes": 5,
+                "price": "2.00",
+                "tags": [{"title": "Dinner"}],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self._counts(Recipe)[shard], 1)
+        self.assertEqual(sum(self._counts(Recipe).values()), 1)
+        self.assertEqual(Tag.objects.using(shard).get().title, "Dinner")
+        # ids come from the shard's own range
+        self.assertGreaterEqual(
+            response.data["id"], (self.shards.index(shard) + 1) * SHARD_ID_RANGE
+        )
+
+        response = client.get(reverse("recipe:recipe-list"))
+        self.assertEqual([r["title"] for r in response.data], ["Soup"])
+        response = client.get(reverse("recipe:recipe-stats"))
+        self.assertEqual(response.data["recipe_count"], 1)
+
+    def test_rebalance_moves_unsharded_data(self):
+        users = [self._user(f"user{i}@example.com") for i in range(4)]
+        with override_settings(RECIPE_SHARDS=[]):
+            for user in users:
+                recipe = Recipe.objects.create(
+                    user=user, title="Soup", time_minutes=5, price="2.00"
+                )
+                recipe.tags.add(Tag.objects.create(user=user, title="Dinner"))
+        self.assertEqual(self._counts(Recipe)[DEFAULT_DB_ALIAS], 4)
+
+        call_command("rebalance_shards", "--from-count", "0", stdout=StringIO())
+
+        self.assertEqual(self._counts(Recipe)[DEFAULT_DB_ALIAS], 0)
+        for user in users:
+            shard = shard_for_user_id(user.pk)
+            recipe = Recipe.objects.using(shard).get(user=user)
+            self.assertEqual(
+                [tag.title for tag in recipe.tags.all()], ["Dinner"], shard
+            )
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Test the Server-Timing header and on-demand profiles."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Recipe.objects.create(user=self.user, title="Soup", time_minutes=5, price=2)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("recipe:recipe-list"))
+        timing = response["Server-Timing"]
+        for metric in ("db;dur=", "serialize;dur=", "render;dur=", "total;dur="):
+            self.assertIn(metric, timing)
+        self.assertNotIn('desc="0 queries"', timing)
+
+    def test_profile_dumped_with_debug_header(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with override_settings(PROFILING_TOKEN="secret", PROFILING_DIR=tmp):
+                self.client.get(reverse("recipe:recipe-list"), HTTP_X_PROFILE="nope")
+                self.assertEqual(os.listdir(tmp), [])
+                self.client.get(reverse("recipe:recipe-list"), HTTP_X_PROFILE="secret")
+            files = os.listdir(tmp)
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].startswith("RecipeViewSet.list-"))
+
+
+class MetricsTests(TestCase):
+    """Test the Prometheus metrics endpoint."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_requests_recorded_per_view_and_action(self):
+        self.client.get(reverse("recipe:tag-list"))
+        response = self.client.get(reverse("metrics"))
+        body = response.content.decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE http_request_duration_seconds histogram", body)
+        self.assertIn(
+            'http_requests_total{view="TagViewSet",action="list",method="GET",'
+            'status="200"}',
+            body,
+        )
+        self.assertIn(
+            'http_request_duration_seconds_bucket{view="TagViewSet",action="list",'
+            'le="+Inf"}',
+            body,
+        )
+
+    def test_multiprocess_files_are_summed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            other_worker = {
+                "counters": [
+                    ["cache_requests_total", [["cache", "x"], ["result", "hit"]], 3]
+                ],
+                "histograms": [],
+            }
+            with open(os.path.join(tmp, "metrics-1-abc.json"), "w") as f:
+                json.dump(other_worker, f)
+            with override_settings(METRICS_MULTIPROCESS_DIR=tmp):
+                record_cache_lookup("x", True)
+                body = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('cache_requests_total{cache="x",result="hit"} 4', body)
+
+    def test_cache_lookups(self):
+        def lookups(cache):
+            return [
+                registry.counters[
+                    ("cache_requests_total", (("cache", cache), ("result", result)))
+                ]
+                for result in ("hit", "miss")
+            ]
+
+        before = {
+            cache: lookups(cache)
+            for cache in ("openapi_schema", "similarity_index", "idempotency")
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            with override_settings(SCHEMA_CACHE_DIR=tmp):
+                schema.clear()
+                self.addCleanup(schema.clear)
+                schema.get("json")
+                schema.get("json")
+        similarity.forget()
+        recipe = Recipe.objects.create(
+            user=self.user, title="Soup", time_minutes=5, price="1.00"
+        )
+        for _ in range(2):
+            self.client.get(reverse("recipe:recipe-similar", args=[recipe.pk]))
+            self.client.post(
+                reverse("recipe:recipe-list"),
+                {"title": "Stew", "time_minutes": 5, "price": "1.00"},
+                HTTP_IDEMPOTENCY_KEY="abc",
+            )
+
+        for cache, (hits, misses) in before.items():
+            self.assertEqual(lookups(cache), [hits + 1, misses + 1], cache)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_token_required(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        response = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class NPlusOneDetectorTests(TestCase):
+    """Test the N+1 query detector."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for i in range(8):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f"Recipe {i}", time_minutes=5, price=2
+            )
+            recipe.tags.add(Tag.objects.create(user=self.user, title=f"Tag {i}"))
+
+    def test_fingerprint_ignores_parameters(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s) AND x = 5'),
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (%s) AND x = 7'),
+        )
+
+    def test_repeated_query_reported_with_serializer_field(self):
+        from recipe.serializers import RecipeSerializer
+
+        with detect_n_plus_one(label="test", mode="log", threshold=3) as detector:
+            RecipeSerializer(Recipe.objects.all(), many=True).data
+
+        fields = {finding["serializer_field"] for finding in detector.findings}
+        self.assertEqual(
+            fields, {"RecipeSerializer.tags", "RecipeSerializer.ingredients"}
+        )
+        self.assertIn("test_repeated_query", detector.findings[0]["stack"])
+
+    def test_raise_mode(self):
+        with self.assertRaises(NPlusOneError):
+            with detect_n_plus_one(mode="raise", threshold=3):
+                [recipe.tags.count() for recipe in Recipe.objects.all()]
+
+    def test_recipe_list_has_no_n_plus_one(self):
+        with detect_n_plus_one(mode="raise", threshold=3):
+            response = self.client.get(reverse("recipe:recipe-list"))
+        self.assertEqual(len(response.data), 8)
+
+
+class SlowQueryLogTests(TestCase):
+    """Test the slow query log."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Recipe.objects.create(user=self.user, title="Soup", time_minutes=5, price=2)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "slow.jsonl")
+        slow_query_log.reset()
+        self.addCleanup(slow_query_log.reset)
+
+    def _entries(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_percentile(self):
+        self.assertEqual(percentile(range(1, 101), 0.95), 95)
+        self.assertEqual(percentile([3.0], 0.95), 3.0)
+
+    def test_slow_queries_logged_once_per_shape_with_plan(self):
+        with override_settings(
+            SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG_FILE=self.path
+        ):
+            self.client.get(reverse("recipe:recipe-list"))
+            self.client.get(reverse("recipe:recipe-list"))
+            slow_query_log.maybe_write_summary(force=True)
+
+        entries = self._entries()
+        queries = [e for e in entries if e["type"] == "query"]
+        recipe_query = next(e for e in queries if 'FROM "recipe_recipe" ' in e["sql"])
+        self.assertEqual(recipe_query["view"], "RecipeViewSet.list")
+        self.assertEqual(recipe_query["params"], [self.user.id])
+        self.assertTrue(recipe_query["plan"])
+        self.assertEqual(len({e["shape"] for e in queries}), len(queries))
+
+        summary = next(
+            e
+            for e in entries
+            if e["type"] == "summary" and e["shape"] == recipe_query["shape"]
+        )
+        self.assertEqual(summary["count"], 2)
+        self.assertEqual(summary["views"], ["RecipeViewSet.list"])
+        self.assertGreaterEqual(summary["max_ms"], summary["p95_ms"])
+
+    def test_fast_queries_not_logged(self):
+        with override_settings(
+            SLOW_QUERY_THRESHOLD_MS=60_000, SLOW_QUERY_LOG_FILE=self.path
+        ):
+            self.client.get(reverse("recipe:recipe-list"))
+        self.assertFalse(os.path.exists(self.path))
+
+
+class CachedSchemaTests(TestCase):
+    """Test the prebuilt OpenAPI schema."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        override = override_settings(SCHEMA_CACHE_DIR=self.dir, CODE_VERSION="v1")
+        override.enable()
+        self.addCleanup(override.disable)
+        schema.clear()
+        self.addCleanup(schema.clear)
+
+    def _get(self, **headers):
+        return self.client.get(reverse("schema"), {"format": "json"}, **headers)
+
+    def test_schema_matches_generated_one(self):
+        response = self._get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), schema.generate())
+        parameters = {
+            param["name"]: param["description"]
+            for param in json.loads(response.content)["paths"]["/api/recipe/recipes/"][
+                "get"
+            ]["parameters"]
+        }
+        self.assertEqual(
+            parameters,
+            {
+                "tags": "Comma separated list of IDs to filter",
+                "ingredients": "Comma separated list of IDs to filter",
+            },
+        )
+        self.assertIn("max-age", response["Cache-Control"])
+
+    def test_etag_not_modified(self):
+        etag = self._get()["ETag"]
+
+        response = self._get(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_served_from_file_until_version_changes(self):
+        self._get()
+        path = os.path.join(self.dir, f"schema-{schema.code_version()}.json")
+        with open(path, "w") as f:
+            f.write('{"cached": true}')
+        schema.clear()
+
+        self.assertEqual(json.loads(self._get().content), {"cached": True})
+        with override_settings(CODE_VERSION="v2"):
+            self.assertIn("paths", json.loads(self._get().content))
+        self.assertEqual(len(os.listdir(self.dir)), 4)
+
+    def test_yaml_by_default(self):
+        response = self.client.get(reverse("schema"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b"openapi:"))
+        self.assertTrue(
+            response["Content-Type"].startswith("application/vnd.oai.openapi")
+        )
+
+
+class LargeTableAdminTests(TestCase):
+    """Test the admin setup for large tables."""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            email="admin@example.com", password="password123"
+        )
+        self.client.force_login(self.admin)
+        Recipe.objects.bulk_create(
+            Recipe(user=self.admin, title=f"Recipe {i:03d}", time_minutes=5, price=2)
+            for i in range(60)
+        )
+        self.url = reverse("admin:recipe_recipe_changelist")
+
+    def _titles(self, response):
+        return [recipe.title for recipe in response.context["cl"].result_list]
+
+    def test_keyset_pages(self):
+        first = self.client.get(self.url)
+        cl = first.context["cl"]
+
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(cl.keyset)
+        self.assertEqual(self._titles(first)[0], "Recipe 059")
+        self.assertEqual(len(cl.result_list), 50)
+        self.assertIn(f"{AFTER_VAR}=", cl.next_url)
+
+        second = self.client.get(self.url + cl.next_url)
+        self.assertEqual(self._titles(second)[0], "Recipe 009")
+        self.assertEqual(len(second.context["cl"].result_list), 10)
+        self.assertIsNone(second.context["cl"].next_url)
+
+    def test_sorting_by_column_uses_pages(self):
+        response = self.client.get(self.url, {"o": "2"})
+
+        self.assertFalse(response.context["cl"].keyset)
+        self.assertEqual(self._titles(response)[0], "Recipe 000")
+
+    def test_search_by_prefix_and_id(self):
+        recipe = Recipe.objects.get(title="Recipe 042")
+
+        by_prefix = self.client.get(self.url, {"q": "Recipe 04"})
+        by_id = self.client.get(self.url, {"q": str(recipe.id)})
+
+        self.assertEqual(len(by_prefix.context["cl"].result_list), 10)
+        self.assertEqual(self._titles(by_id), ["Recipe 042"])
+
+    def test_change_form_and_autocomplete(self):
+        recipe = Recipe.objects.first()
+        response = self.client.get(
+            reverse("admin:recipe_recipe_change", args=[recipe.id])
+        )
+        self.assertEqual(response.status_code, 200)
+        # no <option> for every user
+        self.assertContains(response, "admin-autocomplete")
+
+        response = self.client.get(
+            reverse("admin:autocomplete"),
+            {
+                "term": "adm",
+                "app_label": "recipe",
+                "model_name": "recipe",
+                "field_name": "user",
+            },
+        )
+        self.assertEqual(
+            [result["text"] for result in response.json()["results"]],
+            ["admin@example.com"],
+        )
+
+    def test_user_changelist(self):
+        response = self.client.get(
+            reverse("admin:user_user_changelist"), {"is_staff__exact": "1"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["cl"].result_list), [self.admin])
+
+    def test_estimated_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        self.assertEqual(table_estimate(Recipe, "default"), 60)
+        self.assertEqual(estimated_count(Recipe.objects.all()), 60)
+        self.assertEqual(
+            estimated_count(Recipe.objects.filter(title__startswith="Recipe 05")), 10
+        )
+
+
+calls = []
+
+
+@jobs.task(max_attempts=2)
+def record_call(value):
+    calls.append(value)
+
+
+@jobs.task(max_attempts=2)
+def always_fail():
+    raise ValueError("boom")
+
+
+class JobQueueTests(TestCase):
+    """Test the database backed job queue."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_runs_by_priority(self):
+        record_call.enqueue({"value": "low"})
+        record_call.enqueue({"value": "high"}, priority=10)
+        jobs.enqueue("core.tests.record_call", {"value": "later"}, delay=60)
+
+        jobs.Worker(poll_interval=0).run(burst=True)
+
+        self.assertEqual(calls, ["high", "low"])
+        self.assertEqual(
+            list(Job.objects.values_list("status", flat=True).order_by("pk")),
+            [Job.SUCCEEDED, Job.SUCCEEDED, Job.QUEUED],
+        )
+
+    def test_idempotency_key(self):
+        first = record_call.enqueue({"value": 1}, idempotency_key="key")
+        second = record_call.enqueue({"value": 2}, idempotency_key="key")
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_retries_with_backoff(self):
+        job = always_fail.enqueue()
+        worker = jobs.Worker()
+
+        self.assertTrue(worker.run_one())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("ValueError: boom", job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+        # not due until the backoff passed
+        self.assertFalse(worker.run_one())
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertTrue(worker.run_one())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_expired_lease_is_reclaimed(self):
+        job = record_call.enqueue({"value": "once"})
+        stalled = jobs.Worker(name="stalled")
+        claimed = stalled.claim()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertIsNone(jobs.Worker().claim())
+
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now())
+        other = jobs.Worker(name="other")
+        reclaimed = other.claim()
+        self.assertEqual(reclaimed.attempts, 2)
+        other.run_job(reclaimed)
+        # the stalled worker finishing late doesn't overwrite the outcome
+        Job.objects.filter(pk=job.pk).update(last_error="")
+        stalled.run_job(claimed)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.locked_by, "")
+
+    def test_queue_stats_and_metrics(self):
+        record_call.enqueue({"value": 1})
+        record_call.enqueue({"value": 2}, delay=60)
+
+        stats = jobs.queue_stats()
+        self.assertEqual(stats["depth"][Job.QUEUED], 2)
+        self.assertEqual(stats["due"], 1)
+
+        body = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('job_queue_depth{status="queued"} 2', body)
+        self.assertIn("job_queue_due 1", body)
+
+
+class IdempotencyTests(TestCase):
+    """Test Idempotency-Key handling on creation endpoints."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("recipe:recipe-list")
+        self.payload = {"title": "Soup", "time_minutes": 10, "price": "2.50"}
+
+    def _post(self, key, payload=None, client=None):
+        return (client or self.client).post(
+            self.url, payload or self.payload, format="json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_is_replayed(self):
+        first = self._post("abc")
+        second = self._post("abc")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_keys_are_per_user(self):
+        other = get_user_model().objects.create_user(
+            email="other@example.com", password="password123"
+        )
+        client = APIClient()
+        client.force_authenticate(other)
+
+        self._post("abc")
+        response = self._post("abc", client=client)
+
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_key_reused_for_other_request(self):
+        self._post("abc")
+        response = self._post("abc", {**self.payload, "title": "Stew"})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_without_key(self):
+        self.client.post(self.url, self.payload, format="json")
+        self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def _in_flight(self):
+        # what a concurrent first request leaves behind while it runs
+        request = self.client.post(self.url, self.payload, format="json").wsgi_request
+        Recipe.objects.all().delete()
+        return IdempotencyKey.objects.create(
+            scope=f"user:{self.user.pk}",
+            key="abc",
+            request_hash=idempotency.request_hash(request),
+            created_at=timezone.now(),
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+
+    def test_waits_for_in_flight_request(self):
+        record = self._in_flight()
+
+        def finish(seconds):
+            record.status_code = 201
+            record.response = {"id": 1}
+            record.save()
+
+        with mock.patch("core.idempotency.time.sleep", side_effect=finish) as sleep:
+            response = self._post("abc")
+
+        sleep.assert_called_once()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"id": 1})
+        self.assertEqual(Recipe.objects.count(), 0)
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0)
+    def test_in_flight_timeout(self):
+        self._in_flight()
+
+        response = self._post("abc")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Recipe.objects.count(), 0)
+
+    def test_create_user_retry(self):
+        payload = {
+            "email": "new@example.com",
+            "password": "testpass123",
+            "password2": "testpass123",
+        }
+        client = APIClient()
+        first = client.post(
+            reverse("create_user"), payload, format="json", HTTP_IDEMPOTENCY_KEY="k"
+        )
+        second = client.post(
+            reverse("create_user"), payload, format="json", HTTP_IDEMPOTENCY_KEY="k"
+        )
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(
+            get_user_model().objects.filter(email="new@example.com").count(), 1
+        )
+
+    def test_create_user_keys_of_different_clients(self):
+        responses = [
+            APIClient().post(
+                reverse("create_user"),
+                {"email": email, "password": "testpass123", "password2": "testpass123"},
+                format="json",
+                HTTP_IDEMPOTENCY_KEY="same-key",
+            )
+            for email in ("one@example.com", "two@example.com")
+        ]
+
+        self.assertEqual([r.status_code for r in responses], [201, 201])
+        self.assertNotIn("Idempotent-Replayed", responses[1])
+        self.assertEqual(responses[1].json()["email"], "two@example.com")
+
+
+@override_settings(BATCH_MAX_WORKERS=1)
+class BatchTests(TestCase):
+    """Test the batch request endpoint."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.url = reverse("batch")
+
+    def _batch(self, *requests):
+        return self.client.post(self.url, {"requests": requests}, format="json")
+
+    def test_authenticates_once(self):
+        Tag.objects.create(user=self.user, title="Vegan")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self._batch(
+                {"id": "recipes", "method": "GET", "path": "/api/recipe/recipes/"},
+                {"id": "tags", "method": "GET", "path": "/api/recipe/tags/"},
+                {"method": "GET", "path": "/api/recipe/ingredients/"},
+            )
+
+        self.assertEqual(response.status_code, 200)
+        responses = response.json()["responses"]
+        self.assertEqual([r["status"] for r in responses], [200, 200, 200])
+        self.assertEqual([r["id"] for r in responses], ["recipes", "tags", None])
+        self.assertEqual(responses[1]["body"][0]["title"], "Vegan")
+        self.assertIn("duration_ms", responses[0])
+        token_lookups = [
+            query
+            for query in queries
+            if query["sql"].startswith("SELECT") and "authtoken_token" in query["sql"]
+        ]
+        self.assertEqual(len(token_lookups), 1)
+
+    def test_writes_run_in_order(self):
+        response = self._batch(
+            {
+                "method": "POST",
+                "path": "/api/recipe/recipes/",
+                "body": {"title": "Soup", "time_minutes": 10, "price": "2.50"},
+            },
+            {"method": "GET", "path": "/api/recipe/recipes/"},
+        )
+
+        created, listed = response.json()["responses"]
+        self.assertEqual(created["status"], 201)
+        self.assertEqual(listed["body"][0]["id"], created["body"]["id"])
+
+    def test_unknown_and_nested_paths(self):
+        response = self._batch(
+            {"method": "GET", "path": "/api/nothing/"},
+            {"method": "POST", "path": "/api/batch/", "body": {"requests": []}},
+        )
+
+        self.assertEqual(
+            [r["status"] for r in response.json()["responses"]], [404, 404]
+        )
+
+    def test_only_api_paths(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+
+        response = self._batch(
+            {"method": "GET", "path": "/admin/user/user/"},
+            {"method": "GET", "path": "/metrics"},
+        )
+
+        self.assertEqual(
+            [r["status"] for r in response.json()["responses"]], [404, 404]
+        )
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_request_limit(self):
+        sub = {"method": "GET", "path": "/api/recipe/tags/"}
+
+        response = self._batch(sub, sub, sub)
+
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(BATCH_TIMEOUT=0)
+    def test_timeout(self):
+        response = self._batch({"method": "GET", "path": "/api/recipe/tags/"})
+
+        self.assertEqual(response.json()["responses"][0]["status"], 504)
+
+    def test_requires_authentication(self):
+        response = APIClient().post(self.url, {"requests": []}, format="json")
+
+        self.assertEqual(response.status_code, 401)
+
+
+class BatchParallelTests(TransactionTestCase):
+    """Test read-only sub-requests running on several threads."""
+
+    def test_parallel_reads(self):
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        Tag.objects.create(user=user, title="Vegan")
+        client = APIClient()
+        client.force_authenticate(user)
+        sub = {"method": "GET", "path": "/api/recipe/tags/"}
+
+        with mock.patch(
+            "core.batch._dispatch_in_thread", wraps=batch._dispatch_in_thread
+        ) as threaded:
+            response = client.post(
+                reverse("batch"), {"requests": [sub] * 4}, format="json"
+            )
+
+        self.assertEqual(threaded.call_count, 4)
+        for entry in response.json()["responses"]:
+            self.assertEqual(entry["status"], 200)
+            self.assertEqual(entry["body"][0]["title"], "Vegan")
+
+
+class BrokerTests(SimpleTestCase):
+    """Test the publish/subscribe broker behind the live feed."""
+
+    def test_publish_reaches_subscribers_of_the_key(self):
+        async def run():
+            events = broker.Broker()
+            mine, other = events.subscribe(1), events.subscribe(2)
+            await asyncio.to_thread(events.publish, 1, {"n": 1})
+            received = await mine.get(1), await other.get(0.05)
+            mine.close()
+            other.close()
+            return received, events.subscriber_count()
+
+        self.assertEqual(asyncio.run(run()), (({"n": 1}, None), 0))
+
+    @override_settings(FEED_MAX_PER_USER=1)
+    def test_subscriber_limit(self):
+        async def run():
+            events = broker.Broker()
+            events.subscribe(1)
+            with self.assertRaises(broker.SubscriberLimit):
+                events.subscribe(1)
+            events.subscribe(2)
+
+        asyncio.run(run())
+
+    def test_slow_subscriber_dropped(self):
+        async def run():
+            events = broker.Broker()
+            subscription = events.subscribe(1, maxsize=2)
+            for n in range(3):
+                events.deliver(1, {"n": n})
+            await asyncio.sleep(0)
+            with self.assertRaises(broker.Dropped):
+                await subscription.get(1)
+            # later events don't reach it anymore
+            events.deliver(1, {"n": 3})
+            return events.subscriber_count()
+
+        self.assertEqual(asyncio.run(run()), 0)
+
+    def test_unix_fanout_between_brokers(self):
+        async def run():
+            receiving, publishing = broker.Broker(), broker.Broker()
+            subscription = receiving.subscribe(1)
+            publishing.publish(1, {"n": 1})
+            return await subscription.get(5)
+
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(FEED_FANOUT="unix", FEED_SOCKET_DIR=directory):
+                self.assertEqual(asyncio.run(run()), {"n": 1})
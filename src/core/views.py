@@ -1,3 +1,84 @@
-from django.shortcuts import render
+import hmac
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotModified
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import batch, jobs, schema
+from .metrics import registry, render_prometheus
+from .serializers import BatchRequestSerializer, BatchResponseSerializer
 
 # Create your views here.
+
+
+def metrics(request):
+    """Expose the metrics of all workers in Prometheus text format."""
+    token = settings.METRICS_TOKEN
+    if token:
+        header = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(header, f"Bearer {token}"):
+            return HttpResponseForbidden()
+    snapshot = registry.collect()
+    snapshot["counters"] += jobs.queue_metrics()
+    return HttpResponse(
+        render_prometheus(snapshot),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """SpectacularAPIView serving the prebuilt schema from memory.
+
+    Generating the schema introspects every view and serializer, so it is
+    built once per code version (see core.schema) and served with an ETag
+    and a long max-age. Requests for another API version or language are
+    still generated on the fly.
+    """
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        if request.GET.get("lang") or request.GET.get("version") or self.api_version:
+            return super().get(request, *args, **kwargs)
+
+        renderer = request.accepted_renderer
+        rendered = schema.get(renderer.format)
+        if rendered.etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                rendered.content,
+                content_type=f"{request.accepted_media_type}; charset={renderer.charset}",
+            )
+            response["Content-Disposition"] = (
+                f'inline; filename="{self._get_filename(request, None)}"'
+            )
+        response["ETag"] = rendered.etag
+        response["Cache-Control"] = f"public, max-age={settings.SCHEMA_CACHE_MAX_AGE}"
+        return response
+
+
+class BatchView(APIView):
+    """Run up to BATCH_MAX_REQUESTS API calls in one round trip.
+
+    Authenticated once, see core.batch for how the calls are run.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(request=BatchRequestSerializer, responses=BatchResponseSerializer)
+    def post(self, request):
+        serializer = BatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        started = time.perf_counter()
+        responses = batch.run(request, serializer.validated_data["requests"])
+        return Response(
+            {
+                "responses": responses,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+        )
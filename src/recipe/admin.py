@@ -1,9 +1,47 @@
 from django.contrib import admin
 
-from .models import Recipe, Tag, Ingredient
+from core.admin import LargeTableAdmin
+
+from .models import Recipe, Tag, Ingredient, RecipeStats
 
 # Register your models here.
 
-admin.site.register(Recipe)
-admin.site.register(Tag)
-admin.site.register(Ingredient)
\ No newline at end of file
+
+class RecipeAdmin(LargeTableAdmin):
+    list_display = ("id", "title", "user", "price", "time_minutes")
+    list_select_related = ("user",)
+    # a select with every user / tag / ingredient doesn't scale
+    autocomplete_fields = ("user", "tags", "ingredients")
+    search_fields = ("title",)
+    prefix_search_field = "title"
+
+
+class TagAdmin(LargeTableAdmin):
+    list_display = ("id", "title", "user")
+    list_select_related = ("user",)
+    autocomplete_fields = ("user",)
+    search_fields = ("title",)
+    prefix_search_field = "title"
+
+
+class IngredientAdmin(LargeTableAdmin):
+    list_display = ("id", "name", "user")
+    list_select_related = ("user",)
+    autocomplete_fields = ("user",)
+    search_fields = ("name",)
+    prefix_search_field = "name"
+
+
+class RecipeStatsAdmin(LargeTableAdmin):
+    list_display = ("user", "recipe_count", "total_price", "total_time_minutes")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+    search_fields = ("user__email",)
+    prefix_search_field = "user__email"
+    search_help_text = "A stats id, or the start of the user's email."
+
+
+admin.site.register(Recipe, RecipeAdmin)
+admin.site.register(Tag, TagAdmin)
+admin.site.register(Ingredient, IngredientAdmin)
+admin.site.register(RecipeStats, RecipeStatsAdmin)
@@ -0,0 +1,291 @@
+"""API benchmark driven by "manage.py bench".
+
+Requests go through the real URL routes, middleware and token
+authentication with the DRF test client, so the numbers include
+everything but the WSGI server and the network.
+"""
+
+import io
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.routers import use_user_shard
+from core.slowlog import percentile
+
+from . import stats
+from .models import Ingredient, Recipe, RecipeStats, Tag
+
+SCENARIOS = (
+    "list",
+    "filtered_list",
+    "retrieve",
+    "similar",
+    "pantry",
+    "shopping_list",
+    "create",
+    "update",
+    "upload",
+)
+
+# password of the users created by seed()
+PASSWORD = "benchpassword123"
+
+# metric: direction that is better, used to compare with a baseline
+METRICS = {
+    "throughput_rps": "higher",
+    "p50_ms": "lower",
+    "p95_ms": "lower",
+    "p99_ms": "lower",
+    "queries_per_request": "lower",
+}
+
+
+@contextmanager
+def throwaway_databases(directory, in_memory=False):
+    """Run the block against empty, migrated copies of every database.
+
+    Same isolation as the test runner, with "testserver" allowed as host
+    and uploads going to directory. The copies are files in directory
+    unless in_memory, so the SQLite pragmas behave like in production.
+    """
+    if not in_memory:
+        for connection in connections.all():
+            connection.settings_dict.setdefault("TEST", {})
+            if not connection.settings_dict["TEST"].get("MIRROR"):
+                connection.settings_dict["TEST"][
+                    "NAME"
+                ] = f"{directory}/bench_{connection.alias}.sqlite3"
+
+    setup_test_environment(debug=False)
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        with override_settings(MEDIA_ROOT=f"{directory}/media"):
+            yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def seed(users=5, recipes=100, tags=20, ingredients=30, per_recipe=3, seed=0):
+    """Create users with recipes linked to some of their tags and ingredients.
+
+    Rows are bulk inserted per user on the user's shard, returns the
+    users with their tag and ingredient ids for the scenarios.
+    """
+    rng = random.Random(seed)
+    User = get_user_model()
+    dataset = []
+    for index in range(users):
+        user = User.objects.create_user(
+            email=f"bench{index}@example.com",
+            password=PASSWORD,
+            first_name=f"Bench {index}",
+        )
+        with use_user_shard(user):
+            # fixed width names, the serializers look tags up with icontains
+            tag_objs = Tag.objects.bulk_create(
+                Tag(user=user, title=f"Tag {i:04d}") for i in range(tags)
+            )
+            ingredient_objs = Ingredient.objects.bulk_create(
+                Ingredient(user=user, name=f"ingredient {i:04d}")
+                for i in range(ingredients)
+            )
+            recipe_objs = Recipe.objects.bulk_create(
+                Recipe(
+                    user=user,
+                    title=f"Recipe {i}",
+                    time_minutes=rng.randint(5, 120),
+                    price=Decimal(rng.randint(100, 5000)) / 100,
+                )
+                for i in range(recipes)
+            )
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+                for recipe in recipe_objs
+                for tag in rng.sample(tag_objs, min(per_recipe, tags))
+            )
+            Recipe.ingredients.through.objects.bulk_create(
+                Recipe.ingredients.through(
+                    recipe_id=recipe.id, ingredient_id=ingredient.id
+                )
+                for recipe in recipe_objs
+                for ingredient in rng.sample(
+                    ingredient_objs, min(per_recipe, ingredients)
+                )
+            )
+            RecipeStats.objects.create(user=user, **stats.compute_for_user(user))
+        dataset.append(
+            {
+                "user": user,
+                "token": Token.objects.create(user=user).key,
+                "recipe_ids": [recipe.id for recipe in recipe_objs],
+                "tag_ids": [tag.id for tag in tag_objs],
+                "ingredient_ids": [ingredient.id for ingredient in ingredient_objs],
+            }
+        )
+    return dataset
+
+
+def _image():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class Benchmark:
+    """Run each scenario a number of times and collect its measurements."""
+
+    def __init__(self, dataset, requests=100, warmup=10, seed=0):
+        self.dataset = dataset
+        self.requests = requests
+        self.warmup = warmup
+        self.rng = random.Random(seed)
+        self.image = _image()
+        self.clients = {}
+        for account in dataset:
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Token {account['token']}")
+            self.clients[account["user"].pk] = client
+        self._queries = 0
+
+    def _count(self, execute, sql, params, many, context):
+        self._queries += 1
+        return execute(sql, params, many, context)
+
+    def _request(self, scenario):
+        """Send one request of a scenario, returns the response."""
+        account = self.rng.choice(self.dataset)
+        client = self.clients[account["user"].pk]
+        recipe_id = self.rng.choice(account["recipe_ids"])
+        detail_url = reverse("recipe:recipe-detail", args=[recipe_id])
+
+        if scenario == "list":
+            return client.get(reverse("recipe:recipe-list"))
+        if scenario == "filtered_list":
+            tag_ids = self.rng.sample(account["tag_ids"], 2)
+            return client.get(
+                reverse("recipe:recipe-list"),
+                {"tags": ",".join(map(str, tag_ids))},
+            )
+        if scenario == "retrieve":
+            return client.get(detail_url)
+        if scenario == "similar":
+            return client.get(reverse("recipe:recipe-similar", args=[recipe_id]))
+        if scenario == "pantry":
+            ingredient_ids = self.rng.sample(
+                account["ingredient_ids"], len(account["ingredient_ids"]) // 2
+            )
+            return client.get(
+                reverse("recipe:recipe-pantry"),
+                {"ingredients": ",".join(map(str, ingredient_ids))},
+            )
+        if scenario == "shopping_list":
+            recipe_ids = self.rng.sample(
+                account["recipe_ids"], min(20, len(account["recipe_ids"]))
+            )
+            return client.get(
+                reverse("recipe:recipe-shopping-list"),
+                {"recipes": ",".join(map(str, recipe_ids))},
+            )
+        if scenario == "create":
+            response = client.post(
+                reverse("recipe:recipe-list"),
+                {
+                    "title": "Bench recipe",
+                    "time_minutes": 30,
+                    "price": "9.99",
+                    "tags": [{"title": "Tag 0001"}, {"title": "Tag 0002"}],
+                    "ingredients": [{"name": "ingredient 0001"}],
+                },
+                format="json",
+            )
+            if response.status_code == 201:
+                account["recipe_ids"].append(response.data["id"])
+            return response
+        if scenario == "update":
+            return client.patch(
+                detail_url,
+                {"title": "Updated", "tags": [{"title": "Tag 0003"}]},
+                format="json",
+            )
+        if scenario == "upload":
+            image = SimpleUploadedFile("bench.jpg", self.image, "image/jpeg")
+            return client.post(
+                reverse("recipe:recipe-upload-image", args=[recipe_id]),
+                {"image": image},
+                format="multipart",
+            )
+        raise ValueError(f"Unknown scenario {scenario!r}")
+
+    def run_scenario(self, scenario):
+        for _ in range(self.warmup):
+            self._request(scenario)
+
+        latencies = []
+        queries = []
+        errors = 0
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self._count))
+            started = time.perf_counter()
+            for _ in range(self.requests):
+                self._queries = 0
+                request_started = time.perf_counter()
+                response = self._request(scenario)
+                latencies.append((time.perf_counter() - request_started) * 1000)
+                queries.append(self._queries)
+                if response.status_code >= 400:
+                    errors += 1
+            elapsed = time.perf_counter() - started
+
+        return {
+            "requests": self.requests,
+            "errors": errors,
+            "throughput_rps": round(self.requests / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "queries_per_request": round(sum(queries) / len(queries), 2),
+            "max_queries": max(queries),
+        }
+
+    def run(self, scenarios=SCENARIOS):
+        return {scenario: self.run_scenario(scenario) for scenario in scenarios}
+
+
+def compare(baseline, results, tolerance):
+    """Return a message for every metric worse than the baseline by more
+    than tolerance (0.1 is 10%)."""
+    regressions = []
+    for scenario, metrics in results.items():
+        base = baseline.get(scenario)
+        if base is None:
+            continue
+        for metric, better in METRICS.items():
+            old, new = base.get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if better == "lower":
+                worse = new > old * (1 + tolerance)
+            else:
+                worse = new < old * (1 - tolerance)
+            if worse:
+                regressions.append(f"{scenario}.{metric}: {old} -> {new}")
+    return regressions
@@ -0,0 +1,305 @@
+"""Live feed of a user's recipe, tag and ingredient changes.
+
+Served over Server-Sent Events (GET /api/recipe/feed/) and WebSocket (the
+same path) by app.asgi, next to Django rather than through it: Django's
+ASGI handler keeps a thread for each request until its response is
+complete. Here every connection is a coroutine waiting on its core.broker
+subscription, so idle ones hold no thread.
+
+Events are the change log entries of recipe.sync, published once their
+transaction commits:
+
+    {"cursor": 42, "model": "recipe", "id": 7, "deleted": false}
+
+Clients fetch the objects themselves from /api/recipe/sync/. Connecting
+with a cursor (?cursor= or SSE's Last-Event-ID) first replays the changes
+after it. When that backlog is too large, the cursor expired, or the
+client fell behind and was dropped, the feed sends a "resync" event:
+catch up through /api/recipe/sync/, then reconnect with the new cursor.
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework import exceptions
+
+from core.broker import Dropped, SubscriberLimit, broker
+from core.metrics import registry
+from core.routers import use_user_shard
+from user.authentication import ExpiringTokenAuthentication
+
+from . import sync
+
+PATH = "/api/recipe/feed/"
+
+
+def _count(name, labels=()):
+    if settings.METRICS_ENABLED:
+        registry.inc(name, labels)
+
+
+def token_from(headers, query_string):
+    """The token of an "Authorization: Token <key>" header or ?token=.
+
+    The query parameter is for browsers, whose EventSource and WebSocket
+    can't set headers.
+    """
+    header = headers.get("authorization", "")
+    keyword, _, key = header.partition(" ")
+    if keyword == "Token" and key:
+        return key.strip()
+    return (parse_qs(query_string).get("token") or [None])[0]
+
+
+def parse_cursor(value):
+    """A cursor parameter as an int, None when missing, ValueError if bad."""
+    if value in (None, ""):
+        return None
+    cursor = int(value)
+    if cursor < 0:
+        raise ValueError(value)
+    return cursor
+
+
+@sync_to_async
+def authenticate(key):
+    """The active user owning token key, or None."""
+    try:
+        if not key:
+            return None
+        user, _ = ExpiringTokenAuthentication().authenticate_credentials(key)
+        return user
+    except exceptions.AuthenticationFailed:
+        return None
+    finally:
+        # outside a request, nothing else recycles the connection
+        close_old_connections()
+
+
+@sync_to_async
+def _backlog(user, cursor):
+    try:
+        with use_user_shard(user):
+            return sync.events_since(user, cursor, settings.SYNC_PAGE_SIZE)
+    except sync.CursorExpired:
+        return [], False
+    finally:
+        close_old_connections()
+
+
+class Feed:
+    """The live changes of one user, for one connection.
+
+    Subscribes on creation, so a connection over FEED_MAX_PER_USER fails
+    with core.broker.SubscriberLimit before any response is sent. Iterate
+    it asynchronously for events: dicts with a "type" of "change" or
+    "resync", and None every FEED_HEARTBEAT seconds without events. It
+    ends after a resync event.
+    """
+
+    def __init__(self, user, cursor=None):
+        self.user = user
+        # the last cursor sent, where a resync continues from
+        self.cursor = cursor
+        self.subscription = broker.subscribe(user.pk)
+        _count("feed_connections_total")
+
+    def close(self):
+        self.subscription.close()
+
+    def __aiter__(self):
+        return self._events()
+
+    def _change(self, event):
+        self.cursor = event["cursor"]
+        return {"type": "change", **event}
+
+    async def _events(self):
+        try:
+            replayed = 0
+            if self.cursor is not None:
+                # subscribed first, a change committed meanwhile is either
+                # in the backlog or arrives live, skipped if it was in both
+                events, complete = await _backlog(self.user, self.cursor)
+                for event in events:
+                    yield self._change(event)
+                if not complete:
+                    yield self._resync()
+                    return
+                replayed = self.cursor
+
+            while True:
+                try:
+                    event = await self.subscription.get(settings.FEED_HEARTBEAT)
+                except Dropped:
+                    yield self._resync()
+                    return
+                if event is None:
+                    yield None
+                elif event["cursor"] > replayed:
+                    _count("feed_events_total")
+                    yield self._change(event)
+        finally:
+            self.close()
+
+    def _resync(self):
+        return {"type": "resync", "cursor": self.cursor}
+
+
+def sse_format(item):
+    """One Server-Sent Events message, a comment for heartbeats."""
+    if item is None:
+        return ": ping\n\n"
+    data = json.dumps(item)
+    if item["type"] == "change":
+        # EventSource reconnects with it as Last-Event-ID
+        return f"id: {item['cursor']}\nevent: change\ndata: {data}\n\n"
+    return f"event: {item['type']}\ndata: {data}\n\n"
+
+
+async def _stream(feed, receive, send_item, disconnect):
+    """Send the feed's items until it ends or the client disconnects."""
+
+    async def pump():
+        async for item in feed:
+            await send_item(item)
+
+    task = asyncio.create_task(pump())
+    try:
+        while not task.done():
+            receiver = asyncio.ensure_future(receive())
+            done, _ = await asyncio.wait(
+                [receiver, task], return_when=asyncio.FIRST_COMPLETED
+            )
+            if receiver not in done:
+                receiver.cancel()
+            elif receiver.result()["type"] == disconnect:
+                return False
+            # anything else the client sends is ignored
+        task.result()
+        return True
+    finally:
+        task.cancel()
+        feed.close()
+
+
+def _headers(scope):
+    return {
+        name.decode("latin-1").lower(): value.decode("latin-1")
+        for name, value in scope.get("headers", [])
+    }
+
+
+async def _open(scope, cursor):
+    """(Feed, None) for the connection, or (None, (status, detail))."""
+    try:
+        cursor = parse_cursor(cursor)
+    except ValueError:
+        return None, (400, "cursor must be a non negative integer.")
+    key = token_from(_headers(scope), scope.get("query_string", b"").decode())
+    user = await authenticate(key)
+    if user is None:
+        return None, (401, "Authentication credentials were not provided.")
+    try:
+        return Feed(user, cursor), None
+    except SubscriberLimit:
+        return None, (429, "Too many live feed connections.")
+
+
+async def sse(scope, receive, send):
+    """ASGI application for the Server-Sent Events feed."""
+    query = parse_qs(scope.get("query_string", b"").decode())
+    cursor = _headers(scope).get("last-event-id") or (query.get("cursor") or [None])[0]
+    if scope["method"] != "GET":
+        feed, error = None, (405, f'Method "{scope["method"]}" not allowed.')
+    else:
+        feed, error = await _open(scope, cursor)
+    if error is not None:
+        status, detail = error
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        await send(
+            {
+                "type": "http.response.body",
+                "body": json.dumps({"detail": detail}).encode(),
+            }
+        )
+        return
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                # don't let nginx buffer the stream
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+
+    async def send_item(item):
+        await send(
+            {
+                "type": "http.response.body",
+                "body": sse_format(item).encode(),
+                "more_body": True,
+            }
+        )
+
+    # sent at once, so clients and proxies see the stream is open
+    await send(
+        {
+            "type": "http.response.body",
+            "body": f"retry: {settings.FEED_RETRY_MS}\n\n".encode(),
+            "more_body": True,
+        }
+    )
+    if await _stream(feed, receive, send_item, "http.disconnect"):
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def websocket(scope, receive, send):
+    """ASGI application for the WebSocket feed.
+
+    Close codes: 4400 bad cursor, 4401 not authenticated, 4404 unknown
+    path, 4429 too many connections of the user.
+    """
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    if scope["path"] != PATH:
+        await send({"type": "websocket.close", "code": 4404})
+        return
+    query = parse_qs(scope.get("query_string", b"").decode())
+    feed, error = await _open(scope, (query.get("cursor") or [None])[0])
+    if error is not None:
+        await send({"type": "websocket.close", "code": 4000 + error[0]})
+        return
+    await send({"type": "websocket.accept"})
+
+    async def send_item(item):
+        # the server pings idle connections itself
+        if item is not None:
+            await send({"type": "websocket.send", "text": json.dumps(item)})
+
+    if await _stream(feed, receive, send_item, "websocket.disconnect"):
+        await send({"type": "websocket.close", "code": 1000})
+
+
+async def application(scope, receive, send):
+    """The feed's ASGI application, see app.asgi."""
+    if scope["type"] == "websocket":
+        await websocket(scope, receive, send)
+    else:
+        await sse(scope, receive, send)
@@ -0,0 +1,339 @@
+"""Open-loop load generator calling the ASGI application in process.
+
+Simulated clients run as asyncio tasks that call app.asgi.application
+directly, no server or sockets involved. Sessions arrive at a fixed
+average rate (Poisson arrivals) whether or not earlier ones finished,
+so a slow server builds up a queue instead of slowing down the load.
+
+Every request has an intended start time: the session's arrival plus
+think time per earlier request. A request sent late because the previous
+one was slow would hide the stall from a naive measurement (coordinated
+omission). Each request therefore gets two latencies: "service", measured
+from when it was actually sent, and "corrected", measured from when it
+should have been sent.
+"""
+
+import asyncio
+import json
+import math
+import random
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import reverse
+
+from .benchmark import _image
+
+ENDPOINTS = ("login", "list", "tags", "filter", "create", "upload", "logout")
+# default weights of the actions between login and logout
+DEFAULT_MIX = {"list": 40, "filter": 20, "create": 25, "upload": 15}
+
+
+class Histogram:
+    """Log-bucketed latency histogram, each bucket 5% wider than the last.
+
+    Memory stays bounded however many values are recorded and percentiles
+    are within 5% of the exact ones.
+    """
+
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, ms):
+        index = max(0, math.ceil(math.log(max(ms, 0.001) * 1000, self.GROWTH)))
+        self.buckets[index] += 1
+        self.count += 1
+        self.max = max(self.max, ms)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of values."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(self.GROWTH**index / 1000, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "p50_ms": round(self.percentile(0.50), 3),
+            "p95_ms": round(self.percentile(0.95), 3),
+            "p99_ms": round(self.percentile(0.99), 3),
+            "max_ms": round(self.max, 3),
+        }
+
+
+async def asgi_request(app, method, path, query=None, headers=(), body=b""):
+    """Send one HTTP request to an ASGI app, returns (status, body)."""
+    done = asyncio.Event()
+    request_sent = False
+    response = {"status": None, "body": []}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Django listens for a client disconnect while the view runs,
+        # only disconnect once the response is complete
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+            if not message.get("more_body"):
+                done.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": urlencode(query or {}).encode(),
+        "root_path": "",
+        "headers": [(b"host", b"testserver")]
+        + [(name.encode(), value.encode()) for name, value in headers],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    }
+    try:
+        await app(scope, receive, send)
+    finally:
+        done.set()
+    return response["status"], b"".join(response["body"])
+
+
+class LoadTest:
+    """Run sessions of login, weighted actions and logout at given rates."""
+
+    def __init__(
+        self,
+        app,
+        credentials,
+        mix=None,
+        actions=5,
+        think_time=0.05,
+        seed=0,
+    ):
+        self.app = app
+        self.credentials = credentials
+        self.mix = mix or DEFAULT_MIX
+        self.actions = actions
+        self.think_time = think_time
+        self.rng = random.Random(seed)
+        self.image = _image()
+
+    async def run_step(self, rate, duration, drain_timeout=30.0):
+        """Start sessions at rate per second for duration seconds."""
+        self.service = defaultdict(Histogram)
+        self.corrected = defaultdict(Histogram)
+        self.errors = defaultdict(int)
+        self.start_lag = Histogram()
+        # a logout revokes the token of every session of that user, so a
+        # user is only in one session at a time. When all are busy the wait
+        # shows up in the login's corrected latency and in start_lag.
+        self.idle = asyncio.Queue()
+        for credentials in self.credentials:
+            self.idle.put_nowait(credentials)
+        loop = asyncio.get_running_loop()
+
+        started = loop.time()
+        tasks = []
+        arrival = started
+        while True:
+            # exponential gaps give Poisson arrivals at the given rate
+            arrival += self.rng.expovariate(rate)
+            if arrival - started >= duration:
+                break
+            delay = arrival - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self._session(arrival)))
+
+        pending = ()
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=drain_timeout)
+        for task in pending:
+            task.cancel()
+        elapsed = loop.time() - started
+
+        endpoints = {}
+        for name in ENDPOINTS:
+            service = self.service[name]
+            if not service.count:
+                continue
+            corrected = self.corrected[name]
+            endpoints[name] = {
+                "requests": service.count,
+                "errors": self.errors[name],
+                "throughput_rps": round(service.count / elapsed, 2),
+                "service": service.summary(),
+                "corrected": corrected.summary(),
+                # the naive p99 understates the one clients saw by >10%
+                "coordinated_omission": corrected.percentile(0.99)
+                > max(service.percentile(0.99) * 1.1, service.percentile(0.99) + 1),
+            }
+        return {
+            "offered_sessions_per_s": rate,
+            "sessions": len(tasks),
+            "unfinished_sessions": len(pending),
+            "requests_per_s": round(
+                sum(h.count for h in self.service.values()) / elapsed, 2
+            ),
+            # how late the generator itself started requests, large values
+            # mean this process, not the app, is the bottleneck
+            "start_lag": self.start_lag.summary(),
+            "endpoints": endpoints,
+        }
+
+    async def _session(self, arrival):
+        credentials = await self.idle.get()
+        try:
+            await self._run_session(arrival, credentials)
+        finally:
+            self.idle.put_nowait(credentials)
+
+    async def _run_session(self, arrival, credentials):
+        state = {"intended": arrival, "token": None, "recipe_ids": [], "tag_ids": None}
+        email, password = credentials
+        status, body = await self._call(
+            state,
+            "login",
+            "POST",
+            reverse("login"),
+            json.dumps({"username": email, "password": password}).encode(),
+            content_type="application/json",
+        )
+        if status != 200:
+            return
+        state["token"] = json.loads(body)["token"]
+
+        names = list(self.mix)
+        weights = list(self.mix.values())
+        for name in self.rng.choices(names, weights, k=self.actions):
+            await getattr(self, f"_{name}")(state)
+        await self._call(state, "logout", "POST", reverse("logout"))
+
+    async def _list(self, state):
+        status, body = await self._call(
+            state, "list", "GET", reverse("recipe:recipe-list")
+        )
+        if status == 200:
+            state["recipe_ids"] = [recipe["id"] for recipe in json.loads(body)[:50]]
+
+    async def _filter(self, state):
+        if state["tag_ids"] is None:
+            status, body = await self._call(
+                state, "tags", "GET", reverse("recipe:tag-list")
+            )
+            state["tag_ids"] = (
+                [tag["id"] for tag in json.loads(body)] if status == 200 else []
+            )
+        tag_ids = self.rng.sample(state["tag_ids"], min(2, len(state["tag_ids"])))
+        await self._call(
+            state,
+            "filter",
+            "GET",
+            reverse("recipe:recipe-list"),
+            query={"tags": ",".join(map(str, tag_ids))},
+        )
+
+    async def _create(self, state):
+        payload = {
+            "title": "Load test recipe",
+            "time_minutes": 20,
+            "price": "7.50",
+            "tags": [{"title": "Load test"}],
+            "ingredients": [{"name": "load test"}],
+        }
+        status, body = await self._call(
+            state,
+            "create",
+            "POST",
+            reverse("recipe:recipe-list"),
+            json.dumps(payload).encode(),
+            content_type="application/json",
+        )
+        if status == 201:
+            state["recipe_ids"].append(json.loads(body)["id"])
+
+    async def _upload(self, state):
+        if not state["recipe_ids"]:
+            await self._list(state)
+            if not state["recipe_ids"]:
+                return
+        image = SimpleUploadedFile("load.jpg", self.image, "image/jpeg")
+        body = encode_multipart(BOUNDARY, {"image": image})
+        await self._call(
+            state,
+            "upload",
+            "POST",
+            reverse(
+                "recipe:recipe-upload-image",
+                args=[self.rng.choice(state["recipe_ids"])],
+            ),
+            body,
+            content_type=MULTIPART_CONTENT,
+        )
+
+    async def _call(
+        self, state, name, method, path, body=b"", query=None, content_type=None
+    ):
+        """Send a request at its intended time and record both latencies."""
+        loop = asyncio.get_running_loop()
+        intended = state["intended"]
+        if intended > loop.time():
+            await asyncio.sleep(intended - loop.time())
+        sent = loop.time()
+        self.start_lag.record(max(0.0, sent - intended) * 1000)
+
+        headers = []
+        if content_type:
+            headers.append(("content-type", content_type))
+            headers.append(("content-length", str(len(body))))
+        if state["token"]:
+            headers.append(("authorization", f"Token {state['token']}"))
+        status, response = await asgi_request(
+            self.app, method, path, query=query, headers=headers, body=body
+        )
+
+        finished = loop.time()
+        self.service[name].record((finished - sent) * 1000)
+        self.corrected[name].record((finished - intended) * 1000)
+        if status is None or status >= 400:
+            self.errors[name] += 1
+        # the next request is due a think time after this one was
+        state["intended"] = intended + self.think_time
+        return status, response
+
+
+def saturation(steps, slo_ms):
+    """Per endpoint, the first offered rate at which it stopped keeping up.
+
+    That is its corrected p99 went over slo_ms, or sessions were left
+    unfinished. None when it kept up at every rate.
+    """
+    result = {}
+    for step in steps:
+        for name, endpoint in step["endpoints"].items():
+            result.setdefault(name, None)
+            if result[name] is None and (
+                endpoint["corrected"]["p99_ms"] > slo_ms or step["unfinished_sessions"]
+            ):
+                result[name] = step["offered_sessions_per_s"]
+    return result
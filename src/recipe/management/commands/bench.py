@@ -0,0 +1,119 @@
+import json
+import platform
+import tempfile
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the recipe API on a freshly seeded throwaway database and "
+        "print throughput, latency percentiles and query counts as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5)
+        parser.add_argument("--recipes", type=int, default=200, help="Per user.")
+        parser.add_argument("--tags", type=int, default=20, help="Per user.")
+        parser.add_argument("--ingredients", type=int, default=30, help="Per user.")
+        parser.add_argument(
+            "--per-recipe",
+            type=int,
+            default=3,
+            help="Tags and ingredients linked to every recipe.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Measured per scenario."
+        )
+        parser.add_argument("--warmup", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            choices=benchmark.SCENARIOS,
+            help="Run only these scenarios, may be repeated.",
+        )
+        parser.add_argument(
+            "--in-memory",
+            action="store_true",
+            help="Use in-memory SQLite databases instead of temporary files.",
+        )
+        parser.add_argument("--output", help="Also write the results to this file.")
+        parser.add_argument(
+            "--baseline", help="Results of an earlier run to compare against."
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.1,
+            help="Allowed regression against the baseline, 0.1 is 10%%.",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            scenarios = self._run(tmp, options)
+
+        results = {
+            "config": {
+                key: options[key]
+                for key in (
+                    "users",
+                    "recipes",
+                    "tags",
+                    "ingredients",
+                    "per_recipe",
+                    "requests",
+                    "warmup",
+                    "seed",
+                    "in_memory",
+                )
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+            },
+            "scenarios": scenarios,
+        }
+        output = json.dumps(results, indent=2)
+        self.stdout.write(output)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+
+        if baseline is not None:
+            regressions = benchmark.compare(
+                baseline["scenarios"], scenarios, options["tolerance"]
+            )
+            if regressions:
+                raise CommandError(
+                    "Regressions beyond {:.0%}:\n  {}".format(
+                        options["tolerance"], "\n  ".join(regressions)
+                    )
+                )
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
+
+    def _run(self, tmp, options):
+        with benchmark.throwaway_databases(tmp, in_memory=options["in_memory"]):
+            dataset = benchmark.seed(
+                users=options["users"],
+                recipes=options["recipes"],
+                tags=options["tags"],
+                ingredients=options["ingredients"],
+                per_recipe=options["per_recipe"],
+                seed=options["seed"],
+            )
+            runner = benchmark.Benchmark(
+                dataset,
+                requests=options["requests"],
+                warmup=options["warmup"],
+                seed=options["seed"],
+            )
+            return runner.run(options["scenario"] or benchmark.SCENARIOS)
@@ -0,0 +1,71 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipe import orphans, tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete tags and ingredients that no recipe has used for longer than "
+        "the retention period."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the orphans, do not delete them.",
+        )
+        parser.add_argument(
+            "--retention",
+            type=int,
+            help="Keep orphans unlinked or created less than this many seconds "
+            "ago (ORPHAN_RETENTION).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Rows per transaction (ORPHAN_GC_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Seconds to sleep between batches, to leave room for writers.",
+        )
+        parser.add_argument(
+            "--schedule",
+            action="store_true",
+            help=(
+                "Queue a job that collects every ORPHAN_GC_INTERVAL seconds "
+                "on the workers instead of collecting now."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["schedule"]:
+            job = tasks.schedule_orphan_collection()
+            self.stdout.write(
+                f"Orphan collection queued as job {job.pk}, repeating every "
+                f"{settings.ORPHAN_GC_INTERVAL}s."
+            )
+            return
+
+        report = orphans.collect_orphans(
+            retention=options["retention"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+            pause=options["pause"],
+        )
+        self.stdout.write(json.dumps(report, indent=2))
+        key = "found" if options["dry_run"] else "deleted"
+        action = "Would delete" if options["dry_run"] else "Deleted"
+        for name, counts in report.items():
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{action} {counts[key]} orphaned {name}s "
+                    f"of {counts['users']} users."
+                )
+            )
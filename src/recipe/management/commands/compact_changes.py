@@ -0,0 +1,63 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipe import sync, tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact the delta sync change log: drop changes superseded by a "
+        "newer one and tombstones older than the retention period."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention",
+            type=int,
+            help="Keep tombstones younger than this many seconds "
+            "(SYNC_TOMBSTONE_RETENTION).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Rows per transaction (SYNC_COMPACTION_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Seconds to sleep between batches, to leave room for writers.",
+        )
+        parser.add_argument(
+            "--schedule",
+            action="store_true",
+            help=(
+                "Queue a job that compacts every SYNC_COMPACTION_INTERVAL "
+                "seconds on the workers instead of compacting now."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["schedule"]:
+            job = tasks.schedule_change_compaction()
+            self.stdout.write(
+                f"Change log compaction queued as job {job.pk}, repeating every "
+                f"{settings.SYNC_COMPACTION_INTERVAL}s."
+            )
+            return
+
+        report = sync.compact_all(
+            retention=options["retention"],
+            batch_size=options["batch_size"],
+            pause=options["pause"],
+        )
+        self.stdout.write(json.dumps(report, indent=2))
+        for using, counts in report.items():
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{using}: deleted {counts['superseded']} superseded changes "
+                    f"and {counts['tombstones']} tombstones."
+                )
+            )
@@ -0,0 +1,300 @@
+import random
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from recipe import stats
+from recipe.models import Change, Ingredient, Recipe, RecipeStats, Tag
+
+ADJECTIVES = (
+    "Spicy", "Creamy", "Smoky", "Crispy", "Quick", "Roasted", "Grilled",
+    "Classic", "Easy", "Zesty", "Hearty", "Sticky", "Garlic", "Lemon",
+)  # fmt: skip
+DISHES = (
+    "Chicken", "Curry", "Pasta", "Salad", "Soup", "Tacos", "Risotto",
+    "Stew", "Noodles", "Burger", "Pie", "Pancakes", "Stir Fry", "Tart",
+)  # fmt: skip
+TAGS = (
+    "Dinner", "Lunch", "Breakfast", "Vegan", "Vegetarian", "Quick",
+    "Dessert", "Healthy", "Gluten Free", "Spicy", "Comfort", "Budget",
+)  # fmt: skip
+INGREDIENTS = (
+    "salt", "pepper", "olive oil", "garlic", "onion", "butter", "flour",
+    "egg", "tomato", "chicken", "rice", "milk", "sugar", "lemon", "basil",
+)  # fmt: skip
+
+
+def zipf_cum_weights(n, s):
+    """Cumulative weights of ranks 1..n with P(rank k) ~ 1 / k**s."""
+    return list(accumulate(1 / k**s for k in range(1, n + 1)))
+
+
+def sample_zipf(rng, cum_weights, k):
+    """Draw k distinct ranks (0 based), popular ones first more likely."""
+    k = min(k, len(cum_weights))
+    total = cum_weights[-1]
+    picked = set()
+    while len(picked) < k:
+        picked.add(bisect_left(cum_weights, rng.random() * total))
+    return picked
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a large, deterministic synthetic dataset of users, recipes, "
+        "tags and ingredients for load testing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument(
+            "--recipes", type=int, default=100_000, help="Total over all users."
+        )
+        parser.add_argument("--tags", type=int, default=50, help="Per user.")
+        parser.add_argument("--ingredients", type=int, default=200, help="Per user.")
+        parser.add_argument(
+            "--max-tags", type=int, default=5, help="Most tags on one recipe."
+        )
+        parser.add_argument(
+            "--max-ingredients",
+            type=int,
+            default=12,
+            help="Most ingredients on one recipe.",
+        )
+        parser.add_argument(
+            "--zipf",
+            type=float,
+            default=1.1,
+            help="Skew of tag / ingredient popularity and of recipes per user.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument(
+            "--email-prefix",
+            default="load",
+            help='Users are "<prefix><n>@example.com".',
+        )
+        parser.add_argument(
+            "--keep-indexes",
+            action="store_true",
+            help="Don't drop the recipe table indexes while loading.",
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 1:
+            # the recipes are split over the users
+            raise CommandError("--users must be at least 1.")
+        self.rng = random.Random(options["seed"])
+        self.options = options
+        started = time.perf_counter()
+
+        users = self._create_users()
+        recipe_counts = self._recipes_per_user(len(users))
+        by_db = defaultdict(list)
+        for user, count in zip(users, recipe_counts):
+            by_db[router.db_for_write(Recipe, user=user)].append((user, count))
+
+        totals = self._totals = defaultdict(int)
+        for using, owners in by_db.items():
+            with self._deferred_indexes(using):
+                self._generate(using, owners)
+            self.stdout.write(f"{using}: rebuilt indexes")
+            RecipeStats.objects.using(using).bulk_create(
+                [
+                    RecipeStats(user_id=user_id, **values)
+                    for user_id, values in stats.compute_all(
+                        user_ids=[user.pk for user, _ in owners], using=using
+                    ).items()
+                ],
+                batch_size=options["batch_size"],
+            )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {len(users)} users, {totals['recipes']} recipes, "
+                f"{totals['tags']} tags, {totals['ingredients']} ingredients, "
+                f"{totals['tag_links']} + {totals['ingredient_links']} links "
+                f"in {elapsed:.1f}s."
+            )
+        )
+
+    def _create_users(self):
+        User = get_user_model()
+        prefix = self.options["email_prefix"]
+        emails = [f"{prefix}{i}@example.com" for i in range(self.options["users"])]
+        if User.objects.filter(email__in=emails[:1000]).exists():
+            raise CommandError(
+                f"Users {prefix}<n>@example.com already exist, "
+                "use another --email-prefix or a fresh database."
+            )
+        # hashing is by far the slowest part of creating a user,
+        # they all get the same password
+        password = make_password("loadtest123")
+        return User.objects.bulk_create(
+            [User(email=email, password=password) for email in emails],
+            batch_size=self.options["batch_size"],
+        )
+
+    def _recipes_per_user(self, users):
+        """Split --recipes over the users, a few prolific ones own the most."""
+        total = self.options["recipes"]
+        weights = [1 / k ** self.options["zipf"] for k in range(1, users + 1)]
+        self.rng.shuffle(weights)
+        scale = total / sum(weights)
+        counts = [int(weight * scale) for weight in weights]
+        # hand out what rounding down left over
+        for index in self.rng.sample(range(users), total - sum(counts)):
+            counts[index] += 1
+        return counts
+
+    def _generate(self, using, owners):
+        """Create the owners' tags and ingredients, then their recipes in batches."""
+        options = self.options
+        tag_weights = zipf_cum_weights(options["tags"], options["zipf"])
+        ingredient_weights = zipf_cum_weights(options["ingredients"], options["zipf"])
+
+        pending = []
+        for user, count in owners:
+            with transaction.atomic(using=using):
+                # fixed width suffixes: the serializers look names up with
+                # icontains, so no name may be contained in another one
+                tags = Tag.objects.using(using).bulk_create(
+                    [
+                        Tag(user=user, title=f"{TAGS[i % len(TAGS)]} {i:04d}")
+                        for i in range(options["tags"])
+                    ]
+                )
+                ingredients = Ingredient.objects.using(using).bulk_create(
+                    [
+                        Ingredient(
+                            user=user,
+                            name=f"{INGREDIENTS[i % len(INGREDIENTS)]} {i:04d}",
+                        )
+                        for i in range(options["ingredients"])
+                    ]
+                )
+                self._log_changes(using, "tag", tags)
+                self._log_changes(using, "ingredient", ingredients)
+            self._totals["tags"] += len(tags)
+            self._totals["ingredients"] += len(ingredients)
+            tag_ids = [tag.pk for tag in tags]
+            ingredient_ids = [ingredient.pk for ingredient in ingredients]
+            for _ in range(count):
+                pending.append((user, tag_ids, ingredient_ids))
+                if len(pending) >= options["batch_size"]:
+                    self._flush(using, pending, tag_weights, ingredient_weights)
+                    pending = []
+        if pending:
+            self._flush(using, pending, tag_weights, ingredient_weights)
+
+    def _flush(self, using, pending, tag_weights, ingredient_weights):
+        """Insert one batch of recipes and their links in one transaction."""
+        rng = self.rng
+        options = self.options
+        recipes = [
+            Recipe(
+                user=user,
+                title=f"{rng.choice(ADJECTIVES)} {rng.choice(DISHES)}",
+                # log-normal: most recipes are cheap and quick, a few are not
+                time_minutes=max(1, min(600, round(rng.lognormvariate(3.4, 0.7)))),
+                price=Decimal(
+                    f"{max(0.5, min(999.99, rng.lognormvariate(2.4, 0.6))):.2f}"
+                ),
+            )
+            for user, _, _ in pending
+        ]
+        with transaction.atomic(using=using):
+            Recipe.objects.using(using).bulk_create(recipes)
+            self._log_changes(using, "recipe", recipes)
+            tag_links = []
+            ingredient_links = []
+            for recipe, (_, tag_ids, ingredient_ids) in zip(recipes, pending):
+                for rank in sample_zipf(
+                    rng, tag_weights, rng.randint(0, options["max_tags"])
+                ):
+                    tag_links.append((recipe.pk, tag_ids[rank]))
+                for rank in sample_zipf(
+                    rng,
+                    ingredient_weights,
+                    rng.randint(1, options["max_ingredients"]),
+                ):
+                    ingredient_links.append((recipe.pk, ingredient_ids[rank]))
+            # plain executemany, model instances for the links would cost
+            # more than the inserts themselves
+            with connections[using].cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO "{Recipe.tags.through._meta.db_table}" '
+                    '("recipe_id", "tag_id") VALUES (%s, %s)',
+                    tag_links,
+                )
+                cursor.executemany(
+                    f'INSERT INTO "{Recipe.ingredients.through._meta.db_table}" '
+                    '("recipe_id", "ingredient_id") VALUES (%s, %s)',
+                    ingredient_links,
+                )
+        self._totals["recipes"] += len(recipes)
+        self._totals["tag_links"] += len(tag_links)
+        self._totals["ingredient_links"] += len(ingredient_links)
+
+    def _log_changes(self, using, model, objects):
+        """Add the sync change log rows signals would have added."""
+        connection = connections[using]
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO "{Change._meta.db_table}" '
+                '("user_id", "model", "object_id", "deleted", "created_at") '
+                "VALUES (%s, %s, %s, %s, %s)",
+                [(obj.user_id, model, obj.pk, False, now) for obj in objects],
+            )
+
+    @contextmanager
+    def _deferred_indexes(self, using):
+        """Drop the recipe tables' secondary indexes, recreate them after.
+
+        Building an index once over the loaded rows is much faster than
+        updating it on every insert. Only done on SQLite, whose index
+        definitions can be read back from sqlite_master.
+        """
+        connection = connections[using]
+        if self.options["keep_indexes"] or connection.vendor != "sqlite":
+            yield
+            return
+
+        tables = [
+            model._meta.db_table
+            for model in (
+                Recipe,
+                Tag,
+                Ingredient,
+                Recipe.tags.through,
+                Recipe.ingredients.through,
+                Change,
+            )
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+                "AND sql IS NOT NULL AND tbl_name IN (%s)"
+                % ", ".join(["%s"] * len(tables)),
+                tables,
+            )
+            indexes = cursor.fetchall()
+            for name, _ in indexes:
+                cursor.execute(f'DROP INDEX "{name}"')
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                for _, sql in indexes:
+                    cursor.execute(sql)
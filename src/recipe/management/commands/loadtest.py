@@ -0,0 +1,173 @@
+import asyncio
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe import benchmark, loadtest
+
+
+def parse_mix(value):
+    """Parse "list=40,filter=20" into {"list": 40, "filter": 20}."""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in loadtest.DEFAULT_MIX or not weight.isdigit():
+            raise CommandError(
+                f"Invalid --mix entry {item!r}, expected <action>=<weight> "
+                f"with action one of {', '.join(loadtest.DEFAULT_MIX)}."
+            )
+        mix[name] = int(weight)
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test app.asgi.application in process with open-loop session "
+        "arrivals, stepping through rates to find where each endpoint "
+        "saturates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rates",
+            default="2,5,10,20",
+            help="Comma separated session arrival rates per second, one step each.",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=10.0, help="Seconds per step."
+        )
+        parser.add_argument(
+            "--drain-timeout",
+            type=float,
+            default=30.0,
+            help="Seconds to wait for running sessions after a step.",
+        )
+        parser.add_argument(
+            "--actions",
+            type=int,
+            default=5,
+            help="Actions per session between login and logout.",
+        )
+        parser.add_argument(
+            "--mix",
+            type=parse_mix,
+            default=loadtest.DEFAULT_MIX,
+            help="Weights of the actions, e.g. list=40,filter=20,create=25,upload=15.",
+        )
+        parser.add_argument(
+            "--think-time",
+            type=float,
+            default=0.05,
+            help="Seconds between the requests of a session.",
+        )
+        parser.add_argument(
+            "--slo-ms",
+            type=float,
+            default=500.0,
+            help="Corrected p99 above which an endpoint counts as saturated.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=50,
+            help="Simulated users, at most that many sessions run at once.",
+        )
+        parser.add_argument(
+            "--recipes", type=int, default=20, help="Seeded recipes per user."
+        )
+        parser.add_argument(
+            "--existing-db",
+            action="store_true",
+            help="Run against the configured database instead of a seeded copy.",
+        )
+        parser.add_argument(
+            "--email-pattern",
+            default="load{}@example.com",
+            help="With --existing-db, emails of the users to log in as.",
+        )
+        parser.add_argument(
+            "--password",
+            default="loadtest123",
+            help="With --existing-db, their password (generate_data's default).",
+        )
+        parser.add_argument("--output", help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        try:
+            rates = [float(rate) for rate in options["rates"].split(",")]
+        except ValueError:
+            raise CommandError("--rates must be comma separated numbers.")
+
+        if options["existing_db"]:
+            credentials = [
+                (options["email_pattern"].format(i), options["password"])
+                for i in range(options["users"])
+            ]
+            steps = self._run(credentials, rates, options)
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                # on files: Django serves concurrent ASGI requests from
+                # separate threads and in-memory SQLite databases fail those
+                # with "database table is locked" instead of waiting
+                with benchmark.throwaway_databases(tmp):
+                    dataset = benchmark.seed(
+                        users=options["users"],
+                        recipes=options["recipes"],
+                        seed=options["seed"],
+                    )
+                    credentials = [
+                        (account["user"].email, benchmark.PASSWORD)
+                        for account in dataset
+                    ]
+                    steps = self._run(credentials, rates, options)
+
+        results = {
+            "config": {
+                key: options[key]
+                for key in (
+                    "rates",
+                    "duration",
+                    "actions",
+                    "mix",
+                    "think_time",
+                    "slo_ms",
+                    "users",
+                    "seed",
+                )
+            },
+            "steps": steps,
+            "saturation": loadtest.saturation(steps, options["slo_ms"]),
+        }
+        output = json.dumps(results, indent=2)
+        self.stdout.write(output)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+
+    def _run(self, credentials, rates, options):
+        # imported here, it builds the application when imported
+        from app.asgi import application
+
+        runner = loadtest.LoadTest(
+            application,
+            credentials,
+            mix=options["mix"],
+            actions=options["actions"],
+            think_time=options["think_time"],
+            seed=options["seed"],
+        )
+
+        async def steps():
+            results = []
+            for rate in rates:
+                self.stderr.write(f"{rate:g} sessions/s for {options['duration']:g}s")
+                results.append(
+                    await runner.run_step(
+                        rate, options["duration"], options["drain_timeout"]
+                    )
+                )
+            return results
+
+        return asyncio.run(steps())
@@ -0,0 +1,158 @@
+import json
+import random
+import time
+
+from django.core.management.base import CommandError
+
+from core.routers import use_user_shard
+from core.slowlog import percentile
+from recipe import pantry, similarity
+from recipe.models import Ingredient
+
+from .similarity_index import Command as SimilarityIndexCommand
+
+
+def _latencies(lookup, pantries):
+    latencies = []
+    for ingredient_ids in pantries:
+        started = time.perf_counter()
+        lookup(ingredient_ids)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+    }
+
+
+def _scan(ingredients, pantry_ids, max_missing, limit):
+    """Best matches checking every recipe, like the GROUP BY/HAVING query."""
+    pantry_ids = set(pantry_ids)
+    matches = []
+    for recipe_id, recipe_ingredients in ingredients.items():
+        used = len(recipe_ingredients & pantry_ids)
+        missing = len(recipe_ingredients) - used
+        if used and missing <= max_missing:
+            matches.append((missing, -used, -recipe_id))
+    return [(-recipe_id, missing) for missing, _, recipe_id in sorted(matches)[:limit]]
+
+
+class Command(SimilarityIndexCommand):
+    help = (
+        "Match pantries of growing size against the recipe index of users, or "
+        "of a generated collection, and report lookup latency against the "
+        "GROUP BY/HAVING query (a full scan for generated ones) as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            help="Id or email of a user, may be repeated. All users by default.",
+        )
+        parser.add_argument(
+            "--pantry",
+            default="5,20,100,500",
+            help="Comma separated pantry sizes, in ingredients.",
+        )
+        parser.add_argument("--max-missing", type=int, default=2)
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument(
+            "--queries", type=int, default=20, help="Lookups measured per size."
+        )
+        parser.add_argument(
+            "--synthetic",
+            type=int,
+            metavar="RECIPES",
+            help="Measure a generated collection of this many recipes instead.",
+        )
+        parser.add_argument("--ingredients", type=int, default=500)
+        parser.add_argument(
+            "--per-recipe",
+            type=int,
+            default=8,
+            help="Ingredients of every synthetic recipe.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            options["sizes"] = [int(size) for size in options["pantry"].split(",")]
+        except ValueError:
+            raise CommandError("--pantry must be comma separated integers.")
+        rng = random.Random(options["seed"])
+        if options["synthetic"]:
+            report = {"synthetic": self._synthetic(rng, options)}
+        else:
+            report = {
+                user.email: self._user(user, rng, options)
+                for user in self._users(options["user"])
+            }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _user(self, user, rng, options):
+        with use_user_shard(user):
+            started = time.perf_counter()
+            index = similarity.build(user)
+            build_ms = (time.perf_counter() - started) * 1000
+            ingredient_ids = list(
+                Ingredient.objects.filter(user=user).values_list("pk", flat=True)
+            )
+            return self._measure(
+                index,
+                ingredient_ids,
+                lambda ids: pantry.matches_sql(
+                    user, ids, options["max_missing"], options["limit"]
+                ),
+                build_ms,
+                rng,
+                options,
+            )
+
+    def _synthetic(self, rng, options):
+        ingredient_ids = list(range(options["ingredients"]))
+        per_recipe = min(options["per_recipe"], len(ingredient_ids))
+        ingredients = {
+            recipe_id: set(rng.sample(ingredient_ids, per_recipe))
+            for recipe_id in range(1, options["synthetic"] + 1)
+        }
+        started = time.perf_counter()
+        index = similarity.RecipeIndex(user_id=None)
+        for recipe_id, recipe_ingredients in ingredients.items():
+            index.set_recipe(
+                recipe_id, [("ingredient", pk) for pk in recipe_ingredients]
+            )
+        build_ms = (time.perf_counter() - started) * 1000
+        return self._measure(
+            index,
+            ingredient_ids,
+            lambda ids: _scan(
+                ingredients, ids, options["max_missing"], options["limit"]
+            ),
+            build_ms,
+            rng,
+            options,
+        )
+
+    def _measure(self, index, ingredient_ids, reference, build_ms, rng, options):
+        result = {
+            "recipes": len(index),
+            "ingredients": len(ingredient_ids),
+            "build_ms": round(build_ms, 3),
+        }
+        max_missing, limit = options["max_missing"], options["limit"]
+        for size in options["sizes"]:
+            size = min(size, len(ingredient_ids))
+            pantries = [
+                rng.sample(ingredient_ids, size) for _ in range(options["queries"])
+            ]
+            result[f"pantry_{size}"] = {
+                "index": _latencies(
+                    lambda ids: pantry.rank(index, ids, max_missing, limit), pantries
+                ),
+                "reference": _latencies(reference, pantries),
+                "mismatches": sum(
+                    pantry.rank(index, ids, max_missing, limit) != reference(ids)
+                    for ids in pantries
+                ),
+            }
+        return result
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from recipe.models import RecipeStats
+from recipe import stats
+
+
+class Command(BaseCommand):
+    help = "Recompute per-user recipe stats in bulk and report any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drift, do not write the recomputed values.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows per bulk_create / bulk_update statement.",
+        )
+
+    def handle(self, *args, **options):
+        checked = drifted = 0
+        for using in settings.RECIPE_SHARDS or [DEFAULT_DB_ALIAS]:
+            shard_checked, shard_drifted = self._reconcile(using, options)
+            checked += shard_checked
+            drifted += shard_drifted
+
+        action = "found" if options["dry_run"] else "fixed"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Checked {checked} users, {action} drift for {drifted}."
+            )
+        )
+
+    def _reconcile(self, using, options):
+        expected = stats.compute_all(using=using)
+        existing = {row.user_id: row for row in RecipeStats.objects.using(using)}
+
+        to_create = []
+        to_update = []
+        drifted = 0
+        for user_id in expected.keys() | existing.keys():
+            values = expected.get(user_id, stats.empty_stats())
+            row = existing.get(user_id)
+            if row is None:
+                if values["recipe_count"]:
+                    drifted += 1
+                    self.stdout.write(f"{using} user {user_id}: missing stats row")
+                    to_create.append(RecipeStats(user_id=user_id, **values))
+                continue
+
+            changes = {
+                field: (getattr(row, field), value)
+                for field, value in values.items()
+                if getattr(row, field) != value
+            }
+            if changes:
+                drifted += 1
+                detail = ", ".join(
+                    f"{field} {old} -> {new}" for field, (old, new) in changes.items()
+                )
+                self.stdout.write(f"{using} user {user_id}: {detail}")
+                for field, (old, new) in changes.items():
+                    setattr(row, field, new)
+                to_update.append(row)
+
+        if not options["dry_run"]:
+            batch_size = options["batch_size"]
+            with transaction.atomic(using=using):
+                RecipeStats.objects.using(using).bulk_create(
+                    to_create, batch_size=batch_size
+                )
+                RecipeStats.objects.using(using).bulk_update(
+                    to_update, stats.STAT_FIELDS, batch_size=batch_size
+                )
+
+        return len(expected.keys() | existing.keys()), drifted
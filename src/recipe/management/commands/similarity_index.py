@@ -0,0 +1,141 @@
+import json
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.routers import use_user_shard
+from core.slowlog import percentile
+from recipe import similarity
+
+
+def _latencies(lookup, recipe_ids):
+    latencies = []
+    for recipe_id in recipe_ids:
+        started = time.perf_counter()
+        lookup(recipe_id)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+    }
+
+
+def _brute_force(features, recipe_id, k):
+    """Top k by Jaccard over every other recipe, like a per request scan."""
+    mine = features[recipe_id]
+    scored = [
+        (similarity.jaccard(mine, theirs), other)
+        for other, theirs in features.items()
+        if other != recipe_id and mine & theirs
+    ]
+    return [(other, score) for score, other in sorted(scored, reverse=True)[:k]]
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the similar recipes index of users the way a serving process "
+        "does, and report build time and top-k lookup latency against a brute "
+        "force Jaccard scan as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            help="Id or email of a user, may be repeated. All users by default.",
+        )
+        parser.add_argument("--k", type=int, default=10, help="Recipes per lookup.")
+        parser.add_argument(
+            "--queries", type=int, default=100, help="Lookups measured per user."
+        )
+        parser.add_argument(
+            "--synthetic",
+            type=int,
+            metavar="RECIPES",
+            help="Measure a generated collection of this many recipes instead.",
+        )
+        parser.add_argument("--tags", type=int, default=50)
+        parser.add_argument("--ingredients", type=int, default=500)
+        parser.add_argument(
+            "--per-recipe",
+            type=int,
+            default=8,
+            help="Tags and ingredients of every synthetic recipe.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        if options["synthetic"]:
+            report = {"synthetic": self._synthetic(rng, options)}
+        else:
+            report = {
+                user.email: self._user(user, rng, options)
+                for user in self._users(options["user"])
+            }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _users(self, wanted):
+        users = get_user_model().objects.order_by("pk")
+        if not wanted:
+            return users.iterator()
+        selected = []
+        for value in wanted:
+            lookup = {"pk": value} if value.isdigit() else {"email": value}
+            try:
+                selected.append(users.get(**lookup))
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user {value!r}.")
+        return selected
+
+    def _user(self, user, rng, options):
+        started = time.perf_counter()
+        with use_user_shard(user):
+            index = similarity.build(user)
+            build_ms = (time.perf_counter() - started) * 1000
+            features = {
+                recipe_id: set(recipe_features)
+                for recipe_id, recipe_features in similarity._features(user).items()
+            }
+        return self._measure(index, features, build_ms, rng, options)
+
+    def _synthetic(self, rng, options):
+        tags, ingredients = options["tags"], options["ingredients"]
+        per_recipe = options["per_recipe"]
+        features = {}
+        for recipe_id in range(1, options["synthetic"] + 1):
+            # a quarter tags, the rest ingredients
+            chosen = {("tag", rng.randrange(tags)) for _ in range(per_recipe // 4)}
+            while len(chosen) < per_recipe:
+                chosen.add(("ingredient", rng.randrange(ingredients)))
+            features[recipe_id] = chosen
+        started = time.perf_counter()
+        index = similarity.RecipeIndex(user_id=None)
+        for recipe_id, recipe_features in features.items():
+            index.set_recipe(recipe_id, recipe_features)
+        build_ms = (time.perf_counter() - started) * 1000
+        return self._measure(index, features, build_ms, rng, options)
+
+    def _measure(self, index, features, build_ms, rng, options):
+        result = {
+            "recipes": len(index),
+            "features": len(index.bit_of),
+            "build_ms": round(build_ms, 3),
+        }
+        if not features:
+            return result
+        k = options["k"]
+        sample = [rng.choice(list(features)) for _ in range(options["queries"])]
+        result["index"] = _latencies(lambda pk: index.similar(pk, k), sample)
+        result["brute_force"] = _latencies(
+            lambda pk: _brute_force(features, pk, k), sample
+        )
+        # scores must agree, ids may differ where recipes tie at the cut
+        result["mismatches"] = sum(
+            [score for _, score in index.similar(pk, k)]
+            != [score for _, score in _brute_force(features, pk, k)]
+            for pk in sample
+        )
+        return result
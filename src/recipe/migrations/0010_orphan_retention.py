@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:15
+
+from django.db import migrations, models
+
+
+def add_created_at(model_name):
+    # auto_now_add would fill every existing row with the migration time,
+    # which rebuilds the table on SQLite and makes all current orphans look
+    # new. The column is added as a plain nullable one instead, existing
+    # rows keep NULL, which the orphan collector treats as old.
+    return migrations.SeparateDatabaseAndState(
+        database_operations=[
+            migrations.AddField(
+                model_name=model_name,
+                name="created_at",
+                field=models.DateTimeField(null=True),
+            ),
+        ],
+        state_operations=[
+            migrations.AddField(
+                model_name=model_name,
+                name="created_at",
+                field=models.DateTimeField(auto_now_add=True, null=True),
+            ),
+        ],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipe", "0009_admin_search_indexes"),
+    ]
+
+    operations = [
+        add_created_at("ingredient"),
+        add_created_at("tag"),
+    ]
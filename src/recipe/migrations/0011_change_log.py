@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    """One change per existing object, so a sync from 0 returns everything."""
+    Change = apps.get_model("recipe", "Change")
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for name in ("recipe", "tag", "ingredient"):
+            model = apps.get_model("recipe", name)
+            # set-based, nothing is loaded into Python
+            cursor.execute(
+                f"INSERT INTO {quote(Change._meta.db_table)} "
+                "(user_id, model, object_id, deleted, created_at) "
+                f"SELECT user_id, %s, id, %s, CURRENT_TIMESTAMP "
+                f"FROM {quote(model._meta.db_table)} ORDER BY id",
+                [name, False],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipe", "0010_orphan_retention"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncHorizon",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("cursor", models.BigIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Change",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model", models.CharField(max_length=20)),
+                ("object_id", models.BigIntegerField()),
+                ("deleted", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["user", "id"], name="change_cursor_idx"),
+                    models.Index(
+                        fields=["model", "object_id"], name="change_object_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
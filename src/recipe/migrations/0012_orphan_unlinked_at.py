@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipe", "0011_change_log"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingredient",
+            name="unlinked_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="tag",
+            name="unlinked_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -19,7 +19,16 @@ def recipe_image_file_path(instance, filename):
 
 class Recipe(models.Model):
 
-    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    # no database constraint so the table can live on a user shard
+    # without the user table, see core.routers.UserShardRouter. Also when
+    # sharding is off: the default database and the shards share these
+    # migrations, so the schema can't depend on RECIPE_SHARD_COUNT, and
+    # adding the constraint back later means rebuilding the table on
+    # SQLite. Deletes still cascade through the ORM (and to the shards
+    # through recipe.signals), only raw SQL writes go unchecked.
+    user = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, db_constraint=False
+    )
     title = models.CharField(max_length=220)
     description = models.TextField(null=True, blank=True)
     time_minutes = models.IntegerField()
@@ -29,6 +38,10 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField("Ingredient")
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
 
+    class Meta:
+        # prefix searches in the admin
+        indexes = [models.Index(fields=["title"], name="recipe_title_idx")]
+
     def __str__(self):
         return (f"{self.title} -----> {self.id}")
 
@@ -36,7 +49,18 @@ class Recipe(models.Model):
 class Tag(models.Model):
     """Tags for filtering recipes"""
     title = models.CharField(max_length=50)
-    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    # orphans created or unlinked less than ORPHAN_RETENTION ago are kept
+    # (see recipe.orphans), null for rows created before the column existed
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
+    # when a recipe last stopped using it, null if none ever did
+    unlinked_at = models.DateTimeField(null=True, blank=True)
+    # no database constraint, see Recipe.user
+    user = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, db_constraint=False
+    )
+
+    class Meta:
+        indexes = [models.Index(fields=["title"], name="tag_title_idx")]
 
     def __str__(self):
         return self.title
@@ -45,8 +69,88 @@ class Tag(models.Model):
 class Ingredient(models.Model):
     """Ingredient for Recipes."""
     name = models.CharField(max_length=255)
-    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    # orphans created or unlinked less than ORPHAN_RETENTION ago are kept
+    # (see recipe.orphans), null for rows created before the column existed
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
+    # when a recipe last stopped using it, null if none ever did
+    unlinked_at = models.DateTimeField(null=True, blank=True)
+    # no database constraint, see Recipe.user
+    user = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, db_constraint=False
+    )
+
+    class Meta:
+        indexes = [models.Index(fields=["name"], name="ingredient_name_idx")]
+
+    def __str__(self):
+        return self.name
+
+class RecipeStats(models.Model):
+    """Per-user recipe statistics, maintained incrementally on every write."""
+    user = models.OneToOneField(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        related_name="recipe_stats",
+        db_constraint=False,
+    )
+    recipe_count = models.IntegerField(default=0)
+    total_price = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_time_minutes = models.BigIntegerField(default=0)
+    # number of tag / ingredient assignments across all the user's recipes
+    tag_count = models.IntegerField(default=0)
+    ingredient_count = models.IntegerField(default=0)
+
+    @property
+    def average_price(self):
+        if not self.recipe_count:
+            return None
+        return round(self.total_price / self.recipe_count, 2)
+
+    @property
+    def average_time_minutes(self):
+        if not self.recipe_count:
+            return None
+        return round(self.total_time_minutes / self.recipe_count, 2)
 
+    def __str__(self):
+        return f"Stats for {self.user}"
+
+
+class Change(models.Model):
+    """A write to a recipe, tag or ingredient, for delta sync (recipe.sync).
+
+    The id is the sync cursor. Compaction keeps only the latest change per
+    object and drops tombstones after SYNC_TOMBSTONE_RETENTION.
+    """
+    user = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, db_constraint=False,
+        related_name="+",
+    )
+    # "recipe", "tag" or "ingredient"
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    # a tombstone, the object was deleted
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # a user's changes after a cursor
+            models.Index(fields=["user", "id"], name="change_cursor_idx"),
+            # older changes of the same object, for compaction
+            models.Index(fields=["model", "object_id"], name="change_object_idx"),
+        ]
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        action = "deleted" if self.deleted else "saved"
+        return f"{self.model} {self.object_id} {action} ({self.id})"
+
+
+class SyncHorizon(models.Model):
+    """Highest change id of a compaction that dropped tombstones.
+
+    A client whose cursor is older may have missed a delete and has to
+    sync again from the start.
+    """
+    cursor = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,131 @@
+"""Garbage collection of tags and ingredients no recipe uses anymore.
+
+Updating a recipe's tags or ingredients unlinks the old ones but keeps
+their rows, so users accumulate rows that only slow down the icontains
+lookups of the recipe serializer. Orphans are found with an anti-join
+(NOT EXISTS on the through table, served by its index on the tag or
+ingredient column) and deleted in batches.
+
+The grace period counts from when a row became an orphan: unlinked_at is
+stamped whenever a recipe stops using a tag or ingredient (see
+recipe.signals), and rows never unlinked count from created_at.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from . import sync
+from .models import Ingredient, Recipe, Tag
+
+# model: (through model, its column pointing at the model)
+LINKS = {
+    Tag: (Recipe.tags.through, "tag"),
+    Ingredient: (Recipe.ingredients.through, "ingredient"),
+}
+
+
+def stamp_unlinked(queryset):
+    """Restart the grace period of the tags or ingredients in queryset."""
+    return queryset.update(unlinked_at=timezone.now())
+
+
+def orphans(model, using=DEFAULT_DB_ALIAS, retention=None):
+    """Rows of model no recipe links to for more than retention seconds.
+
+    That is, created and last unlinked over retention seconds ago. Rows
+    without created_at predate the column and count as old.
+    """
+    if retention is None:
+        retention = settings.ORPHAN_RETENTION
+    through, field = LINKS[model]
+    links = through.objects.using(using).filter(**{field: OuterRef("pk")})
+    cutoff = timezone.now() - timedelta(seconds=retention)
+    return (
+        model.objects.using(using)
+        .filter(~Exists(links))
+        .filter(Q(created_at__isnull=True) | Q(created_at__lt=cutoff))
+        .filter(Q(unlinked_at__isnull=True) | Q(unlinked_at__lt=cutoff))
+    )
+
+
+def _delete_orphans(cursor, model, ids):
+    """Delete the ids that are still orphans, in a single statement.
+
+    The NOT EXISTS is checked again by the DELETE itself, so a row a
+    recipe linked to since it was selected is kept.
+    """
+    through, field = LINKS[model]
+    quote = cursor.db.ops.quote_name
+    table = quote(model._meta.db_table)
+    pk = quote(model._meta.pk.column)
+    through_table = quote(through._meta.db_table)
+    column = quote(through._meta.get_field(field).column)
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor.execute(
+        f"DELETE FROM {table} WHERE {pk} IN ({placeholders}) AND NOT EXISTS "
+        f"(SELECT 1 FROM {through_table} WHERE {through_table}.{column} = "
+        f"{table}.{pk})",
+        ids,
+    )
+    return cursor.rowcount
+
+
+def collect_orphans(
+    retention=None, batch_size=None, dry_run=False, pause=0.0, progress=None
+):
+    """Delete orphaned tags and ingredients on every recipe database.
+
+    Works through each table in primary key order, batch_size rows per
+    transaction. With dry_run nothing is deleted and "deleted" stays 0.
+    progress is called after every batch with the report so far.
+    Returns {"tag": {"found", "deleted", "users"}, "ingredient": {...}}
+    where users is the number of users that had orphans.
+    """
+    batch_size = batch_size or settings.ORPHAN_GC_BATCH_SIZE
+    report = {}
+    for model in LINKS:
+        name = model._meta.model_name
+        report[name] = {"found": 0, "deleted": 0, "users": 0}
+        users = set()
+        for using in settings.RECIPE_SHARDS or [DEFAULT_DB_ALIAS]:
+            queryset = orphans(model, using, retention).order_by("pk")
+            last = 0
+            while True:
+                with transaction.atomic(using=using):
+                    rows = list(
+                        queryset.filter(pk__gt=last).values_list("pk", "user_id")[
+                            :batch_size
+                        ]
+                    )
+                    if rows and not dry_run:
+                        ids = [pk for pk, _ in rows]
+                        with connections[using].cursor() as cursor:
+                            report[name]["deleted"] += _delete_orphans(
+                                cursor, model, ids
+                            )
+                        # tombstones for delta sync, for the rows really gone
+                        kept = set(
+                            model.objects.using(using)
+                            .filter(pk__in=ids)
+                            .values_list("pk", flat=True)
+                        )
+                        sync.record_deletes(
+                            model, [row for row in rows if row[0] not in kept], using
+                        )
+                if rows:
+                    last = rows[-1][0]
+                    users.update(user_id for _, user_id in rows)
+                    report[name]["found"] += len(rows)
+                    report[name]["users"] = len(users)
+                    if progress is not None:
+                        progress(**report)
+                if len(rows) < batch_size:
+                    break
+                if pause:
+                    time.sleep(pause)
+    return report
@@ -0,0 +1,94 @@
+"""Recipes a user can cook with the ingredients they have.
+
+A recipe matches a pantry when at most max_missing of its ingredients are
+not in it. Matches rank by fewest missing, then most pantry ingredients
+used, then newest. Recipes sharing no ingredient with the pantry never
+match, so neither do recipes without ingredients.
+
+Lookups use the user's recipe.similarity index. Each pantry ingredient's
+posting list adds one to the count of every recipe using it, and a
+recipe's missing ingredients are its ingredient count minus that. That
+work follows the links of the pantry's ingredients and runs in C (set
+iteration and Counter.update). Large pantries, whose ingredients are in
+most recipes, instead AND every recipe's bitset with the bits of the
+ingredients the pantry lacks, one popcount per recipe.
+
+The GROUP BY/HAVING query over the through table, matches_sql(), reads
+every link of every recipe of the user, whatever the pantry. It is kept
+as the reference the index is checked and benchmarked against ("manage.py
+pantry_index").
+"""
+
+import heapq
+from collections import Counter
+
+from django.db.models import Count, F, Q
+
+from . import similarity
+from .models import Recipe
+
+# Testing a recipe's bitset costs about as much as counting this many
+# links, rank() tests them all once a pantry has more links per recipe.
+SCAN_FACTOR = 2
+
+
+def rank(index, ingredient_ids, max_missing, limit):
+    """[(recipe id, missing)] of the best limit matches in a RecipeIndex."""
+    bits = [
+        index.bit_of[feature]
+        for feature in {("ingredient", pk) for pk in ingredient_ids}
+        if feature in index.bit_of
+    ]
+    postings = [index.postings.get(bit, ()) for bit in bits]
+    counts = index.ingredient_counts
+
+    matches = []
+    if sum(map(len, postings)) <= SCAN_FACTOR * len(index):
+        # count the pantry ingredients of the recipes using any
+        used = Counter()
+        for recipe_ids in postings:
+            used.update(recipe_ids)
+        for recipe_id, count in used.items():
+            missing = counts[recipe_id] - count
+            if missing <= max_missing:
+                matches.append((missing, -count, -recipe_id))
+    else:
+        # a pantry with most of the links, test every recipe against the
+        # bits of the ingredients it lacks instead
+        lacking = index.ingredient_mask
+        for bit in bits:
+            lacking &= ~(1 << bit)
+        for recipe_id, vector in index.vectors.items():
+            missing = (vector & lacking).bit_count()
+            count = counts[recipe_id] - missing
+            if missing <= max_missing and count:
+                matches.append((missing, -count, -recipe_id))
+    return [
+        (-recipe_id, missing)
+        for missing, _, recipe_id in heapq.nsmallest(limit, matches)
+    ]
+
+
+def matches(user, ingredient_ids, max_missing, limit):
+    """[(recipe id, missing)] of the user's recipes cookable from a pantry.
+
+    Ingredients of other users, or that don't exist, are ignored.
+    """
+    with similarity.user_index(user) as index:
+        return rank(index, ingredient_ids, max_missing, limit)
+
+
+def matches_sql(user, ingredient_ids, max_missing, limit):
+    """Same as matches(), in one GROUP BY/HAVING query on the user's shard."""
+    recipes = (
+        Recipe.objects.filter(user=user)
+        .annotate(
+            total=Count("ingredients"),
+            used=Count("ingredients", filter=Q(ingredients__in=ingredient_ids)),
+        )
+        .filter(used__gt=0)
+        .annotate(missing=F("total") - F("used"))
+        .filter(missing__lte=max_missing)
+        .order_by("missing", "-used", "-pk")
+    )
+    return list(recipes.values_list("pk", "missing")[:limit])
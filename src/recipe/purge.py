@@ -0,0 +1,109 @@
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from core.routers import shard_for_user_id
+
+from .models import Change, Ingredient, Recipe, RecipeStats, Tag
+
+
+def _delete_in(cursor, model, column, ids):
+    """DELETE FROM the model's table WHERE column IN ids, returns the row count.
+
+    Raw SQL, so nothing is loaded into Python and no signals are sent.
+    """
+    quote = cursor.db.ops.quote_name
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor.execute(
+        f"DELETE FROM {quote(model._meta.db_table)} "
+        f"WHERE {quote(column)} IN ({placeholders})",
+        ids,
+    )
+    return cursor.rowcount
+
+
+def _column(through, field):
+    return through._meta.get_field(field).column
+
+
+def purge_user_data(user_id, batch_size=None, progress=None, pause=0.0):
+    """Delete a user's recipes, tags, ingredients and images in batches.
+
+    Every batch of batch_size rows is its own short transaction with a
+    few set-based DELETEs (links first, then the rows they point at), so
+    writers only ever wait for one batch. Image files are removed after
+    their rows are committed. progress is called after every batch with
+    the totals so far. Safe to run again after an interruption.
+    Returns the totals.
+    """
+    batch_size = batch_size or settings.ACCOUNT_PURGE_BATCH_SIZE
+    using = shard_for_user_id(user_id)
+    storage = Recipe._meta.get_field("image").storage
+    tag_links = Recipe.tags.through
+    ingredient_links = Recipe.ingredients.through
+    totals = {"recipes": 0, "tags": 0, "ingredients": 0, "links": 0, "images": 0}
+
+    def report(**counts):
+        for key, value in counts.items():
+            totals[key] += value
+        if progress is not None:
+            progress(**totals)
+        if pause:
+            time.sleep(pause)
+
+    recipes = Recipe.objects.using(using).filter(user_id=user_id)
+    while True:
+        with transaction.atomic(using=using):
+            rows = list(recipes.values_list("pk", "image")[:batch_size])
+            ids = [pk for pk, _ in rows]
+            links = deleted = 0
+            if ids:
+                with connections[using].cursor() as cursor:
+                    for through in (tag_links, ingredient_links):
+                        links += _delete_in(
+                            cursor, through, _column(through, "recipe"), ids
+                        )
+                    deleted = _delete_in(cursor, Recipe, Recipe._meta.pk.column, ids)
+        images = [name for _, name in rows if name]
+        for name in images:
+            storage.delete(name)
+        if rows:
+            report(recipes=deleted, links=links, images=len(images))
+        if len(rows) < batch_size:
+            break
+
+    for model, through, field, key in (
+        (Tag, tag_links, "tag", "tags"),
+        (Ingredient, ingredient_links, "ingredient", "ingredients"),
+    ):
+        queryset = model.objects.using(using).filter(user_id=user_id)
+        while True:
+            with transaction.atomic(using=using):
+                ids = list(queryset.values_list("pk", flat=True)[:batch_size])
+                links = deleted = 0
+                if ids:
+                    with connections[using].cursor() as cursor:
+                        # normally gone with the recipes, unless another
+                        # user's recipe was linked to them
+                        links = _delete_in(
+                            cursor, through, _column(through, field), ids
+                        )
+                        deleted = _delete_in(cursor, model, model._meta.pk.column, ids)
+            if ids:
+                report(**{key: deleted, "links": links})
+            if len(ids) < batch_size:
+                break
+
+    # the user's sync log, no one is left to sync it
+    changes = Change.objects.using(using).filter(user_id=user_id)
+    while True:
+        with transaction.atomic(using=using):
+            ids = list(changes.values_list("pk", flat=True)[:batch_size])
+            if ids:
+                Change.objects.using(using).filter(pk__in=ids).delete()
+        if len(ids) < batch_size:
+            break
+
+    RecipeStats.objects.using(using).filter(user_id=user_id).delete()
+    return totals
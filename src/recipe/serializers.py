@@ -1,6 +1,9 @@
 from rest_framework import serializers
 
-from .models import Recipe, Tag, Ingredient
+from core.routers import atomic_for_user
+
+from .models import Recipe, Tag, Ingredient, RecipeStats
+from . import stats
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -70,9 +73,11 @@ class RecipeSerializer(serializers.ModelSerializer):
         tags = validated_data.pop("tags", [])
         ingredients = validated_data.pop("ingredients", [])
         # lower casing ingredients name
-        recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags, recipe)
-        self._get_or_create_ingredients(ingredients, recipe)
+        with atomic_for_user(validated_data["user"]):
+            recipe = Recipe.objects.create(**validated_data)
+            self._get_or_create_tags(tags, recipe)
+            self._get_or_create_ingredients(ingredients, recipe)
+            stats.apply_delta(recipe.user, stats.recipe_contribution(recipe))
         # this is how we get the user obj in serializer
         # HERE, context is passed to the serializer by the view
         # authenticated_user = self.context["request"].user
@@ -83,18 +88,23 @@ class RecipeSerializer(serializers.ModelSerializer):
         """Update Recipe."""
         tags = validated_data.pop("tags", None)
         ingredients = validated_data.pop("ingredients", None)
-        if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
-
-        if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
-
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-
-        instance.save()
+        with atomic_for_user(instance.user):
+            before = stats.recipe_contribution(instance)
+            if tags is not None:
+                instance.tags.clear()
+                self._get_or_create_tags(tags, instance)
+
+            if ingredients is not None:
+                instance.ingredients.clear()
+                self._get_or_create_ingredients(ingredients, instance)
+
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+
+            instance.save()
+            stats.apply_delta(
+                instance.user, stats.diff(before, stats.recipe_contribution(instance))
+            )
         return instance
 
         # return super().update(instance, validated_data)
@@ -105,6 +115,63 @@ class RecipeDetailsSerializer(RecipeSerializer):
         fields = RecipeSerializer.Meta.fields + ["description"]
 
 
+class SimilarRecipeSerializer(RecipeSerializer):
+    """A recipe with its similarity to the one asked about."""
+
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ["similarity"]
+
+
+class PantryRecipeSerializer(RecipeSerializer):
+    """A recipe with the ingredients a pantry lacks for it."""
+
+    missing = serializers.IntegerField(read_only=True)
+    missing_ingredients = IngredientSerializer(many=True, read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ["missing", "missing_ingredients"]
+
+
+class ShoppingListIngredientSerializer(serializers.Serializer):
+    """An ingredient of a shopping list and the recipes needing it."""
+
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipes = serializers.ListField(child=serializers.IntegerField())
+
+
+class ShoppingListSerializer(serializers.Serializer):
+    """The merged ingredients and totals of several recipes."""
+
+    recipes = serializers.ListField(child=serializers.IntegerField())
+    total_price = serializers.DecimalField(max_digits=14, decimal_places=2)
+    total_time_minutes = serializers.IntegerField()
+    ingredients = ShoppingListIngredientSerializer(many=True)
+
+
+class RecipeStatsSerializer(serializers.ModelSerializer):
+    """Serializer for the per-user recipe statistics."""
+
+    average_price = serializers.DecimalField(
+        max_digits=14, decimal_places=2, read_only=True
+    )
+    average_time_minutes = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = RecipeStats
+        fields = [
+            "recipe_count",
+            "total_price",
+            "average_price",
+            "average_time_minutes",
+            "tag_count",
+            "ingredient_count",
+        ]
+        read_only_fields = fields
+
+
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images to recipes."""
 
@@ -0,0 +1,41 @@
+"""Shopping lists merging the ingredients of several recipes."""
+
+from decimal import Decimal
+
+from .models import Recipe
+
+
+def shopping_list(user, recipe_ids):
+    """The ingredients and totals of the user's recipes among recipe_ids.
+
+    One query joins the recipes to their ingredients. Its rows repeat a
+    recipe's price and time once per ingredient, so totals are summed
+    here over distinct recipes, and ingredients grouped by id. Ids of
+    other users' or deleted recipes are left out of "recipes".
+    """
+    rows = (
+        Recipe.objects.filter(user=user, pk__in=recipe_ids)
+        .values_list(
+            "pk", "price", "time_minutes", "ingredients__id", "ingredients__name"
+        )
+        .order_by("pk")
+    )
+    recipes = {}
+    ingredients = {}
+    for recipe_id, price, time_minutes, ingredient_id, name in rows:
+        recipes[recipe_id] = (price, time_minutes)
+        # null for a recipe without ingredients, from the outer join
+        if ingredient_id is not None:
+            ingredient = ingredients.setdefault(
+                ingredient_id, {"id": ingredient_id, "name": name, "recipes": []}
+            )
+            ingredient["recipes"].append(recipe_id)
+
+    return {
+        "recipes": sorted(recipes),
+        "total_price": sum((price for price, _ in recipes.values()), Decimal("0.00")),
+        "total_time_minutes": sum(time for _, time in recipes.values()),
+        "ingredients": sorted(
+            ingredients.values(), key=lambda i: (i["name"].lower(), i["id"])
+        ),
+    }
@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+
+from core.routers import shard_for_user_id
+from user.signals import purge_user_data
+
+from . import orphans, sync
+from .models import Recipe, Tag, Ingredient, RecipeStats, Change
+from .purge import purge_user_data as purge_recipe_data
+
+
+def delete_sharded_user_data(sender, instance, using, **kwargs):
+    """Cascade a user delete to their shard.
+
+    Django's collector only cascades on the database the user lives on, so
+    with sharding enabled the recipe data has to be removed separately.
+    """
+    if not settings.RECIPE_SHARDS:
+        return
+    shard = shard_for_user_id(instance.pk)
+    for model in (Recipe, Tag, Ingredient, RecipeStats, Change):
+        model.objects.using(shard).filter(user_id=instance.pk).delete()
+
+
+def record_save(sender, instance, raw=False, **kwargs):
+    """Log the save for delta sync, see recipe.sync."""
+    if not raw:
+        sync.record(instance)
+
+
+def record_delete(sender, instance, **kwargs):
+    sync.record(instance, deleted=True)
+
+
+def record_unlink(sender, instance, action, reverse, model, pk_set, using, **kwargs):
+    """Stamp the tags or ingredients a recipe stops using, see recipe.orphans."""
+    if action not in ("post_remove", "pre_clear"):
+        return
+    if reverse:
+        # tag.recipe_set.remove() or clear(), the tag itself loses links
+        unlinked = type(instance).objects.filter(pk=instance.pk)
+    elif action == "post_remove":
+        unlinked = model.objects.filter(pk__in=pk_set)
+    else:
+        # before the clear, while the links still say what it unlinks
+        unlinked = model.objects.filter(recipe=instance)
+    orphans.stamp_unlinked(unlinked.using(using))
+
+
+def record_recipe_unlinks(sender, instance, using, **kwargs):
+    """Deleting a recipe drops its links without sending m2m_changed."""
+    for model in orphans.LINKS:
+        orphans.stamp_unlinked(model.objects.using(using).filter(recipe=instance))
+
+
+def purge_user_recipe_data(sender, user_id, progress, **kwargs):
+    """Delete a user's recipe data in batches before the account goes."""
+    purge_recipe_data(user_id, progress=progress)
+
+
+def connect_signals():
+    post_delete.connect(
+        delete_sharded_user_data,
+        sender=get_user_model(),
+        dispatch_uid="recipe.delete_sharded_user_data",
+    )
+    purge_user_data.connect(
+        purge_user_recipe_data,
+        dispatch_uid="recipe.purge_user_recipe_data",
+    )
+    for through in (Recipe.tags.through, Recipe.ingredients.through):
+        m2m_changed.connect(
+            record_unlink,
+            sender=through,
+            dispatch_uid=f"recipe.record_unlink.{through.__name__}",
+        )
+    pre_delete.connect(
+        record_recipe_unlinks,
+        sender=Recipe,
+        dispatch_uid="recipe.record_recipe_unlinks",
+    )
+    for model in (Recipe, Tag, Ingredient):
+        post_save.connect(
+            record_save,
+            sender=model,
+            dispatch_uid=f"recipe.record_save.{model.__name__}",
+        )
+        post_delete.connect(
+            record_delete,
+            sender=model,
+            dispatch_uid=f"recipe.record_delete.{model.__name__}",
+        )
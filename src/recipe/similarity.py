@@ -0,0 +1,260 @@
+"""Similar recipes, ranked by tag and ingredient overlap.
+
+Similarity is the Jaccard index of the two recipes' sets of tags and
+ingredients. Each user gets an in-memory index where a recipe is a bitset
+(a Python int) over the user's tags and ingredients, so one comparison is
+an AND and a popcount on machine words. An inverted index from feature to
+recipes limits the comparisons to recipes sharing at least one feature.
+
+Indexes are built on first use, from the through tables in two queries,
+and kept in an LRU of SIMILARITY_INDEX_MAX_USERS users per process.
+Before every lookup an index catches up with the user's change log (see
+recipe.sync), re-reading only the recipes changed since, so it stays
+correct whichever process made the change. It is rebuilt when it fell
+more than SIMILARITY_CATCH_UP_LIMIT changes behind or compaction removed
+changes it hadn't seen.
+
+The same indexes answer pantry lookups, see recipe.pantry.
+"""
+
+import heapq
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Max
+
+from core.metrics import record_cache_lookup
+from core.routers import read_from_replica, use_user_shard
+
+from . import sync
+from .models import Change, Recipe
+
+# through model, its column of the feature, the Change.model of the feature
+FEATURES = (
+    (Recipe.tags.through, "tag_id", "tag"),
+    (Recipe.ingredients.through, "ingredient_id", "ingredient"),
+)
+
+
+def jaccard(a, b):
+    """Jaccard index of two sets, the unindexed way."""
+    union = len(a | b)
+    return len(a & b) / union if union else 0.0
+
+
+def _bits(vector):
+    while vector:
+        low = vector & -vector
+        yield low.bit_length() - 1
+        vector ^= low
+
+
+class RecipeIndex:
+    """Feature bitsets of one user's recipes.
+
+    Features are (Change.model, id) pairs, numbered in order of first use.
+    Not thread safe, callers hold lock.
+    """
+
+    def __init__(self, user_id, cursor=0):
+        self.user_id = user_id
+        # id of the last change reflected in the index
+        self.cursor = cursor
+        self.lock = threading.Lock()
+        self.bit_of = {}
+        self.vectors = {}
+        self.sizes = {}
+        self.ingredient_counts = {}
+        # the bits of ingredients
+        self.ingredient_mask = 0
+        # bit: ids of the recipes having it
+        self.postings = defaultdict(set)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def set_recipe(self, recipe_id, features):
+        """Add a recipe or replace its features."""
+        self.remove_recipe(recipe_id)
+        vector = 0
+        ingredients = 0
+        for feature in features:
+            bit = self.bit_of.get(feature)
+            if bit is None:
+                bit = self.bit_of[feature] = len(self.bit_of)
+            if feature[0] == "ingredient":
+                ingredients |= 1 << bit
+            vector |= 1 << bit
+            self.postings[bit].add(recipe_id)
+        self.vectors[recipe_id] = vector
+        self.sizes[recipe_id] = vector.bit_count()
+        self.ingredient_counts[recipe_id] = ingredients.bit_count()
+        self.ingredient_mask |= ingredients
+
+    def remove_recipe(self, recipe_id):
+        vector = self.vectors.pop(recipe_id, None)
+        if vector is None:
+            return
+        del self.sizes[recipe_id]
+        del self.ingredient_counts[recipe_id]
+        for bit in _bits(vector):
+            self.postings[bit].discard(recipe_id)
+
+    def remove_feature(self, feature):
+        """Take a deleted tag or ingredient off every recipe."""
+        bit = self.bit_of.get(feature)
+        if bit is None:
+            return
+        mask = ~(1 << bit)
+        ingredient = feature[0] == "ingredient"
+        self.ingredient_mask &= mask
+        for recipe_id in self.postings.pop(bit, ()):
+            self.vectors[recipe_id] &= mask
+            self.sizes[recipe_id] -= 1
+            self.ingredient_counts[recipe_id] -= ingredient
+
+    def similar(self, recipe_id, k):
+        """[(recipe id, similarity)] of the k most similar recipes.
+
+        Recipes sharing nothing are left out. Ties go to the newest
+        recipe. Raises KeyError for a recipe not in the index.
+        """
+        vector = self.vectors[recipe_id]
+        size = self.sizes[recipe_id]
+        candidates = set()
+        for bit in _bits(vector):
+            candidates |= self.postings[bit]
+        candidates.discard(recipe_id)
+
+        vectors, sizes = self.vectors, self.sizes
+        scored = []
+        for other in candidates:
+            common = (vector & vectors[other]).bit_count()
+            scored.append((common / (size + sizes[other] - common), other))
+        return [(other, score) for score, other in heapq.nlargest(k, scored)]
+
+
+def _features(user, recipe_ids=None):
+    """{recipe id: [features]} of the user's recipes, or just recipe_ids."""
+    recipes = Recipe.objects.filter(user=user)
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    features = {pk: [] for pk in recipes.values_list("pk", flat=True)}
+    for through, column, model in FEATURES:
+        rows = through.objects.filter(recipe__in=recipes).values_list(
+            "recipe_id", column
+        )
+        for recipe_id, feature_id in rows:
+            features[recipe_id].append((model, feature_id))
+    return features
+
+
+def build(user):
+    """A new index of the user's recipes."""
+    # read first, changes committed while building are caught up later
+    cursor = Change.objects.filter(user=user).aggregate(last=Max("pk"))["last"] or 0
+    index = RecipeIndex(user.pk, cursor)
+    for recipe_id, features in _features(user).items():
+        index.set_recipe(recipe_id, features)
+    return index
+
+
+def catch_up(index, user):
+    """Apply the user's changes after index.cursor.
+
+    Returns False when the index is too far behind and must be rebuilt.
+    """
+    try:
+        events, complete = sync.events_since(
+            user, index.cursor, settings.SIMILARITY_CATCH_UP_LIMIT
+        )
+    except sync.CursorExpired:
+        return False
+    if not complete:
+        return False
+    if not events:
+        return True
+
+    changed = set()
+    for event in events:
+        if event["model"] == "recipe":
+            if event["deleted"]:
+                index.remove_recipe(event["id"])
+                changed.discard(event["id"])
+            else:
+                changed.add(event["id"])
+        elif event["deleted"]:
+            index.remove_feature((event["model"], event["id"]))
+        # a recipe's links only change together with a save of the recipe
+    if changed:
+        features = _features(user, changed)
+        for recipe_id in changed:
+            if recipe_id in features:
+                index.set_recipe(recipe_id, features[recipe_id])
+            else:
+                # deleted in a change after the last one read
+                index.remove_recipe(recipe_id)
+    index.cursor = events[-1]["cursor"]
+    return True
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _cached(user_id):
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is not None:
+            _indexes.move_to_end(user_id)
+        return index
+
+
+def _store(index):
+    with _indexes_lock:
+        _indexes[index.user_id] = index
+        _indexes.move_to_end(index.user_id)
+        while len(_indexes) > settings.SIMILARITY_INDEX_MAX_USERS:
+            _indexes.popitem(last=False)
+
+
+def forget(user_id=None):
+    """Drop the index of a user, or all of them, from this process."""
+    with _indexes_lock:
+        if user_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(user_id, None)
+
+
+@contextmanager
+def user_index(user):
+    """The user's index, caught up, with its lock held.
+
+    Reads go to the primary: a change log and through tables from
+    different replicas could disagree.
+    """
+    with use_user_shard(user), read_from_replica(False):
+        index = _cached(user.pk)
+        if index is not None:
+            with index.lock:
+                if catch_up(index, user):
+                    record_cache_lookup("similarity_index", True)
+                    yield index
+                    return
+        record_cache_lookup("similarity_index", False)
+        index = build(user)
+        with index.lock:
+            _store(index)
+            yield index
+
+
+def similar_recipes(user, recipe_id, k):
+    """[(recipe id, similarity)] of the k recipes most similar to recipe_id."""
+    with user_index(user) as index:
+        try:
+            return index.similar(recipe_id, k)
+        except KeyError:
+            return []
@@ -0,0 +1,99 @@
+from decimal import Decimal
+
+from django.db.models import Count, F, Sum
+
+from .models import Recipe, RecipeStats
+
+STAT_FIELDS = (
+    "recipe_count",
+    "total_price",
+    "total_time_minutes",
+    "tag_count",
+    "ingredient_count",
+)
+
+
+def recipe_contribution(recipe):
+    """Return what a single recipe contributes to its owner's stats."""
+    return {
+        "recipe_count": 1,
+        "total_price": Decimal(recipe.price),
+        "total_time_minutes": recipe.time_minutes,
+        "tag_count": recipe.tags.count(),
+        "ingredient_count": recipe.ingredients.count(),
+    }
+
+
+def apply_delta(user, delta, sign=1):
+    """Add (or subtract with sign=-1) a contribution to the user's stats row.
+
+    Must be called inside the transaction of the write it accounts for,
+    so the stats row never disagrees with committed recipe data.
+    """
+    changes = {
+        field: F(field) + sign * value for field, value in delta.items() if value
+    }
+    if not changes:
+        return
+    updated = RecipeStats.objects.filter(user=user).update(**changes)
+    if not updated:
+        # first write for this user, seed the row from current data so
+        # recipes created before the stats table existed are counted too
+        RecipeStats.objects.get_or_create(user=user, defaults=compute_for_user(user))
+
+
+def diff(before, after):
+    """Return the per-field difference between two contributions."""
+    return {field: after[field] - before[field] for field in STAT_FIELDS}
+
+
+def compute_for_user(user):
+    """Recompute a single user's stats from the recipe tables."""
+    return compute_all(user_ids=[user.pk]).get(user.pk, empty_stats())
+
+
+def empty_stats():
+    return {
+        "recipe_count": 0,
+        "total_price": Decimal("0.00"),
+        "total_time_minutes": 0,
+        "tag_count": 0,
+        "ingredient_count": 0,
+    }
+
+
+def compute_all(user_ids=None, using=None):
+    """Recompute stats for every user (or the given users) in three grouped queries.
+
+    Returns a dict mapping user id to a stats dict.
+    """
+    recipes = Recipe.objects.using(using)
+    tag_links = Recipe.tags.through.objects.using(using)
+    ingredient_links = Recipe.ingredients.through.objects.using(using)
+    if user_ids is not None:
+        recipes = recipes.filter(user_id__in=user_ids)
+        tag_links = tag_links.filter(recipe__user_id__in=user_ids)
+        ingredient_links = ingredient_links.filter(recipe__user_id__in=user_ids)
+
+    result = {}
+    rows = recipes.values("user_id").annotate(
+        recipe_count=Count("id"),
+        total_price=Sum("price"),
+        total_time_minutes=Sum("time_minutes"),
+    )
+    for row in rows.order_by():
+        stats = result.setdefault(row["user_id"], empty_stats())
+        stats["recipe_count"] = row["recipe_count"]
+        stats["total_price"] = row["total_price"] or Decimal("0.00")
+        stats["total_time_minutes"] = row["total_time_minutes"] or 0
+
+    for queryset, field in (
+        (tag_links, "tag_count"),
+        (ingredient_links, "ingredient_count"),
+    ):
+        rows = queryset.values("recipe__user_id").annotate(n=Count("id"))
+        for row in rows.order_by():
+            stats = result.setdefault(row["recipe__user_id"], empty_stats())
+            stats[field] = row["n"]
+
+    return result
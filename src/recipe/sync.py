@@ -0,0 +1,195 @@
+"""Delta sync of a user's recipes, tags and ingredients.
+
+Every save and delete appends a Change row (see recipe.signals), in the
+same transaction and on the same shard as the write. A client keeps the
+id of the last change it saw as its cursor and asks for the changes
+after it. That is a range scan on the (user, id) index, so the cost
+follows the number of changes, not the size of the collection. Cursor 0
+returns everything, as compaction keeps the latest change of every
+object.
+
+Once committed, every change is also published to the user's live feed
+(see recipe.feed), as an event carrying its cursor.
+
+Cursors are only monotonic if changes commit in id order. SQLite
+serializes writers, so they do. A client must sync again from 0 after
+its user moved to another shard.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from core.broker import broker
+
+from .models import Change, Ingredient, Recipe, SyncHorizon, Tag
+
+# Change.model: model, key of the sync response
+MODELS = {
+    "recipe": (Recipe, "recipes"),
+    "tag": (Tag, "tags"),
+    "ingredient": (Ingredient, "ingredients"),
+}
+MODEL_NAMES = {model: name for name, (model, _) in MODELS.items()}
+
+
+class CursorExpired(Exception):
+    """The cursor is older than the last tombstone purge."""
+
+
+def event(change):
+    """The live feed event of a change."""
+    return {
+        "cursor": change.pk,
+        "model": change.model,
+        "id": change.object_id,
+        "deleted": change.deleted,
+    }
+
+
+def _publish_on_commit(changes, using):
+    def publish():
+        for change in changes:
+            broker.publish(change.user_id, event(change))
+
+    if changes:
+        transaction.on_commit(publish, using=using)
+
+
+def record(instance, deleted=False):
+    """Log a save or delete of a recipe, tag or ingredient."""
+    change = Change.objects.using(instance._state.db or None).create(
+        user_id=instance.user_id,
+        model=MODEL_NAMES[type(instance)],
+        object_id=instance.pk,
+        deleted=deleted,
+    )
+    _publish_on_commit([change], change._state.db)
+
+
+def record_deletes(model, rows, using):
+    """Log tombstones for (pk, user_id) rows deleted without signals."""
+    changes = Change.objects.using(using).bulk_create(
+        Change(user_id=user_id, model=MODEL_NAMES[model], object_id=pk, deleted=True)
+        for pk, user_id in rows
+    )
+    # ids are only known where the database returns them from bulk inserts
+    _publish_on_commit([change for change in changes if change.pk], using)
+
+
+def horizon(using=None):
+    return (
+        SyncHorizon.objects.using(using).aggregate(cursor=Max("cursor"))["cursor"] or 0
+    )
+
+
+def changes_since(user, cursor, limit):
+    """The user's objects changed after cursor, at most limit changes.
+
+    Returns (upserts, deletes, new cursor, has_more). upserts maps a
+    response key to a queryset of the current objects, deletes a key to
+    the deleted ids. An object changed several times shows up once.
+    Raises CursorExpired when tombstones after cursor may be gone.
+    """
+    if cursor and cursor < horizon():
+        raise CursorExpired
+    rows = list(
+        Change.objects.filter(user=user, pk__gt=cursor)
+        .order_by("pk")
+        .values_list("pk", "model", "object_id", "deleted")[:limit]
+    )
+    latest = {}
+    for _, model, object_id, deleted in rows:
+        latest[(model, object_id)] = deleted
+
+    upserts = {}
+    deletes = {}
+    for name, (model, key) in MODELS.items():
+        saved = [pk for (m, pk), deleted in latest.items() if m == name and not deleted]
+        # an object deleted after its last logged save is in the deletes of
+        # a later page, until then it is simply missing here
+        upserts[key] = model.objects.filter(user=user, pk__in=saved).order_by("pk")
+        deletes[key] = sorted(
+            pk for (m, pk), deleted in latest.items() if m == name and deleted
+        )
+    new_cursor = rows[-1][0] if rows else cursor
+    return upserts, deletes, new_cursor, len(rows) == limit
+
+
+def events_since(user, cursor, limit):
+    """Feed events of the user's changes after cursor, oldest first.
+
+    Returns (events, complete), complete is False when there are more
+    than limit. Raises CursorExpired like changes_since().
+    """
+    if cursor and cursor < horizon():
+        raise CursorExpired
+    changes = list(
+        Change.objects.filter(user=user, pk__gt=cursor).order_by("pk")[: limit + 1]
+    )
+    return [event(change) for change in changes[:limit]], len(changes) <= limit
+
+
+def compact(using=DEFAULT_DB_ALIAS, retention=None, batch_size=None, pause=0.0):
+    """Drop superseded changes and old tombstones, in batches.
+
+    A change is superseded once a newer one of the same object exists.
+    Tombstones older than retention seconds go too and move the sync
+    horizon past them. Returns (superseded deleted, tombstones deleted).
+    """
+    if retention is None:
+        retention = settings.SYNC_TOMBSTONE_RETENTION
+    batch_size = batch_size or settings.SYNC_COMPACTION_BATCH_SIZE
+    changes = Change.objects.using(using)
+    newer = changes.filter(
+        model=OuterRef("model"), object_id=OuterRef("object_id"), pk__gt=OuterRef("pk")
+    )
+
+    superseded = 0
+    last = changes.aggregate(last=Max("pk"))["last"] or 0
+    # walks id windows, each a range scan plus index lookups of newer changes
+    for start in range(0, last, batch_size):
+        with transaction.atomic(using=using):
+            ids = list(
+                changes.filter(pk__gt=start, pk__lte=start + batch_size)
+                .filter(Exists(newer))
+                .values_list("pk", flat=True)
+            )
+            if ids:
+                superseded += changes.filter(pk__in=ids).delete()[0]
+        if pause and ids:
+            time.sleep(pause)
+
+    tombstones = 0
+    cutoff = timezone.now() - timedelta(seconds=retention)
+    expired = changes.filter(deleted=True, created_at__lt=cutoff)
+    while True:
+        with transaction.atomic(using=using):
+            ids = list(expired.order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if ids:
+                tombstones += changes.filter(pk__in=ids).delete()[0]
+                # recorded in the same transaction as the delete
+                SyncHorizon.objects.using(using).create(cursor=ids[-1])
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return superseded, tombstones
+
+
+def compact_all(retention=None, batch_size=None, pause=0.0, progress=None):
+    """compact() every recipe database, returns {alias: {...}}.
+
+    progress is called after each database with the report so far.
+    """
+    report = {}
+    for using in settings.RECIPE_SHARDS or [DEFAULT_DB_ALIAS]:
+        superseded, tombstones = compact(using, retention, batch_size, pause)
+        report[using] = {"superseded": superseded, "tombstones": tombstones}
+        if progress is not None:
+            progress(**report)
+    return report
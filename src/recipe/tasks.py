@@ -0,0 +1,96 @@
+"""Background jobs of the recipe app, run by "manage.py worker"."""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from PIL import Image, ImageOps
+
+from core.jobs import report_progress, task
+from core.models import Job
+from core.routers import atomic_for_user, use_user_shard
+
+from . import orphans, stats, sync
+from .models import Recipe, RecipeStats
+
+EXIF_ORIENTATION = 0x0112
+
+
+@task(max_attempts=3)
+def process_recipe_image(user_id, recipe_id, name):
+    """Apply the EXIF orientation and downscale a freshly uploaded image.
+
+    Skipped when the recipe was deleted or got another image since.
+    """
+    user = get_user_model()(pk=user_id)
+    with use_user_shard(user):
+        recipe = Recipe.objects.filter(pk=recipe_id, user_id=user_id).first()
+    if recipe is None or recipe.image.name != name:
+        return
+
+    storage = recipe.image.storage
+    with storage.open(name, "rb") as f:
+        image = Image.open(f)
+        image.load()
+    image_format = image.format
+    size = settings.RECIPE_IMAGE_MAX_SIZE
+    rotated = image.getexif().get(EXIF_ORIENTATION, 1) != 1
+    if not rotated and max(image.size) <= size:
+        return
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((size, size))
+    # overwritten in place, the name in the database stays valid
+    with storage.open(name, "wb") as f:
+        image.save(f, format=image_format)
+
+
+@task
+def recompute_user_stats(user_id):
+    """Rebuild one user's RecipeStats row from their recipes."""
+    user = get_user_model()(pk=user_id)
+    with atomic_for_user(user):
+        RecipeStats.objects.update_or_create(
+            user_id=user_id, defaults=stats.compute_for_user(user)
+        )
+
+
+@task(lease=3600)
+def collect_orphans(repeat=False):
+    """Delete orphaned tags and ingredients, see recipe.orphans.
+
+    With repeat the next run is queued ORPHAN_GC_INTERVAL seconds later.
+    """
+    orphans.collect_orphans(progress=report_progress)
+    if repeat and settings.ORPHAN_GC_INTERVAL:
+        collect_orphans.enqueue({"repeat": True}, delay=settings.ORPHAN_GC_INTERVAL)
+
+
+def schedule_orphan_collection():
+    """Start the recurring collection, unless a run of it is pending already."""
+    pending = Job.objects.filter(
+        name=collect_orphans.name,
+        status__in=[Job.QUEUED, Job.RUNNING],
+        kwargs__repeat=True,
+    ).first()
+    return pending or collect_orphans.enqueue({"repeat": True})
+
+
+@task(lease=3600)
+def compact_changes(repeat=False):
+    """Compact the delta sync change log, see recipe.sync.
+
+    With repeat the next run is queued SYNC_COMPACTION_INTERVAL seconds later.
+    """
+    sync.compact_all(progress=report_progress)
+    if repeat and settings.SYNC_COMPACTION_INTERVAL:
+        compact_changes.enqueue(
+            {"repeat": True}, delay=settings.SYNC_COMPACTION_INTERVAL
+        )
+
+
+def schedule_change_compaction():
+    """Start the recurring compaction, unless a run of it is pending already."""
+    pending = Job.objects.filter(
+        name=compact_changes.name,
+        status__in=[Job.QUEUED, Job.RUNNING],
+        kwargs__repeat=True,
+    ).first()
+    return pending or compact_changes.enqueue({"repeat": True})
@@ -0,0 +1,52 @@
+"""
+Tests for the API benchmark.
+"""
+
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from recipe import benchmark
+from recipe.models import Recipe, RecipeStats
+
+
+class BenchmarkTests(TestCase):
+    """Test seeding, running and comparing benchmarks."""
+
+    def test_seed_dataset(self):
+        dataset = benchmark.seed(users=2, recipes=5, tags=4, ingredients=4)
+
+        self.assertEqual(len(dataset), 2)
+        self.assertEqual(Recipe.objects.count(), 10)
+        stats = RecipeStats.objects.get(user=dataset[0]["user"])
+        self.assertEqual(stats.recipe_count, 5)
+        self.assertEqual(stats.tag_count, 15)
+
+    def test_run_all_scenarios(self):
+        dataset = benchmark.seed(users=1, recipes=5, tags=4, ingredients=4)
+        with tempfile.TemporaryDirectory() as media:
+            with override_settings(MEDIA_ROOT=media):
+                results = benchmark.Benchmark(dataset, requests=3, warmup=0).run()
+
+        self.assertEqual(set(results), set(benchmark.SCENARIOS))
+        for scenario, result in results.items():
+            self.assertEqual(result["errors"], 0, scenario)
+            self.assertGreater(result["throughput_rps"], 0)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+            self.assertGreater(result["queries_per_request"], 0)
+
+    def test_compare_with_baseline(self):
+        baseline = {"list": {"p95_ms": 10.0, "throughput_rps": 100.0}}
+
+        self.assertEqual(
+            benchmark.compare(
+                baseline, {"list": {"p95_ms": 10.9, "throughput_rps": 95.0}}, 0.1
+            ),
+            [],
+        )
+        self.assertEqual(
+            benchmark.compare(
+                baseline, {"list": {"p95_ms": 12.0, "throughput_rps": 80.0}}, 0.1
+            ),
+            ["list.throughput_rps: 100.0 -> 80.0", "list.p95_ms: 10.0 -> 12.0"],
+        )
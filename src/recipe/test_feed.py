@@ -0,0 +1,203 @@
+"""
+Tests for the live change feed served by app.asgi.
+"""
+
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+
+from rest_framework.authtoken.models import Token
+
+from app.asgi import application
+from core.broker import broker
+
+from .feed import PATH
+from .models import Change, Recipe, Tag
+
+
+class Connection:
+    """An ASGI connection to the application, driven by the test."""
+
+    def __init__(self, scope):
+        self.incoming = asyncio.Queue()
+        self.sent = asyncio.Queue()
+        self.task = asyncio.create_task(
+            application(scope, self.incoming.get, self.sent.put)
+        )
+
+    async def next(self):
+        return await asyncio.wait_for(self.sent.get(), 5)
+
+    async def close(self, message):
+        await self.incoming.put(message)
+        await asyncio.wait_for(self.task, 5)
+
+
+def http_scope(query=b"", headers=()):
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": PATH,
+        "raw_path": PATH.encode(),
+        "query_string": query,
+        "root_path": "",
+        "headers": [(b"host", b"testserver"), *headers],
+        "client": ("127.0.0.1", 1),
+        "server": ("testserver", 80),
+    }
+
+
+@override_settings(FEED_HEARTBEAT=60)
+class FeedTests(TransactionTestCase):
+    """Test streaming changes over SSE and WebSocket."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.token = Token.objects.create(user=self.user).key
+        self.auth = (b"authorization", f"Token {self.token}".encode())
+
+    async def _sse(self, query=b"", headers=()):
+        connection = Connection(http_scope(query, [self.auth, *headers]))
+        await connection.incoming.put({"type": "http.request", "body": b""})
+        start = await connection.next()
+        self.assertEqual(start["status"], 200)
+        retry = await connection.next()
+        self.assertTrue(retry["body"].startswith(b"retry:"))
+        return connection
+
+    async def _create_recipe(self, title="Soup"):
+        return await sync_to_async(Recipe.objects.create)(
+            user=self.user, title=title, time_minutes=10, price="2.00"
+        )
+
+    def test_sse_streams_committed_changes(self):
+        async def run():
+            connection = await self._sse()
+            other = await sync_to_async(get_user_model().objects.create_user)(
+                email="other@example.com", password="password123"
+            )
+            await sync_to_async(Tag.objects.create)(user=other, title="Not mine")
+            recipe = await self._create_recipe()
+
+            body = (await connection.next())["body"].decode()
+            await connection.close({"type": "http.disconnect"})
+            return recipe, body
+
+        recipe, body = asyncio.run(run())
+
+        lines = body.splitlines()
+        self.assertEqual(lines[1], "event: change")
+        event = json.loads(lines[2].removeprefix("data: "))
+        self.assertEqual(lines[0], f"id: {event['cursor']}")
+        self.assertEqual(
+            (event["model"], event["id"], event["deleted"]),
+            ("recipe", recipe.pk, False),
+        )
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    def test_sse_replays_after_last_event_id(self):
+        async def run():
+            await self._create_recipe("Seen")
+            cursor = (await Change.objects.alatest("pk")).pk
+            await self._create_recipe("Missed")
+            connection = await self._sse(
+                headers=[(b"last-event-id", str(cursor).encode())]
+            )
+            replayed = (await connection.next())["body"].decode()
+            await connection.close({"type": "http.disconnect"})
+            return replayed
+
+        replayed = asyncio.run(run())
+
+        self.assertIn('"model": "recipe"', replayed)
+        self.assertEqual(replayed.count("event: change"), 1)
+
+    def test_sse_errors(self):
+        async def run(query, headers):
+            connection = Connection(http_scope(query, headers))
+            await connection.incoming.put({"type": "http.request", "body": b""})
+            start = await connection.next()
+            await connection.next()
+            await asyncio.wait_for(connection.task, 5)
+            return start["status"]
+
+        self.assertEqual(asyncio.run(run(b"", [])), 401)
+        self.assertEqual(asyncio.run(run(b"token=wrong", [])), 401)
+        self.assertEqual(asyncio.run(run(b"cursor=x", [self.auth])), 400)
+        with self.settings(FEED_MAX_PER_USER=0):
+            self.assertEqual(asyncio.run(run(b"", [self.auth])), 429)
+
+    @override_settings(FEED_QUEUE_SIZE=2)
+    def test_slow_consumer_is_told_to_resync(self):
+        async def run():
+            connection = await self._sse(b"cursor=0")
+            # the consumer isn't reading while these arrive
+            for i in range(3):
+                broker.deliver(
+                    self.user.pk,
+                    {"cursor": i + 1, "model": "tag", "id": i, "deleted": False},
+                )
+            bodies = []
+            while True:
+                message = await connection.next()
+                if not message.get("more_body"):
+                    break
+                bodies.append(message["body"].decode())
+            await asyncio.wait_for(connection.task, 5)
+            return bodies
+
+        bodies = asyncio.run(run())
+
+        self.assertEqual(
+            bodies, ['event: resync\ndata: {"type": "resync", "cursor": 0}\n\n']
+        )
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    def test_websocket(self):
+        async def run():
+            connection = Connection(
+                {
+                    "type": "websocket",
+                    "path": PATH,
+                    "query_string": f"token={self.token}".encode(),
+                    "headers": [],
+                }
+            )
+            await connection.incoming.put({"type": "websocket.connect"})
+            accepted = await connection.next()
+            recipe = await self._create_recipe()
+            recipe_id = recipe.pk
+            await sync_to_async(recipe.delete)()
+            events = [json.loads((await connection.next())["text"]) for _ in range(2)]
+            await connection.close({"type": "websocket.disconnect", "code": 1000})
+            return accepted, recipe_id, events
+
+        accepted, recipe_id, events = asyncio.run(run())
+
+        self.assertEqual(accepted["type"], "websocket.accept")
+        self.assertEqual(
+            [(e["model"], e["id"], e["deleted"]) for e in events],
+            [("recipe", recipe_id, False), ("recipe", recipe_id, True)],
+        )
+        self.assertLess(events[0]["cursor"], events[1]["cursor"])
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    def test_websocket_rejected_without_token(self):
+        async def run():
+            connection = Connection(
+                {"type": "websocket", "path": PATH, "query_string": b"", "headers": []}
+            )
+            await connection.incoming.put({"type": "websocket.connect"})
+            closed = await connection.next()
+            await asyncio.wait_for(connection.task, 5)
+            return closed
+
+        self.assertEqual(asyncio.run(run()), {"type": "websocket.close", "code": 4401})
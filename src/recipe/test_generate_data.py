@@ -0,0 +1,73 @@
+"""
+Tests for the synthetic data generator.
+"""
+
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from recipe.models import Recipe, RecipeStats
+
+
+def generate(prefix, seed=1):
+    call_command(
+        "generate_data",
+        users=4,
+        recipes=50,
+        tags=6,
+        ingredients=8,
+        batch_size=20,
+        seed=seed,
+        email_prefix=prefix,
+        stdout=StringIO(),
+    )
+    recipes = Recipe.objects.filter(user__email__startswith=prefix).order_by("id")
+    return [
+        (
+            recipe.user.email.removeprefix(prefix),
+            recipe.title,
+            recipe.price,
+            recipe.time_minutes,
+            sorted(tag.title for tag in recipe.tags.all()),
+            sorted(ingredient.name for ingredient in recipe.ingredients.all()),
+        )
+        for recipe in recipes.select_related("user").prefetch_related(
+            "tags", "ingredients"
+        )
+    ]
+
+
+class GenerateDataTests(TestCase):
+    """Test the generate_data command."""
+
+    def test_generates_requested_volume_with_stats(self):
+        rows = generate("a")
+
+        self.assertEqual(len(rows), 50)
+        self.assertTrue(all(row[5] for row in rows))
+        self.assertEqual(
+            sum(RecipeStats.objects.values_list("recipe_count", flat=True)), 50
+        )
+
+    def test_same_seed_same_data(self):
+        self.assertEqual(generate("a"), generate("b"))
+        self.assertNotEqual(generate("c", seed=2), generate("d", seed=3))
+
+    def test_indexes_restored(self):
+        def indexes():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' "
+                    "AND sql IS NOT NULL ORDER BY name"
+                )
+                return cursor.fetchall()
+
+        before = indexes()
+        generate("a")
+        self.assertEqual(indexes(), before)
+
+    def test_needs_users(self):
+        with self.assertRaisesMessage(CommandError, "--users must be at least 1."):
+            call_command("generate_data", users=0, recipes=10, stdout=StringIO())
@@ -0,0 +1,71 @@
+"""
+Tests for the in-process ASGI load generator.
+"""
+
+import asyncio
+import tempfile
+
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from app.asgi import application
+from recipe import benchmark, loadtest
+
+
+class HistogramTests(SimpleTestCase):
+    """Test the latency histogram and saturation detection."""
+
+    def test_percentiles_within_bucket_precision(self):
+        histogram = loadtest.Histogram()
+        for ms in range(1, 1001):
+            histogram.record(ms)
+
+        self.assertEqual(histogram.count, 1000)
+        self.assertAlmostEqual(histogram.percentile(0.5), 500, delta=25)
+        self.assertAlmostEqual(histogram.percentile(0.99), 990, delta=50)
+        self.assertEqual(histogram.percentile(1.0), 1000)
+
+    def test_saturation(self):
+        def step(rate, p99, unfinished=0):
+            return {
+                "offered_sessions_per_s": rate,
+                "unfinished_sessions": unfinished,
+                "endpoints": {"list": {"corrected": {"p99_ms": p99}}},
+            }
+
+        self.assertEqual(
+            loadtest.saturation([step(1, 50), step(2, 900), step(4, 2000)], 500),
+            {"list": 2},
+        )
+        self.assertEqual(loadtest.saturation([step(1, 50)], 500), {"list": None})
+        self.assertEqual(loadtest.saturation([step(1, 50, 3)], 500), {"list": 1})
+
+
+@override_settings(PBKDF2_ITERATIONS=1000)
+class LoadTestTests(TransactionTestCase):
+    """Test a short run against the ASGI application."""
+
+    def test_sessions_run_without_errors(self):
+        # a single user, so requests never overlap: Django serves concurrent
+        # ASGI requests from separate threads, which the shared-cache
+        # in-memory test database answers with "database table is locked"
+        dataset = benchmark.seed(users=1, recipes=3, tags=3, ingredients=3)
+        runner = loadtest.LoadTest(
+            application,
+            [(account["user"].email, benchmark.PASSWORD) for account in dataset],
+            actions=4,
+            think_time=0.0,
+        )
+        with tempfile.TemporaryDirectory() as media:
+            with override_settings(MEDIA_ROOT=media):
+                result = asyncio.run(runner.run_step(rate=20, duration=0.3))
+
+        self.assertGreater(result["sessions"], 0)
+        self.assertEqual(result["unfinished_sessions"], 0)
+        endpoints = result["endpoints"]
+        self.assertEqual(endpoints["login"]["requests"], result["sessions"])
+        self.assertEqual(endpoints["logout"]["requests"], result["sessions"])
+        for name, endpoint in endpoints.items():
+            self.assertEqual(endpoint["errors"], 0, name)
+            self.assertGreaterEqual(
+                endpoint["corrected"]["max_ms"], endpoint["service"]["max_ms"]
+            )
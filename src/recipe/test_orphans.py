@@ -0,0 +1,118 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from core.jobs import Worker
+from core.models import Job
+
+from .models import Ingredient, Recipe, Tag
+from .orphans import collect_orphans, orphans
+
+
+def detail_url(recipe_id):
+    return reverse("recipe:recipe-detail", kwargs={"pk": recipe_id})
+
+
+@override_settings(ORPHAN_RETENTION=0)
+class OrphanCollectionTests(TestCase):
+    """Test deleting tags and ingredients no recipe uses."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title="Soup", time_minutes=10, price="2.00"
+        )
+        self.used = Tag.objects.create(user=self.user, title="Used")
+        self.recipe.tags.add(self.used)
+        self.recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name="Salt")
+        )
+
+    def _replace_tags(self):
+        # leaves "Used" orphaned, like any tag update does
+        response = self.client.patch(
+            detail_url(self.recipe.pk), {"tags": [{"title": "New"}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_deletes_orphans_only(self):
+        self._replace_tags()
+        for i in range(3):
+            Ingredient.objects.create(user=self.user, name=f"Unused {i}")
+
+        report = collect_orphans(batch_size=2)
+
+        self.assertEqual(report["tag"], {"found": 1, "deleted": 1, "users": 1})
+        self.assertEqual(report["ingredient"]["deleted"], 3)
+        self.assertEqual(list(Tag.objects.values_list("title", flat=True)), ["New"])
+        self.assertEqual(
+            list(Ingredient.objects.values_list("name", flat=True)), ["Salt"]
+        )
+
+    def test_dry_run(self):
+        self._replace_tags()
+        out = StringIO()
+
+        call_command("collect_orphans", "--dry-run", stdout=out)
+
+        self.assertIn("Would delete 1 orphaned tags of 1 users.", out.getvalue())
+        self.assertTrue(Tag.objects.filter(pk=self.used.pk).exists())
+
+    def test_retention(self):
+        two_hours_ago = timezone.now() - timedelta(hours=2)
+        Tag.objects.filter(pk=self.used.pk).update(created_at=two_hours_ago)
+        self._replace_tags()
+
+        with self.settings(ORPHAN_RETENTION=3600):
+            # old, but unlinked just now
+            self.assertFalse(orphans(Tag).exists())
+            Tag.objects.filter(pk=self.used.pk).update(unlinked_at=two_hours_ago)
+            self.assertEqual(list(orphans(Tag)), [self.used])
+            # rows from before created_at existed count as old
+            Tag.objects.filter(pk=self.used.pk).update(created_at=None)
+            self.assertEqual(list(orphans(Tag)), [self.used])
+            # never linked, from created_at
+            unused = Tag.objects.create(user=self.user, title="Unused")
+            self.assertNotIn(unused, orphans(Tag))
+
+    def test_unlinks_stamped(self):
+        salt = Ingredient.objects.get()
+        other = Recipe.objects.create(
+            user=self.user, title="Stew", time_minutes=10, price="2.00"
+        )
+        other.tags.add(self.used)
+        Tag.objects.update(unlinked_at=None)
+
+        self.recipe.tags.remove(self.used)
+        self.assertIsNotNone(Tag.objects.get(pk=self.used.pk).unlinked_at)
+        Tag.objects.update(unlinked_at=None)
+        self.used.recipe_set.clear()
+        self.assertIsNotNone(Tag.objects.get(pk=self.used.pk).unlinked_at)
+        # deleting a recipe drops its links too
+        self.recipe.delete()
+        self.assertIsNotNone(Ingredient.objects.get(pk=salt.pk).unlinked_at)
+
+    def test_scheduled_job(self):
+        self._replace_tags()
+
+        call_command("collect_orphans", "--schedule", stdout=StringIO())
+        call_command("collect_orphans", "--schedule", stdout=StringIO())
+        self.assertEqual(Job.objects.count(), 1)
+        Worker().run_one()
+
+        self.assertFalse(Tag.objects.filter(pk=self.used.pk).exists())
+        job = Job.objects.get(status=Job.SUCCEEDED)
+        self.assertEqual(job.progress["tag"]["deleted"], 1)
+        # the next run is queued
+        self.assertTrue(Job.objects.filter(status=Job.QUEUED).exists())
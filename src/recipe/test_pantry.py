@@ -0,0 +1,158 @@
+import json
+import random
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from . import pantry, similarity
+from .management.commands.pantry_index import _scan
+from .models import Ingredient, Recipe
+
+PANTRY_URL = reverse("recipe:recipe-pantry")
+
+
+class RankTests(SimpleTestCase):
+    """Test pantry ranking over the index against a plain scan."""
+
+    def test_matches_scan(self):
+        rng = random.Random(0)
+        ingredients = {
+            recipe_id: set(rng.sample(range(40), rng.randint(1, 6)))
+            for recipe_id in range(1, 301)
+        }
+        index = similarity.RecipeIndex(user_id=1)
+        for recipe_id, recipe_ingredients in ingredients.items():
+            # tags must not count as ingredients
+            features = [("ingredient", pk) for pk in recipe_ingredients]
+            index.set_recipe(recipe_id, features + [("tag", recipe_id % 3)])
+        index.remove_feature(("ingredient", 7))
+        for recipe_ingredients in ingredients.values():
+            recipe_ingredients.discard(7)
+
+        for size in (1, 5, 20, 40):
+            pantry_ids = rng.sample(range(40), size) + [99]
+            expected = _scan(ingredients, pantry_ids, 2, 25)
+            # counting links, then testing every bitset
+            for factor in (10**6, 0):
+                with mock.patch.object(pantry, "SCAN_FACTOR", factor):
+                    self.assertEqual(
+                        pantry.rank(index, pantry_ids, 2, 25), expected, size
+                    )
+
+
+@override_settings(PANTRY_MAX_INGREDIENTS=5)
+class PantryApiTests(TestCase):
+    """Test the pantry action."""
+
+    def setUp(self):
+        similarity.forget()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client.force_authenticate(self.user)
+        self.egg, self.flour, self.milk, self.salt = (
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ("Egg", "Flour", "Milk", "Salt")
+        )
+        self.omelette = self._recipe("Omelette", [self.egg, self.salt])
+        self.pancakes = self._recipe("Pancakes", [self.egg, self.flour, self.milk])
+        self.bread = self._recipe("Bread", [self.flour, self.salt])
+        self.water = self._recipe("Water", [])
+
+    def _recipe(self, title, ingredients):
+        recipe = Recipe.objects.create(
+            user=self.user, title=title, time_minutes=10, price="2.00"
+        )
+        recipe.ingredients.set(ingredients)
+        return recipe
+
+    def _pantry(self, ingredients, **params):
+        params["ingredients"] = ",".join(str(i.pk) for i in ingredients)
+        response = self.client.get(PANTRY_URL, params)
+        self.assertEqual(response.status_code, 200)
+        return [
+            (r["title"], r["missing"], [i["name"] for i in r["missing_ingredients"]])
+            for r in response.data
+        ]
+
+    def test_ranked_by_missing(self):
+        self.assertEqual(
+            self._pantry([self.egg, self.salt]),
+            [
+                ("Omelette", 0, []),
+                ("Bread", 1, ["Flour"]),
+                ("Pancakes", 2, ["Flour", "Milk"]),
+            ],
+        )
+        self.assertEqual(
+            self._pantry([self.egg, self.salt], max_missing=0, limit=5),
+            [("Omelette", 0, [])],
+        )
+        self.assertEqual(self._pantry([self.egg, self.salt], limit=1)[0][0], "Omelette")
+
+    def test_matches_sql(self):
+        for ingredients in ([self.egg], [self.flour, self.milk], [self.salt]):
+            ids = [i.pk for i in ingredients]
+            self.assertEqual(
+                pantry.matches(self.user, ids, 1, 10),
+                pantry.matches_sql(self.user, ids, 1, 10),
+            )
+
+    def test_follows_changes(self):
+        self._pantry([self.egg])
+        self.omelette.ingredients.remove(self.salt)
+        # links change with a save of the recipe, like through the API
+        self.omelette.save()
+        self.salt.delete()
+
+        self.assertEqual(
+            self._pantry([self.egg], max_missing=1),
+            [("Omelette", 0, [])],
+        )
+        self.assertEqual(self._pantry([self.flour], max_missing=1), [("Bread", 0, [])])
+
+    def test_other_users_ingredients_ignored(self):
+        other = get_user_model().objects.create_user(
+            email="other@example.com", password="password123"
+        )
+        theirs = Ingredient.objects.create(user=other, name="Egg")
+        recipe = Recipe.objects.create(
+            user=other, title="Theirs", time_minutes=1, price="1.00"
+        )
+        recipe.ingredients.add(theirs)
+
+        self.assertEqual(self._pantry([theirs]), [])
+
+    def test_invalid_parameters(self):
+        for params in (
+            {},
+            {"ingredients": "1,a"},
+            {"ingredients": "1,2,3,4,5,6"},
+            {"ingredients": "1", "max_missing": "-1"},
+            {"ingredients": "1", "limit": "many"},
+        ):
+            response = self.client.get(PANTRY_URL, params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            "pantry_index", "--user", self.user.email, "--pantry", "1,4", stdout=out
+        )
+        report = json.loads(out.getvalue())[self.user.email]
+        self.assertEqual(report["recipes"], 4)
+        self.assertEqual(
+            [report[f"pantry_{size}"]["mismatches"] for size in (1, 4)], [0, 0]
+        )
+
+        out = StringIO()
+        call_command("pantry_index", "--synthetic", "200", "--queries", "5", stdout=out)
+        report = json.loads(out.getvalue())["synthetic"]
+        self.assertEqual(report["recipes"], 200)
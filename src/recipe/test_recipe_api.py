@@ -1,11 +1,11 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 import tempfile
 import os
 
 from PIL import Image
 
 from decimal import Decimal
-from core import models
+from core import jobs, models
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
@@ -317,3 +317,19 @@ class ImageUploadTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("image", response.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=100)
+    def test_upload_image_downscaled_by_worker(self):
+        """Test a large image is downscaled by the background job."""
+
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+            Image.new("RGB", (400, 200)).save(image_file, format="JPEG")
+            image_file.seek(0)
+            response = self.client.post(url, {"image": image_file}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertTrue(jobs.Worker().run_one())
+        self.recipe.refresh_from_db()
+        with Image.open(self.recipe.image.path) as image:
+            self.assertEqual(image.size, (100, 50))
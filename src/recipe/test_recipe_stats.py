@@ -0,0 +1,101 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from .models import Recipe, RecipeStats
+
+
+RECIPE_LIST = reverse("recipe:recipe-list")
+STATS_URL = reverse("recipe:recipe-stats")
+
+
+def detail_url(recipe_id):
+    return reverse("recipe:recipe-detail", kwargs={"pk": recipe_id})
+
+
+class RecipeStatsTests(TestCase):
+    """Test the incrementally maintained recipe stats."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client.force_authenticate(self.user)
+
+    def _create(self, **params):
+        payload = {"title": "Curry", "time_minutes": 30, "price": "10.00"}
+        payload.update(params)
+        response = self.client.post(RECIPE_LIST, payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def test_stats_follow_create_update_delete(self):
+        recipe_id = self._create(tags=[{"title": "Thai"}, {"title": "Dinner"}])
+        self._create(time_minutes=10, price="5.00", ingredients=[{"name": "Salt"}])
+
+        response = self.client.get(STATS_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["recipe_count"], 2)
+        self.assertEqual(Decimal(response.data["total_price"]), Decimal("15.00"))
+        self.assertEqual(Decimal(response.data["average_price"]), Decimal("7.50"))
+        self.assertEqual(response.data["average_time_minutes"], 20)
+        self.assertEqual(response.data["tag_count"], 2)
+        self.assertEqual(response.data["ingredient_count"], 1)
+
+        self.client.patch(
+            detail_url(recipe_id),
+            {"price": "12.00", "tags": [{"title": "Lunch"}]},
+            format="json",
+        )
+        row = RecipeStats.objects.get(user=self.user)
+        self.assertEqual(row.total_price, Decimal("17.00"))
+        self.assertEqual(row.tag_count, 1)
+
+        self.client.delete(detail_url(recipe_id))
+        row.refresh_from_db()
+        self.assertEqual(row.recipe_count, 1)
+        self.assertEqual(row.total_price, Decimal("5.00"))
+        self.assertEqual(row.tag_count, 0)
+
+    def test_stats_follow_tag_and_ingredient_delete(self):
+        self._create(tags=[{"title": "Thai"}], ingredients=[{"name": "Salt"}])
+        self._create(tags=[{"title": "Thai"}, {"title": "Dinner"}])
+        thai = self.user.tag_set.get(title="Thai")
+        salt = self.user.ingredient_set.get(name="Salt")
+
+        response = self.client.delete(reverse("recipe:tag-detail", args=[thai.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.client.delete(reverse("recipe:ingredient-detail", args=[salt.pk]))
+
+        response = self.client.get(STATS_URL)
+        self.assertEqual(response.data["tag_count"], 1)
+        self.assertEqual(response.data["ingredient_count"], 0)
+        self.assertEqual(response.data["recipe_count"], 2)
+
+    def test_stats_without_row_are_computed(self):
+        Recipe.objects.create(
+            user=self.user, title="Soup", time_minutes=5, price=Decimal("2.00")
+        )
+        response = self.client.get(STATS_URL)
+        self.assertEqual(response.data["recipe_count"], 1)
+        self.assertFalse(RecipeStats.objects.exists())
+
+    def test_reconcile_fixes_drift(self):
+        self._create()
+        RecipeStats.objects.filter(user=self.user).update(recipe_count=7)
+
+        out = StringIO()
+        call_command("reconcile_recipe_stats", "--dry-run", stdout=out)
+        self.assertIn("recipe_count 7 -> 1", out.getvalue())
+        self.assertEqual(RecipeStats.objects.get(user=self.user).recipe_count, 7)
+
+        call_command("reconcile_recipe_stats", stdout=StringIO())
+        self.assertEqual(RecipeStats.objects.get(user=self.user).recipe_count, 1)
@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from .models import Ingredient, Recipe
+
+SHOPPING_LIST_URL = reverse("recipe:recipe-shopping-list")
+
+
+class ShoppingListApiTests(TestCase):
+    """Test the shopping list action."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client.force_authenticate(self.user)
+        self.egg, self.flour, self.milk = (
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ("Egg", "flour", "Milk")
+        )
+        self.pancakes = self._recipe("Pancakes", "4.50", 20, [self.egg, self.flour])
+        self.bread = self._recipe("Bread", "2.25", 90, [self.flour, self.milk])
+        self.water = self._recipe("Water", "0.10", 1, [])
+
+    def _recipe(self, title, price, time_minutes, ingredients, user=None):
+        recipe = Recipe.objects.create(
+            user=user or self.user,
+            title=title,
+            time_minutes=time_minutes,
+            price=price,
+        )
+        recipe.ingredients.set(ingredients)
+        return recipe
+
+    def _get(self, *recipes):
+        return self.client.get(
+            SHOPPING_LIST_URL, {"recipes": ",".join(str(r.pk) for r in recipes)}
+        )
+
+    def test_merges_ingredients(self):
+        with self.assertNumQueries(1):
+            response = self._get(self.pancakes, self.bread, self.water)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["recipes"], [self.pancakes.pk, self.bread.pk, self.water.pk]
+        )
+        self.assertEqual(response.data["total_price"], "6.85")
+        self.assertEqual(response.data["total_time_minutes"], 111)
+        self.assertEqual(
+            [(i["name"], i["recipes"]) for i in response.data["ingredients"]],
+            [
+                ("Egg", [self.pancakes.pk]),
+                ("flour", [self.pancakes.pk, self.bread.pk]),
+                ("Milk", [self.bread.pk]),
+            ],
+        )
+
+    def test_only_own_recipes(self):
+        other = get_user_model().objects.create_user(
+            email="other@example.com", password="password123"
+        )
+        theirs = self._recipe(
+            "Theirs",
+            "9.00",
+            5,
+            [Ingredient.objects.create(user=other, name="Salt")],
+            user=other,
+        )
+
+        response = self._get(self.water, theirs)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["recipes"], [self.water.pk])
+        self.assertEqual(response.data["total_price"], "0.10")
+        self.assertEqual(response.data["ingredients"], [])
+
+    @override_settings(SHOPPING_LIST_MAX_RECIPES=2)
+    def test_invalid_recipes(self):
+        for params in ({}, {"recipes": "1,x"}, {"recipes": "1,2,3"}):
+            response = self.client.get(SHOPPING_LIST_URL, params)
+            self.assertEqual(response.status_code, 400, params)
@@ -0,0 +1,146 @@
+import json
+import random
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from . import similarity
+from .models import Ingredient, Recipe, Tag
+
+
+def similar_url(recipe_id):
+    return reverse("recipe:recipe-similar", args=[recipe_id])
+
+
+def detail_url(recipe_id):
+    return reverse("recipe:recipe-detail", kwargs={"pk": recipe_id})
+
+
+class RecipeIndexTests(SimpleTestCase):
+    """Test the bitset index against plain set based Jaccard."""
+
+    def test_matches_brute_force(self):
+        rng = random.Random(0)
+        features = {
+            recipe_id: {("tag", rng.randrange(20)) for _ in range(3)}
+            | {("ingredient", rng.randrange(60)) for _ in range(6)}
+            for recipe_id in range(1, 301)
+        }
+        index = similarity.RecipeIndex(user_id=1)
+        for recipe_id, recipe_features in features.items():
+            index.set_recipe(recipe_id, recipe_features)
+        index.remove_feature(("tag", 3))
+        for recipe_features in features.values():
+            recipe_features.discard(("tag", 3))
+
+        for recipe_id in (1, 150, 300):
+            expected = sorted(
+                (
+                    (similarity.jaccard(features[recipe_id], features[other]), other)
+                    for other in features
+                    if other != recipe_id and features[recipe_id] & features[other]
+                ),
+                reverse=True,
+            )[:10]
+            self.assertEqual(
+                index.similar(recipe_id, 10),
+                [(other, score) for score, other in expected],
+            )
+
+
+class SimilarRecipesApiTests(TestCase):
+    """Test the similar recipes action."""
+
+    def setUp(self):
+        similarity.forget()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client.force_authenticate(self.user)
+        self.tags = [
+            Tag.objects.create(user=self.user, title=f"T{i}") for i in range(3)
+        ]
+        self.salt = Ingredient.objects.create(user=self.user, name="Salt")
+        self.soup = self._recipe("Soup", self.tags[:2], [self.salt])
+        self.stew = self._recipe("Stew", self.tags[:2], [self.salt])
+        self.salad = self._recipe("Salad", self.tags[:1], [])
+        self.cake = self._recipe("Cake", self.tags[2:], [])
+
+    def _recipe(self, title, tags, ingredients):
+        recipe = Recipe.objects.create(
+            user=self.user, title=title, time_minutes=10, price="2.00"
+        )
+        recipe.tags.set(tags)
+        recipe.ingredients.set(ingredients)
+        return recipe
+
+    def _similar(self, recipe, **params):
+        response = self.client.get(similar_url(recipe.pk), params)
+        self.assertEqual(response.status_code, 200)
+        return [(r["title"], r["similarity"]) for r in response.data]
+
+    def test_ranked_by_overlap(self):
+        self.assertEqual(self._similar(self.soup), [("Stew", 1.0), ("Salad", 0.3333)])
+        self.assertEqual(self._similar(self.soup, limit=1), [("Stew", 1.0)])
+        self.assertEqual(self._similar(self.cake), [])
+
+        for limit in ("0", "many"):
+            response = self.client.get(similar_url(self.soup.pk), {"limit": limit})
+            self.assertEqual(response.status_code, 400, limit)
+
+    def test_follows_changes(self):
+        self._similar(self.soup)
+
+        with mock.patch.object(similarity, "build", wraps=similarity.build) as build:
+            # the API saves the recipe, which puts it in the change log
+            response = self.client.patch(
+                detail_url(self.cake.pk),
+                {"tags": [{"title": "T0"}, {"title": "T1"}]},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 200)
+            self.stew.delete()
+            self.tags[1].delete()
+
+            self.assertEqual(self._similar(self.soup), [("Cake", 0.5), ("Salad", 0.5)])
+        build.assert_not_called()
+
+    @override_settings(SIMILARITY_CATCH_UP_LIMIT=1)
+    def test_rebuilds_when_far_behind(self):
+        self._similar(self.soup)
+        self.stew.delete()
+        self.salad.delete()
+
+        with mock.patch.object(similarity, "build", wraps=similarity.build) as build:
+            self.assertEqual(self._similar(self.soup), [])
+        build.assert_called_once()
+
+    def test_other_users_recipe(self):
+        other = get_user_model().objects.create_user(
+            email="other@example.com", password="password123"
+        )
+        recipe = Recipe.objects.create(
+            user=other, title="Theirs", time_minutes=1, price="1.00"
+        )
+
+        response = self.client.get(similar_url(recipe.pk))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_command(self):
+        out = StringIO()
+        call_command("similarity_index", "--user", self.user.email, stdout=out)
+        report = json.loads(out.getvalue())[self.user.email]
+        self.assertEqual((report["recipes"], report["mismatches"]), (4, 0))
+
+        out = StringIO()
+        call_command("similarity_index", "--synthetic", "200", stdout=out)
+        report = json.loads(out.getvalue())["synthetic"]
+        self.assertEqual((report["recipes"], report["mismatches"]), (200, 0))
@@ -0,0 +1,133 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from core.jobs import Worker
+from core.models import Job
+
+from .models import Change, Recipe, Tag
+from .sync import compact
+
+SYNC_URL = reverse("recipe:sync")
+
+
+def detail_url(recipe_id):
+    return reverse("recipe:recipe-detail", kwargs={"pk": recipe_id})
+
+
+class SyncTests(TestCase):
+    """Test the delta sync endpoint and the change log compaction."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title="Soup", time_minutes=10, price="2.00"
+        )
+
+    def _sync(self, cursor=0, **params):
+        response = self.client.get(SYNC_URL, {"cursor": cursor, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_full_sync(self):
+        other = get_user_model().objects.create_user(
+            email="other@example.com", password="password123"
+        )
+        Recipe.objects.create(user=other, title="Other", time_minutes=1, price=1)
+        Tag.objects.create(user=self.user, title="Vegan")
+
+        data = self._sync()
+
+        self.assertEqual([r["title"] for r in data["recipes"]], ["Soup"])
+        self.assertEqual([t["title"] for t in data["tags"]], ["Vegan"])
+        self.assertFalse(data["has_more"])
+        self.assertEqual(
+            data["cursor"], Change.objects.filter(user=self.user).last().pk
+        )
+
+    def test_delta_after_cursor(self):
+        cursor = self._sync()["cursor"]
+        response = self.client.patch(
+            detail_url(self.recipe.pk), {"title": "Stew"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        gone = Recipe.objects.create(
+            user=self.user, title="Gone", time_minutes=1, price=1
+        )
+        gone_id = gone.pk
+        gone.delete()
+
+        data = self._sync(cursor)
+
+        self.assertEqual([r["title"] for r in data["recipes"]], ["Stew"])
+        self.assertEqual(data["deleted"]["recipes"], [gone_id])
+        # nothing new since
+        self.assertEqual(self._sync(data["cursor"])["recipes"], [])
+
+    def test_pages(self):
+        for i in range(4):
+            Tag.objects.create(user=self.user, title=f"Tag {i}")
+
+        first = self._sync(limit=3)
+        second = self._sync(first["cursor"], limit=3)
+
+        self.assertTrue(first["has_more"])
+        self.assertFalse(second["has_more"])
+        titles = [t["title"] for t in first["tags"] + second["tags"]]
+        self.assertEqual(titles, [f"Tag {i}" for i in range(4)])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(SYNC_URL, {"cursor": "abc"})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_compaction_keeps_latest_change(self):
+        for title in ("One", "Two", "Three"):
+            self.recipe.title = title
+            self.recipe.save()
+
+        superseded, tombstones = compact(batch_size=2)
+
+        self.assertEqual((superseded, tombstones), (3, 0))
+        change = Change.objects.get(model="recipe", object_id=self.recipe.pk)
+        self.assertEqual(change.deleted, False)
+        self.assertEqual(self._sync()["recipes"][0]["title"], "Three")
+
+    @override_settings(SYNC_TOMBSTONE_RETENTION=3600)
+    def test_expired_cursor(self):
+        cursor = self._sync()["cursor"]
+        self.recipe.delete()
+        Change.objects.filter(deleted=True).update(
+            created_at=timezone.now() - timedelta(hours=2)
+        )
+
+        self.assertEqual(compact(), (1, 1))
+
+        response = self.client.get(SYNC_URL, {"cursor": cursor})
+        self.assertEqual(response.status_code, 410)
+        # starting over still works
+        self.assertEqual(self._sync()["recipes"], [])
+
+    def test_scheduled_job(self):
+        self.recipe.save()
+
+        call_command("compact_changes", "--schedule", stdout=StringIO())
+        call_command("compact_changes", "--schedule", stdout=StringIO())
+        self.assertEqual(Job.objects.count(), 1)
+        Worker().run_one()
+
+        self.assertEqual(Change.objects.count(), 1)
+        job = Job.objects.get(status=Job.SUCCEEDED)
+        self.assertEqual(job.progress["default"]["superseded"], 1)
+        self.assertTrue(Job.objects.filter(status=Job.QUEUED).exists())
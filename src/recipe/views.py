@@ -1,25 +1,37 @@
+from django.conf import settings
 from django.shortcuts import render
 
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
+    inline_serializer,
     OpenApiParameter,
     OpenApiTypes,
 )
-from rest_framework import viewsets, status
+from rest_framework import generics, serializers, viewsets, status
+from rest_framework.views import APIView
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.mixins import ListModelMixin, UpdateModelMixin, DestroyModelMixin
 
-from .models import Recipe, Tag, Ingredient
+from core import idempotency
+from core.mixins import ReplicaReadMixin, UserShardMixin
+from core.routers import atomic_for_user
+from user.authentication import ExpiringTokenAuthentication
+
+from .models import Recipe, Tag, Ingredient, RecipeStats
+from . import pantry, shopping, similarity, stats, sync, tasks
 from .serializers import (
     RecipeSerializer,
     RecipeDetailsSerializer,
     RecipeImageSerializer,
+    RecipeStatsSerializer,
+    SimilarRecipeSerializer,
     TagSerializer,
     IngredientSerializer,
+    PantryRecipeSerializer,
+    ShoppingListSerializer,
 )
 
 # Create your views here.
@@ -41,18 +53,28 @@ from .serializers import (
         ]
     )
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(UserShardMixin, ReplicaReadMixin, viewsets.ModelViewSet):
     """View for managing recipe APIs"""
 
     serializer_class = RecipeDetailsSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def _params_to_ints(self, qs):
         """Convert a list of strings to integers"""
         return [int(str_id) for str_id in qs.split(",")]
 
+    def _int_param(self, name, default, minimum, maximum=None):
+        """A query parameter as an int, clamped to maximum"""
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except ValueError:
+            raise serializers.ValidationError({name: ["Must be an integer."]})
+        if value < minimum:
+            raise serializers.ValidationError({name: [f"Must be at least {minimum}."]})
+        return value if maximum is None else min(value, maximum)
+
     def get_queryset(self):
         tags = self.request.query_params.get("tags")
         ingredients = self.request.query_params.get("ingredients")
@@ -65,7 +87,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
             ingredient_ids = self._params_to_ints(ingredients)
             queryset = queryset.filter(ingredients__id__in=ingredient_ids)
 
-        return queryset.filter(user=self.request.user).order_by("-id").distinct()
+        return (
+            queryset.filter(user=self.request.user)
+            .order_by("-id")
+            .distinct()
+            # one query per relation instead of one per recipe when serializing
+            .prefetch_related("tags", "ingredients")
+        )
 
     def get_serializer_class(self):
         """Returns the serializer class for request"""
@@ -75,13 +103,46 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeSerializer
         elif self.action == "upload_image":
             return RecipeImageSerializer
+        elif self.action == "similar":
+            return SimilarRecipeSerializer
+        elif self.action == "pantry":
+            return PantryRecipeSerializer
+        elif self.action == "shopping_list":
+            return ShoppingListSerializer
         return self.serializer_class
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                idempotency.HEADER,
+                OpenApiTypes.STR,
+                OpenApiParameter.HEADER,
+                description="Unique per recipe, retries get the first response",
+            )
+        ]
+    )
+    def create(self, request, *args, **kwargs):
+        """Create a recipe, at most once per Idempotency-Key"""
+        return idempotency.execute(
+            request,
+            f"user:{request.user.pk}",
+            lambda: super(RecipeViewSet, self).create(request, *args, **kwargs),
+            Response,
+        )
+
     def perform_create(self, serializer):
         """Create a new Recipe"""
         serializer.save(user=self.request.user)
         # return super().perform_create(serializer)
 
+    def perform_destroy(self, instance):
+        """Delete a Recipe and take it out of the owner's stats"""
+        user = instance.user
+        with atomic_for_user(user):
+            contribution = stats.recipe_contribution(instance)
+            instance.delete()
+            stats.apply_delta(user, contribution, sign=-1)
+
     # here we added a custom action with the help of action decorator
     # now we can access this action with self.action
     # and here detail=True means this action going to work
@@ -95,21 +156,170 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            recipe = serializer.save()
+            # orientation and downscaling happen in a worker, once per file
+            tasks.process_recipe_image.enqueue(
+                {
+                    "user_id": recipe.user_id,
+                    "recipe_id": recipe.pk,
+                    "name": recipe.image.name,
+                },
+                idempotency_key=f"recipe-image:{recipe.image.name}",
+            )
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "limit",
+                OpenApiTypes.INT,
+                description="Number of recipes, at most SIMILAR_RECIPES_MAX_LIMIT",
+            )
+        ]
+    )
+    @action(methods=["GET"], detail=True)
+    def similar(self, request, pk=None):
+        """The user's other recipes sharing the most tags and ingredients"""
+        recipe = self.get_object()
+        limit = self._int_param(
+            "limit",
+            settings.SIMILAR_RECIPES_LIMIT,
+            1,
+            settings.SIMILAR_RECIPES_MAX_LIMIT,
+        )
+
+        ranked = similarity.similar_recipes(request.user, recipe.pk, limit)
+        recipes = self.get_queryset().in_bulk([recipe_id for recipe_id, _ in ranked])
+        results = []
+        for recipe_id, score in ranked:
+            # gone since the index was read
+            if recipe_id in recipes:
+                recipes[recipe_id].similarity = round(score, 4)
+                results.append(recipes[recipe_id])
+        return Response(self.get_serializer(results, many=True).data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "ingredients",
+                OpenApiTypes.STR,
+                description="Comma separated IDs of the ingredients at hand",
+                required=True,
+            ),
+            OpenApiParameter(
+                "max_missing",
+                OpenApiTypes.INT,
+                description="Most ingredients a recipe may lack, PANTRY_MAX_MISSING by default",
+            ),
+            OpenApiParameter(
+                "limit",
+                OpenApiTypes.INT,
+                description="Number of recipes, at most PANTRY_MAX_LIMIT",
+            ),
+        ],
+        responses=PantryRecipeSerializer(many=True),
+    )
+    @action(methods=["GET"], detail=False)
+    def pantry(self, request):
+        """The user's recipes cookable with, or nearly with, some ingredients"""
+        try:
+            ingredient_ids = set(
+                self._params_to_ints(request.query_params.get("ingredients", ""))
+            )
+        except ValueError:
+            raise serializers.ValidationError(
+                {"ingredients": ["Must be a comma separated list of IDs."]}
+            )
+        if len(ingredient_ids) > settings.PANTRY_MAX_INGREDIENTS:
+            raise serializers.ValidationError(
+                {
+                    "ingredients": [
+                        f"At most {settings.PANTRY_MAX_INGREDIENTS} ingredients."
+                    ]
+                }
+            )
+        max_missing = self._int_param("max_missing", settings.PANTRY_MAX_MISSING, 0)
+        limit = self._int_param(
+            "limit", settings.PANTRY_LIMIT, 1, settings.PANTRY_MAX_LIMIT
+        )
+
+        ranked = pantry.matches(request.user, ingredient_ids, max_missing, limit)
+        # not get_queryset(), its ?ingredients= filter would join the pantry
+        recipes = (
+            Recipe.objects.filter(user=request.user)
+            .prefetch_related("tags", "ingredients")
+            .in_bulk([recipe_id for recipe_id, _ in ranked])
+        )
+        results = []
+        for recipe_id, _ in ranked:
+            # gone since the index was read
+            if recipe_id in recipes:
+                recipe = recipes[recipe_id]
+                recipe.missing_ingredients = [
+                    ingredient
+                    for ingredient in recipe.ingredients.all()
+                    if ingredient.pk not in ingredient_ids
+                ]
+                recipe.missing = len(recipe.missing_ingredients)
+                results.append(recipe)
+        return Response(self.get_serializer(results, many=True).data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "recipes",
+                OpenApiTypes.STR,
+                description="Comma separated IDs of the recipes to shop for",
+                required=True,
+            )
+        ]
+    )
+    @action(methods=["GET"], detail=False)
+    def shopping_list(self, request):
+        """The ingredients of several recipes, each listed once, and their totals"""
+        try:
+            recipe_ids = set(
+                self._params_to_ints(request.query_params.get("recipes", ""))
+            )
+        except ValueError:
+            raise serializers.ValidationError(
+                {"recipes": ["Must be a comma separated list of IDs."]}
+            )
+        if len(recipe_ids) > settings.SHOPPING_LIST_MAX_RECIPES:
+            raise serializers.ValidationError(
+                {"recipes": [f"At most {settings.SHOPPING_LIST_MAX_RECIPES} recipes."]}
+            )
+        data = shopping.shopping_list(request.user, recipe_ids)
+        return Response(self.get_serializer(data).data)
+
 
 class BaseRecipeAttrViewSet(
-    DestroyModelMixin, UpdateModelMixin, ListModelMixin, viewsets.GenericViewSet
+    UserShardMixin,
+    ReplicaReadMixin,
+    DestroyModelMixin,
+    UpdateModelMixin,
+    ListModelMixin,
+    viewsets.GenericViewSet,
 ):
     """BaseViewSet for Recipe attributes"""
 
     # we haven't added CreateModelMixin so we cannot perform
     # post method in this base class
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    # RecipeStats field counting the links to this model
+    stat_field = None
+
+    def perform_destroy(self, instance):
+        """Delete the object and take its recipe links out of the stats"""
+        user = instance.user
+        with atomic_for_user(user):
+            # the links are deleted along with the object
+            links = instance.recipe_set.count()
+            instance.delete()
+            stats.apply_delta(user, {self.stat_field: links}, sign=-1)
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -117,6 +327,7 @@ class TagViewSet(BaseRecipeAttrViewSet):
 
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
+    stat_field = "tag_count"
 
     def get_queryset(self):
         return Tag.objects.filter(user=self.request.user).order_by("-title")
@@ -130,7 +341,109 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
 
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
+    stat_field = "ingredient_count"
 
     def get_queryset(self):
         """Filter queryset to authenticate user."""
         return self.queryset.filter(user=self.request.user).order_by("-name")
+
+
+class RecipeStatsView(UserShardMixin, generics.RetrieveAPIView):
+    """Return the authenticated user's recipe statistics."""
+
+    serializer_class = RecipeStatsSerializer
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self):
+        user = self.request.user
+        try:
+            return RecipeStats.objects.get(user=user)
+        except RecipeStats.DoesNotExist:
+            # nothing written since the stats table was added,
+            # compute on the fly instead of creating a row on a GET
+            return RecipeStats(user=user, **stats.compute_for_user(user))
+
+
+class SyncView(UserShardMixin, APIView):
+    """Return what changed in the user's recipes, tags and ingredients.
+
+    Reads the change log after the given cursor (see recipe.sync), always
+    on the primary so a cursor never goes past what the client got.
+    """
+
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def _int_param(self, name, default):
+        value = self.request.query_params.get(name, default)
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({name: "Must be an integer."})
+        if value < 0:
+            raise serializers.ValidationError({name: "Must not be negative."})
+        return value
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "cursor",
+                OpenApiTypes.INT,
+                description="Cursor of the previous sync, 0 (default) for all",
+            ),
+            OpenApiParameter(
+                "limit",
+                OpenApiTypes.INT,
+                description="Changes per page, at most SYNC_PAGE_SIZE",
+            ),
+        ],
+        responses=inline_serializer(
+            "Sync",
+            {
+                "cursor": serializers.IntegerField(),
+                "has_more": serializers.BooleanField(),
+                "recipes": RecipeDetailsSerializer(many=True),
+                "tags": TagSerializer(many=True),
+                "ingredients": IngredientSerializer(many=True),
+                "deleted": inline_serializer(
+                    "SyncDeleted",
+                    {
+                        key: serializers.ListField(child=serializers.IntegerField())
+                        for key in ("recipes", "tags", "ingredients")
+                    },
+                ),
+            },
+        ),
+    )
+    def get(self, request):
+        cursor = self._int_param("cursor", 0)
+        limit = min(
+            self._int_param("limit", settings.SYNC_PAGE_SIZE) or 1,
+            settings.SYNC_PAGE_SIZE,
+        )
+        try:
+            upserts, deletes, cursor, has_more = sync.changes_since(
+                request.user, cursor, limit
+            )
+        except sync.CursorExpired:
+            return Response(
+                {"detail": "Cursor expired, sync again from cursor 0."},
+                status=status.HTTP_410_GONE,
+            )
+        return Response(
+            {
+                "cursor": cursor,
+                "has_more": has_more,
+                "recipes": RecipeDetailsSerializer(
+                    upserts["recipes"].prefetch_related("tags", "ingredients"),
+                    many=True,
+                    context={"request": request},
+                ).data,
+                "tags": TagSerializer(upserts["tags"], many=True).data,
+                "ingredients": IngredientSerializer(
+                    upserts["ingredients"], many=True
+                ).data,
+                "deleted": deletes,
+            }
+        )
@@ -3,8 +3,16 @@ from django.contrib.auth.admin import UserAdmin
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
 
-class CustomUserAdmin(UserAdmin):
-    """Define admin model for custom User model with no username field."""
+from core.admin import LargeTableAdmin
+
+from .tasks import schedule_account_deletion
+
+class CustomUserAdmin(LargeTableAdmin, UserAdmin):
+    """Define admin model for custom User model with no username field.
+
+    LargeTableAdmin gives it estimated counts, keyset pagination and
+    indexed searches, the filters are served by partial indexes.
+    """
 
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
@@ -22,10 +30,33 @@ class CustomUserAdmin(UserAdmin):
     )
 
     search_fields = ("email",)
+    prefix_search_field = "email"
+    search_help_text = "A user id, or the start of the email."
     list_filter = ("is_active", "is_staff")
-    ordering = ("-date_joined",)
+    # ids grow with date_joined, and keyset pagination needs the primary key
+    ordering = ("-id",)
     list_display = ("email", "is_active", "is_staff")
 
+    # deleting goes through user.tasks.schedule_account_deletion instead
+    # of a cascade that would load and delete all of a user's data at once
+
+    def get_deleted_objects(self, objs, request):
+        # the confirmation page lists the users only, not all their data
+        objs = list(objs)
+        return (
+            [f"{obj} (deactivated now, data purged in the background)" for obj in objs],
+            {self.model._meta.verbose_name_plural: len(objs)},
+            set(),
+            [],
+        )
+
+    def delete_model(self, request, obj):
+        schedule_account_deletion(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            schedule_account_deletion(user)
+
 
 admin.site.register(get_user_model(), CustomUserAdmin)
 # admin.site.register(CustomUser)
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+def token_expired(token, now=None):
+    """Return True if the token is older than TOKEN_TTL."""
+    now = now or timezone.now()
+    return token.created < now - settings.TOKEN_TTL
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication whose tokens expire after TOKEN_TTL.
+
+    With TOKEN_SLIDING enabled a token in use is renewed, at most once
+    per TOKEN_RENEW_INTERVAL so requests don't all turn into writes.
+    Token.created holds the time of the last renewal.
+    """
+
+    def authenticate_credentials(self, key):
+        user, token = super().authenticate_credentials(key)
+
+        now = timezone.now()
+        if token_expired(token, now):
+            raise exceptions.AuthenticationFailed(_("Token has expired."))
+
+        if (
+            settings.TOKEN_SLIDING
+            and token.created < now - settings.TOKEN_RENEW_INTERVAL
+        ):
+            # conditional update, concurrent requests renew the token once
+            self.get_model().objects.filter(
+                key=token.key, created=token.created
+            ).update(created=now)
+            token.created = now
+
+        return (user, token)
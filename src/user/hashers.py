@@ -0,0 +1,74 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2 with the work factor taken from settings.PBKDF2_ITERATIONS.
+
+    The algorithm name is unchanged, so existing hashes still verify and
+    are transparently rehashed on the next login when the count changes.
+    """
+
+    @property
+    def iterations(self):
+        return (
+            getattr(settings, "PBKDF2_ITERATIONS", None)
+            or hashers.PBKDF2PasswordHasher.iterations
+        )
+
+
+class HashingOverloaded(Exception):
+    """Raised when too many password hashes are already queued."""
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+def _get_executor():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            workers = settings.PASSWORD_HASHING_WORKERS
+            _executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="password-hasher"
+            )
+            # running + waiting jobs, anything beyond is rejected instead of
+            # piling up behind a signup spike
+            _slots = threading.BoundedSemaphore(
+                workers + settings.PASSWORD_HASHING_QUEUE_SIZE
+            )
+        return _executor
+
+
+async def _run(func, *args):
+    executor = _get_executor()
+    if not _slots.acquire(blocking=False):
+        raise HashingOverloaded()
+    try:
+        # hashlib releases the GIL while hashing, so the pool hashes in
+        # parallel without blocking the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args))
+    finally:
+        _slots.release()
+
+
+async def amake_password(password):
+    """Hash a password on the bounded hashing pool."""
+    return await _run(hashers.make_password, password)
+
+
+async def averify_password(password, encoded):
+    """Return (is_correct, must_update) computed on the bounded hashing pool.
+
+    must_update is True when the hash was made with another hasher or work
+    factor than the first entry of PASSWORD_HASHERS.
+    """
+    return await _run(hashers.verify_password, password, encoded)
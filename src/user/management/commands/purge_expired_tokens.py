@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from user import tasks
+from user.tokens import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete expired auth tokens in bounded batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Rows deleted per transaction, defaults to TOKEN_PURGE_BATCH_SIZE.",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Seconds to sleep between batches to let other writers in.",
+        )
+        parser.add_argument(
+            "--schedule",
+            action="store_true",
+            help=(
+                "Queue a job that purges every TOKEN_PURGE_INTERVAL seconds "
+                "on the workers instead of purging now."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["schedule"]:
+            job = tasks.schedule_token_purge()
+            self.stdout.write(
+                f"Token purge queued as job {job.pk}, repeating every "
+                f"{settings.TOKEN_PURGE_INTERVAL}s."
+            )
+            return
+
+        deleted, elapsed = purge_expired_tokens(
+            batch_size=options["batch_size"], pause=options["pause"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted} expired tokens in {elapsed:.3f}s")
+        )
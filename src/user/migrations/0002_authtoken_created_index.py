@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0001_initial"),
+        ("authtoken", "0004_alter_tokenproxy_options"),
+    ]
+
+    # authtoken.Token isn't ours to add Meta.indexes to, but expiry checks
+    # and the purge scan it by "created"
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX IF NOT EXISTS authtoken_token_created_idx "
+            "ON authtoken_token (created)",
+            reverse_sql="DROP INDEX IF EXISTS authtoken_token_created_idx",
+        ),
+    ]
@@ -45,6 +45,21 @@ class User(AbstractUser):
     REQUIRED_FIELDS = []
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        # the admin filters, partial so they only hold the rare rows
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_staff=True),
+                name="user_staff_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_active=False),
+                name="user_inactive_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.email
 
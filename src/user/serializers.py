@@ -4,6 +4,7 @@ from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.password_validation import validate_password
 
 from django.core import exceptions
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 
 User = get_user_model()
@@ -18,60 +19,59 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             "password": {"write_only": True},
             "style": {"input_type": "password"},
+            # no UniqueValidator, the unique constraint on email is checked
+            # by the insert itself instead of a separate exists() query
+            "email": {"validators": []},
         }
 
-    def save(self):
+    def validate(self, attrs):
 
-        # here, self.validated_data is a dictionary
+        # here, attrs is a dictionary of the validated fields
 
-        password = self.validated_data["password"]
+        password = attrs["password"]
 
         # serializers.ModelSerializer doesn't render password2 field for User model on its own
         # unlike Django modelForm we have to provide an extra field for password2
         # so we have to add a password2 field in the serializer
         # since UserSerializer doesn't recognize password2 field as a User Model field
-        # we need to pop or remove it from the self.validated_data
+        # we need to pop or remove it from attrs
         # otherwise serializer will raise an error which simply means
         # password2 is not UserSerializer field
-        password2 = self.validated_data.pop("password2")
+        password2 = attrs.pop("password2")
 
         if password != password2:
             raise serializers.ValidationError({"error": "P1 and P2 should be same!"})
 
-        if User.objects.filter(email=self.validated_data["email"]).exists():
-            raise serializers.ValidationError({"error": "Email already exists!"})
-
-        # in serializers we cannot user model.save(commit=False)
-        # but we can use account = self.validated_data
-        # which creates a User instance but doesn't save on the database
-        # In other words its equivalent to model.save(commit=False)
-        account = self.validated_data
-        account = User(account)
-        errors = {}
+        # this is the instance that gets inserted in create()
+        # validate_password needs it to compare the password with the email
+        self.account = User(email=attrs["email"])
         try:
             # validate the password and catch the exception
-            validate_password(password=password, user=account)
+            validate_password(password=password, user=self.account)
 
         # the exception raised here is different than serializers.ValidationError
         except exceptions.ValidationError as e:
-            errors["password"] = list(e.messages)
-
-        if errors:
-            raise serializers.ValidationError(errors)
-
-        # we can't use the following expression
-        # account = self.validated_data
-        # account = User(account)
-        # If we try the above expression it will raise an error
-        # and also it will not create any instance in the database
-        # In order to create an User instance in the database
-        # we need to use the following expression
-        account = User(email=self.validated_data["email"])
-        account.set_password(password)
-        account.save()
+            raise serializers.ValidationError({"password": list(e.messages)})
 
-        return account
+        return attrs
+
+    def create(self, validated_data):
+        """Insert the user, password_hash can be passed in already computed."""
+        account = self.account
+        password_hash = validated_data.get("password_hash")
+        if password_hash:
+            account.password = password_hash
+        else:
+            account.set_password(validated_data["password"])
 
+        try:
+            # savepoint, so a duplicate email doesn't break an outer transaction
+            with transaction.atomic():
+                account.save(force_insert=True)
+        except IntegrityError:
+            raise serializers.ValidationError({"error": "Email already exists!"})
+
+        return account
 
 
 # class AuthTokenSerializer(serializers.Serializer):
@@ -105,4 +105,4 @@ class UserSerializer(serializers.ModelSerializer):
 #         #     raise e from e
 
 #         attrs["user"] = user
-#         return attrs
\ No newline at end of file
+#         return attrs
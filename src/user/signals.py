@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# Sent by the delete_account job (user.tasks) before the user row is
+# deleted, with user_id and progress, a callable taking the counts of rows
+# deleted so far as keyword arguments. Receivers delete the user's data
+# in small batches, so the final delete has nothing left to cascade to.
+purge_user_data = Signal()
@@ -0,0 +1,75 @@
+"""Background jobs of the user app, run by "manage.py worker"."""
+
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from core import jobs
+from core.models import Job
+
+from .signals import purge_user_data
+from .tokens import purge_expired_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def schedule_account_deletion(user):
+    """Deactivate a user now and delete their data in the background.
+
+    The user can no longer log in or use their tokens from here on,
+    their data is purged in batches by the delete_account job. Deleting
+    again while that job is pending returns it. A finished one, which may
+    have found the user reactivated, doesn't keep a new one from running.
+    """
+    User = get_user_model()
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        Token.objects.filter(user_id=user.pk).delete()
+        pending = Job.objects.filter(
+            name=delete_account.name,
+            status__in=[Job.QUEUED, Job.RUNNING],
+            kwargs__user_id=user.pk,
+        ).first()
+        job = pending or delete_account.enqueue({"user_id": user.pk})
+    user.is_active = False
+    return job
+
+
+@jobs.task(lease=3600)
+def delete_account(user_id):
+    """Purge a deactivated user's data in batches, then delete the user."""
+    User = get_user_model()
+    if not User.objects.filter(pk=user_id, is_active=False).exists():
+        # deleted already, or reactivated since, which cancels the deletion
+        logger.info("Not deleting user %s, gone or active again", user_id)
+        return
+
+    purge_user_data.send(sender=User, user_id=user_id, progress=jobs.report_progress)
+    # only the user's own rows (tokens, admin log entries) are left
+    User.objects.filter(pk=user_id, is_active=False).delete()
+    logger.info("Deleted user %s", user_id)
+
+
+@jobs.task(lease=3600)
+def purge_tokens(repeat=False):
+    """Delete expired auth tokens in batches, see user.tokens.
+
+    With repeat the next run is queued TOKEN_PURGE_INTERVAL seconds later.
+    """
+    deleted, _ = purge_expired_tokens()
+    jobs.report_progress(deleted=deleted)
+    if repeat and settings.TOKEN_PURGE_INTERVAL:
+        purge_tokens.enqueue({"repeat": True}, delay=settings.TOKEN_PURGE_INTERVAL)
+
+
+def schedule_token_purge():
+    """Start the recurring purge, unless a run of it is pending already."""
+    pending = Job.objects.filter(
+        name=purge_tokens.name,
+        status__in=[Job.QUEUED, Job.RUNNING],
+        kwargs__repeat=True,
+    ).first()
+    return pending or purge_tokens.enqueue({"repeat": True})
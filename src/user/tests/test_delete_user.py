@@ -0,0 +1,135 @@
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.jobs import Worker
+from core.models import Job
+from recipe.models import Ingredient, Recipe, RecipeStats, Tag
+from recipe.purge import purge_user_data
+
+DELETE_USER_API = reverse("delete_user")
+
+
+def create_user(email="user@example.com"):
+    return get_user_model().objects.create_user(email=email, password="pw123456")
+
+
+def create_recipes(user, count):
+    tag = Tag.objects.create(user=user, title="Tag")
+    ingredient = Ingredient.objects.create(user=user, name="Ingredient")
+    for i in range(count):
+        recipe = Recipe.objects.create(
+            user=user, title=f"Recipe {i}", time_minutes=5, price="1.00"
+        )
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+    RecipeStats.objects.create(user=user, recipe_count=count)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DeleteUserTests(TestCase):
+    """Test deleting accounts in the background"""
+
+    def setUp(self):
+        self.user = create_user()
+        self.other = create_user("other@example.com")
+        create_recipes(self.user, 5)
+        create_recipes(self.other, 2)
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_delete_user(self):
+        recipe = Recipe.objects.filter(user=self.user).first()
+        recipe.image = SimpleUploadedFile("a.jpg", b"image", "image/jpeg")
+        recipe.save()
+        path = recipe.image.path
+
+        response = self.client.delete(DELETE_USER_API)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        # nothing is deleted until the job runs
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 5)
+
+        with self.settings(ACCOUNT_PURGE_BATCH_SIZE=2):
+            Worker().run(burst=True)
+
+        self.assertFalse(get_user_model().objects.filter(pk=self.user.pk).exists())
+        for model in (Recipe, Tag, Ingredient, RecipeStats):
+            self.assertFalse(model.objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(Recipe.objects.filter(user=self.other).count(), 2)
+        self.assertEqual(Recipe.tags.through.objects.count(), 2)
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.progress["recipes"], 5)
+        self.assertEqual(job.progress["links"], 10)
+
+    def test_purge_in_batches(self):
+        reports = []
+
+        totals = purge_user_data(
+            self.user.pk, batch_size=2, progress=lambda **t: reports.append(t)
+        )
+
+        self.assertEqual(totals["recipes"], 5)
+        self.assertEqual(totals["tags"], 1)
+        self.assertEqual(totals["ingredients"], 1)
+        # three batches of recipes, then one of tags and of ingredients
+        self.assertEqual([report["recipes"] for report in reports], [2, 4, 5, 5, 5])
+
+    def test_reactivated_user_kept(self):
+        self.client.delete(DELETE_USER_API)
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=True)
+
+        Worker().run(burst=True)
+
+        self.assertTrue(get_user_model().objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 5)
+
+    def test_delete_again_after_reactivation(self):
+        self.client.delete(DELETE_USER_API)
+        # a second delete while the job is pending reuses it
+        self.client.delete(DELETE_USER_API)
+        self.assertEqual(Job.objects.count(), 1)
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=True)
+        Worker().run(burst=True)
+
+        self.client.force_authenticate(self.user)
+        response = self.client.delete(DELETE_USER_API)
+        Worker().run(burst=True)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(get_user_model().objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(Recipe.objects.filter(user_id=self.user.pk).count(), 0)
+
+    def test_delete_requires_authentication(self):
+        response = APIClient().delete(DELETE_USER_API)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_admin_delete_schedules_deletion(self):
+        admin = get_user_model().objects.create_superuser(
+            email="admin@example.com", password="pw123456"
+        )
+        self.client.force_login(admin)
+        url = reverse("admin:user_user_delete", args=[self.user.pk])
+
+        response = self.client.post(url, {"post": "yes"})
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(Job.objects.get().name, "user.tasks.delete_account")
@@ -0,0 +1,59 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core import schema
+
+LOGIN_API = reverse("login")
+
+
+@override_settings(PBKDF2_ITERATIONS=1000)
+class LoginApiTests(TestCase):
+    """Test the async token login endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="testpassword123"
+        )
+
+    def test_login_returns_token(self):
+        payload = {"username": "test@example.com", "password": "testpassword123"}
+        response = self.client.post(LOGIN_API, payload)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["token"], self.user.auth_token.key)
+
+    def test_login_bad_credentials(self):
+        for payload in (
+            {"username": "test@example.com", "password": "wrong"},
+            {"username": "nobody@example.com", "password": "testpassword123"},
+            {"username": "test@example.com"},
+        ):
+            response = self.client.post(LOGIN_API, payload, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertNotIn("token", response.data)
+
+    def test_login_rehashes_outdated_password(self):
+        with override_settings(PBKDF2_ITERATIONS=2000):
+            payload = {"username": "test@example.com", "password": "testpassword123"}
+            response = self.client.post(LOGIN_API, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password.split("$")[1], "2000")
+
+    def test_login_and_signup_in_schema(self):
+        paths = schema.generate()["paths"]
+
+        login = paths["/api/user/login"]["post"]
+        self.assertEqual(
+            login["requestBody"]["content"]["application/json"]["schema"]["$ref"],
+            "#/components/schemas/AuthTokenRequest",
+        )
+        self.assertEqual(set(login["responses"]), {"200", "503"})
+        self.assertNotIn("security", login)
+        signup = paths["/api/user/create-user"]["post"]
+        self.assertEqual(set(signup["responses"]), {"201", "503"})
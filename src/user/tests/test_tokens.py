@@ -0,0 +1,81 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.jobs import Worker
+from core.models import Job
+
+TAG_URL = reverse("recipe:tag-list")
+
+
+def create_user(email="test@example.com"):
+    return get_user_model().objects.create_user(email=email, password="pw123456")
+
+
+def age_token(token, **delta):
+    Token.objects.filter(key=token.key).update(
+        created=timezone.now() - timedelta(**delta)
+    )
+
+
+@override_settings(TOKEN_TTL=timedelta(days=1), TOKEN_RENEW_INTERVAL=timedelta(hours=1))
+class ExpiringTokenTests(TestCase):
+    """Test token expiry, renewal and purging"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.token = Token.objects.create(user=create_user())
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_expired_token_rejected(self):
+        age_token(self.token, days=2)
+        response = self.client.get(TAG_URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_sliding_renewal(self):
+        age_token(self.token, hours=20)
+        response = self.client.get(TAG_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.token.refresh_from_db()
+        self.assertGreater(self.token.created, timezone.now() - timedelta(minutes=1))
+
+    @override_settings(TOKEN_SLIDING=False)
+    def test_no_renewal_without_sliding(self):
+        age_token(self.token, hours=20)
+        self.client.get(TAG_URL)
+        self.token.refresh_from_db()
+        self.assertLess(self.token.created, timezone.now() - timedelta(hours=19))
+
+    def test_purge_expired_tokens_in_batches(self):
+        for i in range(5):
+            token = Token.objects.create(user=create_user(f"user{i}@example.com"))
+            age_token(token, days=3)
+
+        out = StringIO()
+        call_command("purge_expired_tokens", "--batch-size", "2", stdout=out)
+        self.assertIn("Deleted 5 expired tokens", out.getvalue())
+        self.assertEqual(list(Token.objects.all()), [self.token])
+
+    def test_scheduled_purge(self):
+        token = Token.objects.create(user=create_user("old@example.com"))
+        age_token(token, days=3)
+
+        call_command("purge_expired_tokens", "--schedule", stdout=StringIO())
+        call_command("purge_expired_tokens", "--schedule", stdout=StringIO())
+        self.assertEqual(Job.objects.count(), 1)
+        Worker().run_one()
+
+        self.assertEqual(list(Token.objects.all()), [self.token])
+        job = Job.objects.get(status=Job.SUCCEEDED)
+        self.assertEqual(job.progress, {"deleted": 1})
+        # the next run is queued
+        self.assertTrue(Job.objects.filter(status=Job.QUEUED).exists())
@@ -6,6 +6,8 @@ from rest_framework.authtoken.views import obtain_auth_token
 urlpatterns = [
     path('create-user', views.CreateUserView.as_view(), name='create_user'),
     # path('login', views.CreateTokenView.as_view(), name='login'),
-    path('login', obtain_auth_token, name='login'),
+    # path('login', obtain_auth_token, name='login'),
+    path('login', views.LoginView.as_view(), name='login'),
     path('logout', views.logout_user, name='logout'),
+    path('delete-user', views.delete_user, name='delete_user'),
 ]
\ No newline at end of file
@@ -1,19 +1,150 @@
-from rest_framework import generics
-from rest_framework.response import Response
-from rest_framework import status
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
 from django.contrib.auth import logout
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.response import Response
+from rest_framework import serializers, status
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.renderers import JSONRenderer
 from rest_framework.settings import api_settings
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from drf_spectacular.utils import extend_schema
+
+from core import idempotency
 
+from .authentication import token_expired
+from .hashers import HashingOverloaded, amake_password, averify_password
 from .serializers import UserSerializer
+from .tasks import schedule_account_deletion
 
 # Create your views here.
 
+User = get_user_model()
+
+
+def _request_data(request):
+    """Return the submitted data of a JSON or form encoded request."""
+    if request.content_type == "application/json":
+        try:
+            return json.loads(request.body or b"{}")
+        except ValueError:
+            return None
+    return request.POST
+
+
+def _json_response(data, status=status.HTTP_200_OK):
+    """Build a DRF Response outside of an APIView (which can't be async)."""
+    response = Response(data, status=status)
+    response.accepted_renderer = JSONRenderer()
+    response.accepted_media_type = "application/json"
+    response.renderer_context = {}
+    return response
+
+
+def _overloaded_response():
+    response = _json_response(
+        {"error": "Too many requests, please retry shortly."},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response["Retry-After"] = "1"
+    return response
+
+
+# These two views are async so that, under ASGI, password hashing runs
+# on the bounded pool in user.hashers instead of pinning a worker thread
+@method_decorator(csrf_exempt, name="dispatch")
+class CreateUserView(View):
+    """Register a user with a single insert and off-thread hashing."""
+
+    async def post(self, request):
+        # there is no user yet to scope keys by, so the scope is the request
+        # itself: two signups picking the same key never see each other's
+        # response, and only a retry with the same body, password included,
+        # gets the first one replayed
+        scope = f"create-user:{idempotency.request_hash(request)[:40]}"
+        return await idempotency.aexecute(
+            request, scope, lambda: self._create(request), _json_response
+        )
+
+    async def _create(self, request):
+        data = _request_data(request)
+        if data is None:
+            return _json_response(
+                {"error": "Invalid JSON."}, status=status.HTTP_400_BAD_REQUEST
+            )
 
-class CreateUserView(generics.CreateAPIView):
-    serializer_class = UserSerializer
+        serializer = UserSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return _json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            password_hash = await amake_password(serializer.validated_data["password"])
+        except HashingOverloaded:
+            return _overloaded_response()
+
+        try:
+            await sync_to_async(serializer.save)(password_hash=password_hash)
+        except serializers.ValidationError as e:
+            return _json_response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+        return _json_response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class LoginView(View):
+    """Drop-in replacement for obtain_auth_token with off-thread hashing.
+
+    Accepts the same "username" and "password" fields and returns the same
+    token and errors. A password hashed with an outdated hasher or work
+    factor is transparently rehashed with the preferred one.
+    """
+
+    async def post(self, request):
+        data = _request_data(request) or {}
+        username = data.get("username") or data.get("email")
+        password = data.get("password")
+        if not username or not password:
+            return _json_response(
+                {"non_field_errors": ['Must include "username" and "password".']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            user = await User.objects.aget(email=username)
+        except User.DoesNotExist:
+            user = None
+
+        try:
+            # for unknown users this still hashes once (on an unusable
+            # password), so response times don't reveal which emails exist
+            is_correct, must_update = await averify_password(
+                password, user.password if user else UNUSABLE_PASSWORD_PREFIX
+            )
+            if is_correct and must_update:
+                user.password = await amake_password(password)
+                await user.asave(update_fields=["password"])
+        except HashingOverloaded:
+            return _overloaded_response()
+
+        if not is_correct or not user.is_active:
+            return _json_response(
+                {"non_field_errors": ["Unable to log in with provided credentials."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        token, created = await Token.objects.aget_or_create(user=user)
+        if token_expired(token):
+            # hand out a fresh token instead of the expired one
+            await token.adelete()
+            token = await Token.objects.acreate(user=user)
+        return _json_response({"token": token.key})
 
 
 # class CreateTokenView(ObtainAuthToken):
@@ -35,3 +166,14 @@ def logout_user(request):
         request.user.auth_token.delete()
         # logout(request)
         return Response(status=status.HTTP_200_OK)
+
+
+@extend_schema(request=None, responses={202: None})
+@api_view(["DELETE"])
+@permission_classes([IsAuthenticated])
+def delete_user(request):
+    """Delete the account: deactivated now, its data purged in the background."""
+    schedule_account_deletion(request.user)
+    return Response(
+        {"detail": "Account deletion scheduled."}, status=status.HTTP_202_ACCEPTED
+    )